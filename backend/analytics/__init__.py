@@ -0,0 +1,7 @@
+"""
+Offline analytics over interactions.log and the voice_queries table.
+
+Streams both sources, clusters transcripts by embedding, writes columnar
+rollups (top questions, intents, fallback rates, latency) and the warm-up
+set workers load at start. Entry point: `python -m analytics.job --help`.
+"""
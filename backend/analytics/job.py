@@ -0,0 +1,381 @@
+# analytics/job.py
+# Offline rollups over interactions.log and the voice_queries table, plus the
+# warm-up set the workers load at start (app/services/answer_cache.py).
+# Usage (from backend/):
+#   python -m analytics.job --log interactions.log --out analytics_out --warmup-dir warmup
+#   python -m analytics.job --no-db --top 500 --cluster-sim 0.85
+#
+# Both sources are streamed (line by line / server-side cursor); memory is
+# bounded by --max-unique distinct transcripts and fixed-size latency samples.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import sqlalchemy as sa
+
+from app.config import Config
+from app.services.rag import normalise_transcript, index_fingerprint, combined_fingerprint, discover_collections
+from app.services.pipeline import is_fallback_reply
+
+# Parquet when pyarrow is installed, CSV otherwise
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except Exception:
+    pa = pq = None
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger("voicebot.analytics")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# Replies that depend on who asked; never part of the warm-up answers
+_PERSONAL_INTENTS = {"order_tracking", "auth_required"}
+
+
+# ---------- Sources ----------
+
+def _json(value) -> Any:
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+    return value
+
+
+def iter_log(path: Path) -> Iterator[Dict[str, Any]]:
+    """interactions.log records (one JSON object per line), read lazily."""
+    with open(path, "r", encoding="utf8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            yield {
+                "transcript": rec.get("transcript"),
+                "intent": rec.get("intent"),
+                "reply": rec.get("reply"),
+                # The log predates model_text, so its answers are not trusted for warm-up
+                "model_text": None,
+                "sources": rec.get("sources") or [],
+                "model_ms": None,
+                "duration_ms": rec.get("duration_ms"),
+                "ts": rec.get("ts"),
+            }
+
+
+def iter_voice_queries(engine, since_ts: Optional[float] = None, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """voice_queries rows through a server-side cursor, `batch_size` rows at a time."""
+    sql = "SELECT transcript, intent, response, rag_sources, duration_ms, created_at FROM voice_queries"
+    params = {}
+    if since_ts:
+        sql += " WHERE created_at >= :since"
+        params["since"] = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(since_ts))
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(sa.text(sql), params)
+        for part in result.partitions(batch_size):
+            for transcript, intent, response, rag_sources, duration_ms, created_at in part:
+                response = _json(response) or {}
+                yield {
+                    "transcript": transcript,
+                    "intent": intent,
+                    "reply": response.get("reply"),
+                    "model_text": response.get("model_text"),
+                    "sources": _json(rag_sources) or [],
+                    "model_ms": response.get("model_ms"),
+                    "duration_ms": duration_ms,
+                    "ts": response.get("ts") or (created_at.timestamp() if hasattr(created_at, "timestamp") else None),
+                }
+
+
+# ---------- Streaming aggregation ----------
+
+class Reservoir:
+    """Fixed-size uniform sample (Algorithm R) for latency percentiles."""
+
+    def __init__(self, size: int, rng: random.Random):
+        self.size = size
+        self.rng = rng
+        self.seen = 0
+        self.total = 0.0
+        self.values: List[float] = []
+
+    def add(self, value: float):
+        self.seen += 1
+        self.total += value
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            j = self.rng.randrange(self.seen)
+            if j < self.size:
+                self.values[j] = value
+
+    def summary(self) -> Dict[str, float]:
+        s = sorted(self.values)
+
+        def q(p):
+            return s[min(len(s) - 1, int(round(p * (len(s) - 1))))] if s else 0.0
+        return {"count": self.seen, "mean": round(self.total / self.seen, 1) if self.seen else 0.0,
+                "p50": q(0.5), "p95": q(0.95), "p99": q(0.99)}
+
+
+class Rollup:
+    def __init__(self, max_unique: int, answer_max_age_s: float, sample_size: int = 10000, seed: int = 0):
+        self.max_unique = max_unique
+        self.answer_min_ts = time.time() - answer_max_age_s
+        rng = random.Random(seed)
+        self.questions: Dict[str, Dict[str, Any]] = {}
+        self.intents: Dict[str, List[int]] = {}
+        self.latency = {"llm": Reservoir(sample_size, rng), "audio": Reservoir(sample_size, rng)}
+        self.records = 0
+        self.pruned = 0
+
+    def add(self, rec: Dict[str, Any]):
+        key = normalise_transcript(rec.get("transcript") or "")
+        if not key:
+            return
+        self.records += 1
+        intent = rec.get("intent") or "unknown"
+        # Only open questions go to the RAG + LLM path; canned rule and
+        # order replies are not fallbacks.
+        fallback = intent == "open_question" and (
+            not rec.get("model_text") if rec.get("model_ms") is not None else is_fallback_reply(rec.get("reply")))
+
+        stat = self.intents.setdefault(intent, [0, 0])
+        stat[0] += 1
+        stat[1] += int(fallback)
+        if rec.get("model_ms") is not None:
+            self.latency["llm"].add(float(rec["model_ms"]))
+        if rec.get("duration_ms") is not None:
+            self.latency["audio"].add(float(rec["duration_ms"]))
+
+        q = self.questions.get(key)
+        if q is None:
+            if len(self.questions) >= 2 * self.max_unique:
+                self._prune()
+            q = self.questions[key] = {"text": rec["transcript"].strip(), "count": 0, "fallbacks": 0,
+                                       "intents": Counter(), "answer": None}
+        q["count"] += 1
+        q["fallbacks"] += int(fallback)
+        q["intents"][intent] += 1
+
+        ts = rec.get("ts") or 0
+        if (intent == "open_question" and rec.get("model_text") and not fallback and ts >= self.answer_min_ts
+                and (q["answer"] is None or ts >= q["answer"]["ts"])):
+            q["answer"] = {"reply": rec["reply"], "model_text": rec["model_text"],
+                           "sources": [{"id": s.get("id"), "source": s.get("source"), "score": s.get("score"),
+                                        "collection": s.get("collection")}
+                                       for s in rec.get("sources") or [] if isinstance(s, dict)],
+                           "ts": ts}
+
+    def _prune(self):
+        """Keep the max_unique most frequent transcripts (bounded memory on long logs)."""
+        keep = sorted(self.questions.items(), key=lambda kv: kv[1]["count"], reverse=True)[:self.max_unique]
+        self.pruned += len(self.questions) - len(keep)
+        self.questions = dict(keep)
+
+    def top(self, n: int) -> List[Dict[str, Any]]:
+        ranked = sorted(self.questions.items(), key=lambda kv: kv[1]["count"], reverse=True)[:n]
+        return [{"key": k, **v} for k, v in ranked]
+
+
+# ---------- Clustering ----------
+
+def embed_texts(texts: List[str], model_name: str, batch_size: int = 64) -> np.ndarray:
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+    emb = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+    return emb.astype("float32")
+
+
+def cluster(embeddings: np.ndarray, threshold: float) -> List[int]:
+    """
+    Greedy leader clustering in input (frequency) order: a transcript joins
+    the most similar existing cluster at cosine >= threshold, else starts one
+    with itself as representative.
+    """
+    labels: List[int] = []
+    leaders: List[np.ndarray] = []
+    for vec in embeddings:
+        if leaders:
+            sims = np.stack(leaders) @ vec
+            best = int(np.argmax(sims))
+            if sims[best] >= threshold:
+                labels.append(best)
+                continue
+        leaders.append(vec)
+        labels.append(len(leaders) - 1)
+    return labels
+
+
+# ---------- Output ----------
+
+def write_table(out_dir: Path, name: str, columns: Dict[str, list]) -> str:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if PYARROW_AVAILABLE:
+        path = out_dir / f"{name}.parquet"
+        pq.write_table(pa.table(columns), path, compression="zstd")
+    else:
+        import csv
+        path = out_dir / f"{name}.csv"
+        names = list(columns)
+        with open(path, "w", encoding="utf8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(names)
+            w.writerows(zip(*(columns[c] for c in names)))
+    return str(path)
+
+
+def build_outputs(rollup: Rollup, top: List[Dict[str, Any]], embeddings: np.ndarray, labels: List[int],
+                  out_dir: Path) -> Dict[str, str]:
+    clusters: Dict[int, Dict[str, Any]] = {}
+    for q, label in zip(top, labels):
+        c = clusters.setdefault(label, {"representative": q["text"], "count": 0, "fallbacks": 0,
+                                        "variants": 0, "intents": Counter()})
+        c["count"] += q["count"]
+        c["fallbacks"] += q["fallbacks"]
+        c["variants"] += 1
+        c["intents"].update(q["intents"])
+    ranked = sorted(clusters.items(), key=lambda kv: kv[1]["count"], reverse=True)
+
+    paths = {}
+    paths["top_questions"] = write_table(out_dir, "top_questions", {
+        "cluster_id": [k for k, _ in ranked],
+        "representative": [c["representative"] for _, c in ranked],
+        "count": [c["count"] for _, c in ranked],
+        "variants": [c["variants"] for _, c in ranked],
+        "top_intent": [c["intents"].most_common(1)[0][0] for _, c in ranked],
+        "fallback_rate": [round(c["fallbacks"] / c["count"], 4) for _, c in ranked],
+    })
+    paths["questions"] = write_table(out_dir, "questions", {
+        "text": [q["text"] for q in top],
+        "normalised": [q["key"] for q in top],
+        "cluster_id": labels,
+        "count": [q["count"] for q in top],
+        "top_intent": [q["intents"].most_common(1)[0][0] for q in top],
+        "fallbacks": [q["fallbacks"] for q in top],
+    })
+    intents = sorted(rollup.intents.items(), key=lambda kv: kv[1][0], reverse=True)
+    paths["intents"] = write_table(out_dir, "intents", {
+        "intent": [k for k, _ in intents],
+        "count": [v[0] for _, v in intents],
+        "fallbacks": [v[1] for _, v in intents],
+        "fallback_rate": [round(v[1] / v[0], 4) if v[0] else 0.0 for _, v in intents],
+    })
+    # Per-stage timings are only persisted for the LLM call (response.model_ms)
+    # and the utterance itself (duration_ms); live p50/p95/p99 for every stage
+    # are on /metrics.
+    stages = [(name, r.summary()) for name, r in rollup.latency.items() if r.seen]
+    paths["latency"] = write_table(out_dir, "latency", {
+        "stage": [s for s, _ in stages],
+        **{k: [summary[k] for _, summary in stages] for k in ("count", "mean", "p50", "p95", "p99")},
+    })
+    return paths
+
+
+def write_warmup(top: List[Dict[str, Any]], embeddings: np.ndarray, warmup_dir: Path,
+                 max_answers: int, min_count: int) -> Dict[str, int]:
+    """
+    embeddings.npz: the most frequent transcripts and their embeddings.
+    warmup.json: manifest plus answers to frequent context-free open questions,
+    stamped with the embedding model and the current index build.
+    """
+    warmup_dir.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(warmup_dir / "embeddings.npz",
+                        texts=np.array([q["text"] for q in top]), embeddings=embeddings)
+    answers = [
+        {"text": q["text"], "count": q["count"], **{k: q["answer"][k] for k in ("reply", "model_text", "sources")}}
+        for q in top
+        if q["answer"] and q["count"] >= min_count and not (set(q["intents"]) & _PERSONAL_INTENTS)
+    ][:max_answers]
+    manifest = {
+        "created_at": int(time.time()),
+        "embed_model": Config.EMBED_MODEL_NAME,
+        "index_fingerprint": combined_fingerprint({
+            name: index_fingerprint(meta) for name, (_, meta) in discover_collections(str(BACKEND_DIR)).items()
+        }),
+        "embeddings": len(top),
+        "answers": answers,
+    }
+    tmp = warmup_dir / "warmup.json.tmp"
+    with open(tmp, "w", encoding="utf8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, warmup_dir / "warmup.json")
+    return {"embeddings": len(top), "answers": len(answers)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Roll up interaction logs and build the cache warm-up set.")
+    parser.add_argument("--log", default=str(BACKEND_DIR / Config.LOGFILE), help="interactions.log-style JSONL")
+    parser.add_argument("--database-url", default=Config.DATABASE_URL or None)
+    parser.add_argument("--no-db", action="store_true", help="skip the voice_queries table")
+    parser.add_argument("--since-days", type=float, default=None, help="only voice_queries newer than this")
+    parser.add_argument("--max-unique", type=int, default=200000, help="distinct transcripts kept in memory")
+    parser.add_argument("--top", type=int, default=2000, help="most frequent transcripts to cluster and warm")
+    parser.add_argument("--cluster-sim", type=float, default=0.85)
+    parser.add_argument("--warmup-answers", type=int, default=1000)
+    parser.add_argument("--min-count", type=int, default=2, help="min occurrences for a warm-up answer")
+    parser.add_argument("--answer-max-age-days", type=float, default=7.0)
+    parser.add_argument("--out", default=str(BACKEND_DIR / "analytics_out"))
+    parser.add_argument("--warmup-dir", default=str(BACKEND_DIR / Config.WARMUP_DIR))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    rollup = Rollup(args.max_unique, args.answer_max_age_days * 86400)
+    started = time.time()
+    if os.path.exists(args.log):
+        for rec in iter_log(Path(args.log)):
+            rollup.add(rec)
+        logger.info("Read %s (%d records so far)", args.log, rollup.records)
+    else:
+        logger.warning("No interaction log at %s", args.log)
+
+    if not args.no_db and args.database_url:
+        engine = sa.create_engine(args.database_url, pool_pre_ping=True)
+        since = time.time() - args.since_days * 86400 if args.since_days else None
+        try:
+            for rec in iter_voice_queries(engine, since):
+                rollup.add(rec)
+        finally:
+            engine.dispose()
+        logger.info("Read voice_queries (%d records total)", rollup.records)
+    elif not args.no_db:
+        logger.warning("DATABASE_URL not set; voice_queries skipped (use --database-url or --no-db)")
+
+    top = rollup.top(args.top)
+    if not top:
+        logger.error("No transcripts found; nothing to write.")
+        sys.exit(1)
+    embeddings = embed_texts([q["text"] for q in top], Config.EMBED_MODEL_NAME)
+    labels = cluster(embeddings, args.cluster_sim)
+
+    paths = build_outputs(rollup, top, embeddings, labels, Path(args.out))
+    warm = write_warmup(top, embeddings, Path(args.warmup_dir), args.warmup_answers, args.min_count)
+    summary = {
+        "records": rollup.records,
+        "distinct_transcripts": len(rollup.questions),
+        "pruned_transcripts": rollup.pruned,
+        "clusters": len(set(labels)),
+        "tables": paths,
+        "warmup": {"dir": args.warmup_dir, **warm},
+        "elapsed_s": round(time.time() - started, 2),
+    }
+    with open(Path(args.out) / "summary.json", "w", encoding="utf8") as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,31 +7,68 @@ load_dotenv()
 
 from app.config import Config
 from app.core.database import init_db, create_tables
+from app.core.migrations import run_migrations
 from app.core.auth import init_auth
+from app.core.metrics import init_metrics
+from app.core.profiler import init_profiler
+from app.core.admission import init_admission
 from app.services.rag import init_rag
+from app.services.rerank import init_reranker
 from app.services.llm import init_llm
+from app.services.order_cache import init_order_cache
+from app.services.asr import init_asr
+from app.services.answer_cache import init_answer_cache
 from app.api.routes import api_bp
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("voicebot")
 
-def create_app(config_class=Config):
-    app = Flask(__name__)
-    app.config.from_object(config_class)
-    
-    CORS(app)
-
+def init_services(asr: bool = True):
+    """
+    Core + services shared by the Flask app and the ASGI app. `asr=False`
+    skips the speech-to-text model, for apps that do not serve /query/audio.
+    """
     # Initialize Core
     init_db()
     create_tables()
+    run_migrations()
     init_auth()
+    init_admission()
 
     # Initialize Services
     init_rag()
+    init_reranker()
     init_llm()
+    init_order_cache()
+    init_answer_cache()
+    if asr:
+        init_asr()
+
+
+def create_app(config_class=Config):
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    
+    CORS(app)
+    init_metrics(app)
+    init_profiler(app)
+
+    init_services()
 
     # Register Blueprints
     app.register_blueprint(api_bp)
 
     return app
+
+
+def create_asgi_app():
+    """
+    Async serving mode (uvicorn asgi:app): /query, /history and /auth/sync
+    on Starlette, with asyncpg and the asyncio Gemini client.
+    """
+    from app.api.async_routes import build_asgi_app
+
+    # Streamed audio stays on the Flask app; no Whisper model here
+    init_services(asr=False)
+    return build_asgi_app()
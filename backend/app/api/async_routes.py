@@ -0,0 +1,335 @@
+import time
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import wraps
+from typing import Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from app.config import Config
+from app.core import async_database
+from app.core.auth import verify_token
+from app.core.metrics import timed, inc, record_stage, render_prometheus, server_timing_header, start_request_timings
+from app.core.admission import Overloaded, shed
+from app.services import rag
+from app.services.rerank import retrieve_ranked
+from app.services.nlu import classify_intent_hf
+from app.services.pipeline import order_reply, arag_reply, public_sources, top_chunk_reply, ERROR_REPLY
+from app.services.session_context import get_session, retrieve_for_turn, record_turn, history_for_prompt
+from app.services.answer_cache import get_answer, store_answer
+
+logger = logging.getLogger("voicebot")
+
+# Async serving mode: the /query, /history and /auth/sync contracts of
+# app.api.routes on an event loop. Waiting on Gemini and Postgres holds no
+# thread; the CPU-bound steps (token verify, NLU, embedding + FAISS, and the
+# session / order cache misses that still read through the sync engine) run
+# on a bounded pool. That pool and the LLM semaphore take the place of the
+# per-stage admission gates, which block threads.
+
+_cpu_pool: Optional[ThreadPoolExecutor] = None
+_llm_slots: Optional[asyncio.Semaphore] = None
+
+_PREFLIGHT_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,Authorization",
+    "Access-Control-Allow-Methods": "GET,PUT,POST,DELETE,OPTIONS",
+}
+
+
+# ---------- Executor / LLM slots ----------
+
+def _ensure_runtime():
+    """
+    Create the CPU pool, LLM slots and async engine on first use. _lifespan
+    does this at startup; doing it here as well keeps `--lifespan off`
+    (and servers without lifespan support) working.
+    """
+    global _cpu_pool, _llm_slots
+    if _cpu_pool is None:
+        _cpu_pool = ThreadPoolExecutor(max_workers=Config.ASGI_CPU_WORKERS, thread_name_prefix="asgi-cpu")
+    if _llm_slots is None:
+        _llm_slots = asyncio.Semaphore(Config.ASGI_LLM_CONCURRENCY)
+    async_database.init_async_db()
+
+
+async def _cpu(fn, *args, stage: Optional[str] = None, **kwargs):
+    """Run fn on the bounded CPU pool in this request's context (stage timings); `stage` times the call itself."""
+    submitted = time.perf_counter()
+
+    def call():
+        record_stage("queue_cpu", (time.perf_counter() - submitted) * 1000)
+        if stage is None:
+            return fn(*args, **kwargs)
+        with timed(stage):
+            return fn(*args, **kwargs)
+
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_cpu_pool, ctx.run, call)
+
+
+async def _acquire_llm_slot() -> bool:
+    start = time.perf_counter()
+    timeout = Config.ADMISSION_MAX_WAIT_MS / 1000 if Config.ADMISSION_ENABLED else None
+    try:
+        await asyncio.wait_for(_llm_slots.acquire(), timeout)
+        acquired = True
+    except asyncio.TimeoutError:
+        acquired = False
+    record_stage("queue_llm", (time.perf_counter() - start) * 1000)
+    inc("admission_total", stage="llm", decision="admitted" if acquired else "timed_out")
+    return acquired
+
+
+# ---------- Request wrappers ----------
+
+def _endpoint(name: str):
+    """Per-request stage breakdown, Server-Timing header and requests_total (init_metrics for Flask)."""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request: Request) -> Response:
+            _ensure_runtime()
+            start = time.perf_counter()
+            timings = start_request_timings()
+            response = await handler(request)
+            total_ms = (time.perf_counter() - start) * 1000
+            if timings:
+                record_stage("request", total_ms)
+                response.headers["Server-Timing"] = server_timing_header({**timings, "total": total_ms})
+                response.headers.append("Access-Control-Expose-Headers", "Server-Timing")
+            inc("requests_total", endpoint=name)
+            return response
+        return wrapper
+    return decorator
+
+
+def _auth_required(handler):
+    """firebase_auth_required for the ASGI app; the verified claims land on request.state.firebase_user."""
+    @wraps(handler)
+    async def wrapper(request: Request) -> Response:
+        if request.method == "OPTIONS":
+            return Response(status_code=200, headers=_PREFLIGHT_HEADERS)
+
+        auth_header = request.headers.get("Authorization", "")
+        if not auth_header.startswith("Bearer "):
+            return JSONResponse({"error": "missing id token"}, status_code=401)
+        id_token = auth_header.split(" ", 1)[1].strip()
+        try:
+            request.state.firebase_user = await _cpu(verify_token, id_token, stage="auth")
+        except Exception as e:
+            logger.error(f"Firebase token verify failed: {e}")
+            return JSONResponse({"error": "invalid or expired token", "detail": str(e)}, status_code=401)
+        return await handler(request)
+
+    return wrapper
+
+
+async def _json_body(request: Request) -> dict:
+    try:
+        payload = await request.json()
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+# ---------- Pipeline ----------
+
+async def _upsert_user(firebase_user) -> Optional[str]:
+    firebase_uid = firebase_user.get("uid")
+    if not firebase_uid:
+        return None
+    with timed("user_upsert"):
+        return await async_database.get_or_create_user_by_firebase_uid(
+            firebase_uid, email=firebase_user.get("email"),
+            name=firebase_user.get("name") or firebase_user.get("displayName"))
+
+
+async def _retrieve_and_generate(transcript, session, history, collections=None):
+    """Retrieval on the CPU pool, then the LLM under ASGI_LLM_CONCURRENCY (raises Overloaded)."""
+    if session is not None:
+        docs = await _cpu(retrieve_for_turn, session, transcript, top_k=Config.TOP_K, collections=collections)
+    else:
+        docs = await _cpu(retrieve_ranked, transcript, top_k=Config.TOP_K, collections=collections)
+
+    if await _acquire_llm_slot():
+        try:
+            gen = await arag_reply(transcript, docs, history)
+        finally:
+            _llm_slots.release()
+    else:
+        # LLM saturated: answer from the top chunk, or shed if there is none
+        if not docs:
+            shed("llm")
+        inc("fallbacks_total", kind="degraded")
+        gen = {"reply": top_chunk_reply(docs), "model_text": None, "model_ms": None, "success": True}
+    return {**gen, "sources": docs}
+
+
+async def _answer(transcript, user_id, email, client_session_id, audio_url=None, duration_ms=None,
+                  collections=None):
+    """The /query pipeline of app.api.routes._answer; returns (body, status, headers)."""
+    session_id = client_session_id or f"sess_{int(time.time())}"
+    # get_session may read chat_sessions through the sync engine on a miss
+    session = await _cpu(get_session, session_id, email) if client_session_id else None
+
+    intent = None
+    reply = None
+    sources = []
+    model_text = None
+    model_ms = None
+    success = False
+
+    hf_intent, hf_score = await _cpu(classify_intent_hf, transcript, stage="nlu")
+    logger.info(f"🤖 HF MODEL PREDICTION: Intent='{hf_intent}' | Confidence={hf_score:.4f}")
+
+    # Order lookups hit the order cache, and the sync engine on a miss
+    order = await _cpu(order_reply, hf_intent, hf_score, email) if hf_intent == "track_order" else None
+    if order:
+        intent, reply = order
+        success = True
+    else:
+        try:
+            intent = "open_question"
+            history = history_for_prompt(session) if session is not None else None
+            scope = ",".join(collections) if collections else None
+            cached = get_answer(transcript, scope) if not history else None
+            if cached is not None:
+                gen = {**cached, "model_ms": None, "success": True}
+            else:
+                gen = await _retrieve_and_generate(transcript, session, history, collections)
+                if not history and gen["model_text"]:
+                    store_answer(transcript, gen["reply"], gen["model_text"], gen["sources"], scope=scope)
+            sources = gen["sources"]
+            reply, model_text, model_ms, success = gen["reply"], gen["model_text"], gen["model_ms"], gen["success"]
+        except Overloaded as e:
+            body = {"error": "overloaded", "stage": e.stage, "retry_after": e.retry_after}
+            return body, 503, {"Retry-After": str(e.retry_after)}
+        except Exception as e:
+            logger.exception("Processing error: %s", e)
+            inc("fallbacks_total", kind="error")
+            reply = ERROR_REPLY
+            success = False
+
+    if session is not None:
+        record_turn(session, transcript, reply, intent, sources)
+
+    with timed("persist"):
+        qid = await async_database.insert_voice_query(
+            user_id=user_id, session_id=session_id, transcript=transcript, intent=intent, reply=reply,
+            model_response=model_text, sources=sources, model_ms=model_ms, audio_url=audio_url,
+            duration_ms=duration_ms)
+
+    response = {
+        "reply": reply,
+        "intent": intent,
+        "sources": public_sources(sources),
+        "query_id": qid
+    }
+    return response, 200, {}
+
+
+# ---------- Endpoints ----------
+
+async def health(request: Request) -> Response:
+    return Response("ok", status_code=200)
+
+
+async def metrics(request: Request) -> Response:
+    return Response(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@_endpoint("api.auth_sync")
+@_auth_required
+async def auth_sync(request: Request) -> Response:
+    try:
+        firebase_user = request.state.firebase_user
+        user_id = await async_database.get_or_create_user_by_firebase_uid(
+            firebase_user.get("uid"), email=firebase_user.get("email"),
+            name=firebase_user.get("name") or firebase_user.get("displayName"),
+            photo_url=firebase_user.get("picture"))
+        return JSONResponse({"status": "ok", "user_id": user_id})
+    except Exception as e:
+        logger.exception("auth_sync failed")
+        return JSONResponse({"error": "server_error", "detail": str(e)}, status_code=500)
+
+
+@_endpoint("api.query")
+@_auth_required
+async def query(request: Request) -> Response:
+    payload = await _json_body(request)
+    transcript = (payload.get("transcript") or "").strip()
+    audio_url = payload.get("audio_url")
+    duration_ms = payload.get("duration_ms")
+
+    if not transcript and not audio_url:
+        return JSONResponse({"error": "empty transcript and no audio_url"}, status_code=400)
+    if not transcript:
+        # As the Flask /query: a bare audio_url is answered with the legacy
+        # placeholder (streamed speech-to-text is /query/audio, Flask only)
+        transcript = "[transcribed audio]"
+    collections, error = rag.parse_collections(payload.get("collections"))
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+
+    firebase_user = request.state.firebase_user
+    user_id = await _upsert_user(firebase_user)
+    body, status, headers = await _answer(transcript, user_id, firebase_user.get("email"), payload.get("session_id"),
+                                          audio_url=audio_url, duration_ms=duration_ms, collections=collections)
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+@_endpoint("api.history")
+@_auth_required
+async def history(request: Request) -> Response:
+    uid = request.state.firebase_user.get("uid")
+    if not uid:
+        return JSONResponse({"history": [], "next_cursor": None})
+
+    try:
+        limit = int(request.query_params.get("limit", Config.HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        return JSONResponse({"error": "limit must be an integer"}, status_code=400)
+    limit = max(1, min(limit, Config.HISTORY_MAX_LIMIT))
+    cursor = request.query_params.get("cursor") or None
+    try:
+        user_id = await async_database.get_user_id(uid)
+        if not user_id:
+            return JSONResponse({"history": [], "next_cursor": None})
+        result, next_cursor = await async_database.get_voice_query_history(user_id, limit=limit, cursor=cursor)
+        return JSONResponse({"history": result, "next_cursor": next_cursor})
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        logger.exception("history failed: %s", e)
+        return JSONResponse({"error": "server_error", "detail": str(e)}, status_code=500)
+
+
+# ---------- App ----------
+
+@asynccontextmanager
+async def _lifespan(app):
+    global _cpu_pool, _llm_slots
+    _ensure_runtime()
+    logger.info("ASGI app ready (cpu workers=%d, llm slots=%d)", Config.ASGI_CPU_WORKERS, Config.ASGI_LLM_CONCURRENCY)
+    try:
+        yield
+    finally:
+        await async_database.dispose_async_db()
+        _cpu_pool.shutdown(wait=False)
+        _cpu_pool, _llm_slots = None, None
+
+
+def build_asgi_app() -> Starlette:
+    return Starlette(routes=[
+        Route("/health", health, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/auth/sync", auth_sync, methods=["POST", "OPTIONS"]),
+        Route("/query", query, methods=["POST", "OPTIONS"]),
+        Route("/history", history, methods=["GET", "OPTIONS"]),
+    ], lifespan=_lifespan)
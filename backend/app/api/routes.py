@@ -1,20 +1,29 @@
 import time
 import logging
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 import sqlalchemy as sa
 
 from app.config import Config
-from app.core.auth import firebase_auth_required
+from app.core.auth import firebase_auth_required, admin_required
+from app.core.metrics import timed, inc, render_prometheus
+from app.core.profiler import PROFILER
+from app.core.admission import Overloaded, admit, shed, is_overloaded, classify_cost
 from app.core.database import (
     get_or_create_user_by_firebase_uid,
     insert_voice_query,
-    get_order_status_by_email,
+    get_voice_query_history,
     engine
 )
 
+from app.services import rag
 from app.services.rag import retrieve_docs, load_index
-from app.services.llm import call_gemini_rag, call_gemini_general
+from app.services.rerank import retrieve_ranked
 from app.services.nlu import classify_intent_hf
+from app.services.pipeline import order_reply, rag_reply, public_sources, top_chunk_reply, ERROR_REPLY
+from app.services.session_context import get_session, retrieve_for_turn, record_turn, history_for_prompt
+from app.services.batch import run_batch_ndjson
+from app.services.asr import AudioStream, asr_available, parse_wav_header
+from app.services.answer_cache import get_answer, store_answer, clear as clear_answer_cache
 
 logger = logging.getLogger("voicebot")
 
@@ -24,6 +33,10 @@ api_bp = Blueprint("api", __name__)
 def health():
     return "ok", 200
 
+@api_bp.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
 # 🟢 FIX: Add "OPTIONS" to the methods list
 @api_bp.route("/auth/sync", methods=["POST", "OPTIONS"])
 @firebase_auth_required
@@ -44,39 +57,62 @@ def auth_sync():
         logger.exception("auth_sync failed")
         return jsonify({"error":"server_error","detail":str(e)}), 500
 
-# 🟢 FIX: Add "OPTIONS" to the methods list
-@api_bp.route("/query", methods=["POST", "OPTIONS"])
-@firebase_auth_required
-def query():
-    if request.method == "OPTIONS":
-        return jsonify({"status": "ok"}), 200
-
-    payload = request.json or {}
-    transcript = (payload.get("transcript") or "").strip()
-    audio_url = payload.get("audio_url")
-    session_id = payload.get("session_id", f"sess_{int(time.time())}")
-    duration_ms = payload.get("duration_ms")
-
-    if not transcript and not audio_url:
-        return jsonify({"error":"empty transcript and no audio_url"}), 400
-
-    firebase_user = getattr(request, "firebase_user", {})
+def _upsert_user(firebase_user):
     firebase_uid = firebase_user.get("uid")
     email = firebase_user.get("email")
     name = firebase_user.get("name") or firebase_user.get("displayName")
-
-    user_id = None
     try:
         if firebase_uid:
-            user_id = get_or_create_user_by_firebase_uid(firebase_uid, email=email, name=name)
+            with timed("user_upsert"):
+                return get_or_create_user_by_firebase_uid(firebase_uid, email=email, name=name)
     except Exception:
         logger.exception("Failed to map/create user for firebase_uid: %s", firebase_uid)
+    return None
 
-    if not transcript and audio_url:
-        try:
-            transcript = "[transcribed audio]"
-        except Exception:
-            transcript = ""
+def _overloaded(e):
+    body = {"error": "overloaded", "stage": e.stage, "retry_after": e.retry_after}
+    return body, 503, {"Retry-After": str(e.retry_after)}
+
+def _retrieve_and_generate(transcript, session, history, prefetched, collections=None):
+    """Retrieval + LLM for an open question, under admission control (raises Overloaded)."""
+    if prefetched.get("docs") is not None and session is None:
+        docs, ok = prefetched["docs"], True
+    else:
+        with admit("retrieval") as ok:
+            if ok:
+                if session is not None:
+                    docs = retrieve_for_turn(session, transcript, top_k=Config.TOP_K,
+                                             q_emb=prefetched.get("q_emb"), docs=prefetched.get("docs"),
+                                             collections=collections)
+                else:
+                    docs = retrieve_ranked(transcript, top_k=Config.TOP_K, collections=collections)
+    if not ok:
+        shed("retrieval")
+    with admit("llm") as ok:
+        if ok:
+            gen = rag_reply(transcript, docs, history)
+    if not ok:
+        # LLM saturated: answer from the top chunk, or shed if there is none
+        if not docs:
+            shed("llm")
+        inc("fallbacks_total", kind="degraded")
+        gen = {"reply": top_chunk_reply(docs), "model_text": None, "model_ms": None, "success": True}
+    return {**gen, "sources": docs}
+
+def _answer(transcript, user_id, email, client_session_id, audio_url=None, duration_ms=None, prefetched=None,
+            collections=None):
+    """
+    The /query pipeline for one transcript. `prefetched` carries NLU and/or
+    retrieval results already computed for this transcript (streaming ASR);
+    `collections` routes retrieval (None = default routing).
+    Returns (body, status, headers).
+    """
+    session_id = client_session_id or f"sess_{int(time.time())}"
+    prefetched = prefetched or {}
+
+    # Conversation context only for client-provided sessions; a generated
+    # per-request id can never have a follow-up.
+    session = get_session(session_id, email) if client_session_id else None
 
     # Init vars
     intent = None
@@ -86,80 +122,228 @@ def query():
     model_ms = None
     success = False
 
-    # 1. NLU Classification
-    hf_intent, hf_score = classify_intent_hf(transcript)
-    
+    # 1. NLU Classification (admission-gated; cheap requests skip it when saturated)
+    tier, cost_kind, rule_answer = classify_cost(transcript)
+    hf_intent, hf_score = "general_question", 0.0
+    nlu_ran = False
+    if prefetched.get("nlu"):
+        hf_intent, hf_score = prefetched["nlu"]
+        nlu_ran = True
+    elif not (tier == "cheap" and is_overloaded("nlu")):
+        with admit("nlu", tier) as ok:
+            if ok:
+                with timed("nlu"):
+                    hf_intent, hf_score = classify_intent_hf(transcript)
+                nlu_ran = True
+    if not nlu_ran and tier != "cheap":
+        # No intent and no cheap answer: shed instead of pushing the request
+        # on into retrieval and the LLM
+        try:
+            shed("nlu")
+        except Overloaded as e:
+            return _overloaded(e)
+    if not nlu_ran:
+        inc("fallbacks_total", kind="nlu_skipped")
+        if cost_kind == "rule":
+            intent, reply = rule_answer
+            success = True
+        elif cost_kind == "order":
+            hf_intent, hf_score = "track_order", 1.0
+
     print(f"\n🛑 DEBUG: User said: '{transcript}'", flush=True)
     print(f"🛑 DEBUG: HF Model Prediction: Intent='{hf_intent}' | Score={hf_score:.4f}", flush=True)
     logger.info(f"🤖 HF MODEL PREDICTION: Intent='{hf_intent}' | Confidence={hf_score:.4f}")
 
     # 2. Feature 5 (Order Logic)
-    is_order_intent = (hf_intent == "check order status" and hf_score > 0.4)
-
-    if is_order_intent:
-        print("✅ DEBUG: Logic decided to check Database!", flush=True)
-        logger.info("✅ HF Model decided to check Database")
-        
-        if email:
-            reply = get_order_status_by_email(email)
-            intent = "order_tracking"
-            success = True
-        else:
-            reply = "Please sign in so I can look up your order details."
-            intent = "auth_required"
-            success = True
+    order = order_reply(hf_intent, hf_score, email) if reply is None else None
+    if order:
+        intent, reply = order
+        success = True
 
     # 3. Fallback Logic
     if reply is None:
         try:
             intent = "open_question"
-            docs = retrieve_docs(transcript, top_k=Config.TOP_K)
-            sources = docs
-            if docs:
-                start = time.time()
-                gen = call_gemini_rag(transcript, docs)
-                model_ms = int((time.time() - start) * 1000)
-                model_text = gen
-                reply = gen if gen else f"I found info in {docs[0].get('source','unknown')}."
-                success = True
+            history = history_for_prompt(session) if session is not None else None
+            scope = ",".join(collections) if collections else None
+            cached = get_answer(transcript, scope) if not history else None
+            if cached is not None:
+                gen = {**cached, "model_ms": None, "success": True}
             else:
-                start = time.time()
-                gen = call_gemini_general(transcript)
-                model_ms = int((time.time() - start) * 1000)
-                model_text = gen
-                reply = gen if gen else "I don't know the answer to that right now."
-                success = False if not gen else True
+                gen = _retrieve_and_generate(transcript, session, history, prefetched, collections)
+                if not history and gen["model_text"]:
+                    store_answer(transcript, gen["reply"], gen["model_text"], gen["sources"], scope=scope)
+            sources = gen["sources"]
+            reply, model_text, model_ms, success = gen["reply"], gen["model_text"], gen["model_ms"], gen["success"]
+        except Overloaded as e:
+            return _overloaded(e)
         except Exception as e:
             logger.exception("Processing error: %s", e)
-            reply = "Internal server error processing your request."
+            inc("fallbacks_total", kind="error")
+            reply = ERROR_REPLY
             success = False
 
+    if session is not None:
+        record_turn(session, transcript, reply, intent, sources)
+
     # 4. Persistence
     qid = None
     try:
-        qid = insert_voice_query(
-            user_id=user_id, 
-            session_id=session_id, 
-            transcript=transcript, 
-            intent=intent, 
-            reply=reply, 
-            model_response=model_text, 
-            sources=sources, 
-            model_ms=model_ms, 
-            success=success, 
-            audio_url=audio_url, 
-            duration_ms=duration_ms
-        )
+        with timed("persist"):
+            qid = insert_voice_query(
+                conn_or_engine=None,
+                user_id=user_id, 
+                session_id=session_id, 
+                transcript=transcript, 
+                intent=intent, 
+                reply=reply, 
+                model_response=model_text, 
+                sources=sources, 
+                model_ms=model_ms, 
+                success=success, 
+                audio_url=audio_url, 
+                duration_ms=duration_ms
+            )
     except Exception:
         logger.exception("Failed to persist voice query")
 
     response = {
         "reply": reply, 
         "intent": intent, 
-        "sources": [{"id": s.get("id"), "source": s.get("source"), "score": s.get("score")} for s in sources] if sources else [], 
+        "sources": public_sources(sources), 
         "query_id": qid
     }
-    return jsonify(response)
+    return response, 200, {}
+
+# 🟢 FIX: Add "OPTIONS" to the methods list
+@api_bp.route("/query", methods=["POST", "OPTIONS"])
+@firebase_auth_required
+def query():
+    if request.method == "OPTIONS":
+        return jsonify({"status": "ok"}), 200
+
+    payload = request.json or {}
+    transcript = (payload.get("transcript") or "").strip()
+    audio_url = payload.get("audio_url")
+    duration_ms = payload.get("duration_ms")
+
+    if not transcript and not audio_url:
+        return jsonify({"error":"empty transcript and no audio_url"}), 400
+    if not transcript:
+        # A bare audio_url is not fetched (server-side speech-to-text runs on
+        # streamed audio, /query/audio); answered with the legacy placeholder.
+        transcript = "[transcribed audio]"
+    collections, error = rag.parse_collections(payload.get("collections"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    firebase_user = getattr(request, "firebase_user", {})
+    user_id = _upsert_user(firebase_user)
+    body, status, headers = _answer(transcript, user_id, firebase_user.get("email"), payload.get("session_id"),
+                                    audio_url=audio_url, duration_ms=duration_ms, collections=collections)
+    return jsonify(body), status, headers
+
+def _prefetch_for_partial(text, collections=None):
+    """NLU + retrieval for a partial transcript; skipped while those stages shed load."""
+    if is_overloaded("nlu") or is_overloaded("retrieval"):
+        return {}
+    out = {}
+    with timed("nlu"):
+        out["nlu"] = classify_intent_hf(text)
+    _, cost_kind, _ = classify_cost(text)
+    if cost_kind is None and out["nlu"][0] != "track_order" and rag.retrieval_ready():
+        out["q_emb"] = rag.embed_queries([text])
+        out["docs"] = retrieve_ranked(text, top_k=Config.TOP_K, q_emb=out["q_emb"], collections=collections)
+    return out
+
+@api_bp.route("/query/audio", methods=["POST", "OPTIONS"])
+@firebase_auth_required
+def query_audio():
+    """
+    Streamed utterance: raw PCM s16le mono (or a 16-bit mono WAV stream) sent with
+    chunked transfer encoding. Query args: sample_rate (default
+    ASR_SAMPLE_RATE), session_id, audio_url, collections. Transcribes incrementally,
+    starts NLU + retrieval on partial transcripts, stops reading at the VAD
+    end of utterance and answers like /query, plus transcript and duration_ms.
+    """
+    if request.method == "OPTIONS":
+        return jsonify({"status": "ok"}), 200
+    if not asr_available():
+        return jsonify({"error": "speech-to-text is not enabled on this server"}), 501
+
+    try:
+        sample_rate = int(request.args.get("sample_rate", Config.ASR_SAMPLE_RATE))
+    except ValueError:
+        return jsonify({"error": "sample_rate must be an integer"}), 400
+    collections, error = rag.parse_collections(request.args.get("collections"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    firebase_user = getattr(request, "firebase_user", {})
+    user_id = _upsert_user(firebase_user)
+
+    head = b""
+    stream = None
+    while True:
+        chunk = request.stream.read(Config.ASR_READ_BYTES)
+        if stream is None:
+            head += chunk
+            if len(head) < 44 and chunk:
+                continue
+            try:
+                wav_rate, offset = parse_wav_header(head)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            stream = AudioStream(wav_rate or sample_rate,
+                                 prefetch_fn=lambda text: _prefetch_for_partial(text, collections))
+            chunk, head = head[offset:], b""
+        if not chunk:
+            break
+        stream.feed(chunk)
+        if stream.ended:
+            break
+
+    result = stream.finish()
+    transcript = result["transcript"].strip()
+    if not transcript:
+        return jsonify({"error": "no speech detected", "duration_ms": result["duration_ms"]}), 422
+
+    body, status, headers = _answer(transcript, user_id, firebase_user.get("email"), request.args.get("session_id"),
+                                    audio_url=request.args.get("audio_url"), duration_ms=result["duration_ms"],
+                                    prefetched=result["prefetched"], collections=collections)
+    if status == 200:
+        body.update({"transcript": transcript, "duration_ms": result["duration_ms"],
+                     "asr": {"partials": result["partials"], "prefetch": result["prefetch"]}})
+    return jsonify(body), status, headers
+
+@api_bp.route("/query/batch", methods=["POST", "OPTIONS"])
+@firebase_auth_required
+def query_batch():
+    """
+    Bulk replay: {"transcripts": ["...", {"transcript": "...", "session_id": "..."}], "session_id": "..."}.
+    Optional "collections" routes retrieval for the whole batch.
+    Streams one NDJSON line per transcript (with its input "index").
+    """
+    if request.method == "OPTIONS":
+        return jsonify({"status": "ok"}), 200
+
+    payload = request.json or {}
+    items = payload.get("transcripts")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "transcripts must be a non-empty list"}), 400
+    if len(items) > Config.BATCH_MAX_ITEMS:
+        return jsonify({"error": f"too many transcripts (max {Config.BATCH_MAX_ITEMS})"}), 413
+    session_id = payload.get("session_id", f"batch_{int(time.time())}")
+    collections, error = rag.parse_collections(payload.get("collections"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    # One auth check and one user upsert for the whole batch
+    firebase_user = getattr(request, "firebase_user", {})
+    user_id = _upsert_user(firebase_user)
+    lines = run_batch_ndjson(items, user_id=user_id, email=firebase_user.get("email"), session_id=session_id,
+                             collections=collections)
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
 
 @api_bp.route("/history", methods=["GET", "OPTIONS"])
 @firebase_auth_required
@@ -169,32 +353,25 @@ def history():
     firebase_user = getattr(request, "firebase_user", {})
     uid = firebase_user.get("uid")
     if not uid:
-        return jsonify({"history": []})
+        return jsonify({"history": [], "next_cursor": None})
 
-    limit = int(request.args.get("limit", 20))
+    try:
+        limit = int(request.args.get("limit", Config.HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, Config.HISTORY_MAX_LIMIT))
+    cursor = request.args.get("cursor") or None
     try:
         if engine is None:
-            return jsonify({"history": []})
+            return jsonify({"history": [], "next_cursor": None})
         with engine.begin() as conn:
             row = conn.execute(sa.text("SELECT id FROM users WHERE firebase_uid = :fu"), {"fu": uid}).fetchone()
-            if not row:
-                return jsonify({"history": []})
-            user_id = row[0]
-            rows = conn.execute(sa.text("SELECT id, session_id, transcript, intent, response, rag_sources, confidence, duration_ms, created_at FROM voice_queries WHERE user_id = :uid ORDER BY created_at DESC LIMIT :lim"), {"uid": user_id, "lim": limit}).fetchall()
-            result = []
-            for r in rows:
-                result.append({
-                    "id": str(r[0]),
-                    "session_id": r[1],
-                    "transcript": r[2],
-                    "intent": r[3],
-                    "response": r[4],
-                    "rag_sources": r[5],
-                    "confidence": r[6],
-                    "duration_ms": r[7],
-                    "created_at": r[8].isoformat() if r[8] else None
-                })
-            return jsonify({"history": result})
+        if not row:
+            return jsonify({"history": [], "next_cursor": None})
+        result, next_cursor = get_voice_query_history(row[0], limit=limit, cursor=cursor)
+        return jsonify({"history": result, "next_cursor": next_cursor})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.exception("history failed: %s", e)
         return jsonify({"error":"server_error","detail": str(e)}), 500
@@ -207,16 +384,56 @@ def debug_retrieve():
     q = payload.get("query","")
     if not q:
         return jsonify({"error":"empty query"}), 400
-    docs = retrieve_docs(q, top_k=10)
+    collections, error = rag.parse_collections(payload.get("collections"))
+    if error:
+        return jsonify({"error": error}), 400
+    docs = retrieve_docs(q, top_k=10, collections=collections)
     return jsonify({"retrieved": docs})
 
 @api_bp.route("/reload_index", methods=["POST", "OPTIONS"])
 @firebase_auth_required
+@admin_required
 def reload_index():
     if request.method == "OPTIONS": return jsonify({"status": "ok"}), 200
+    # {"collection": "name"} reloads one shard; no body reloads (and discovers) all
+    payload = request.get_json(silent=True) or {}
     try:
-        load_index()
-        return jsonify({"ok": True, "msg": "Index reloaded"})
+        reloaded = load_index(payload.get("collection") or None)
+        # Cached answers were generated from the previous index
+        clear_answer_cache()
+        return jsonify({"ok": True, "msg": "Index reloaded", "reloaded": reloaded,
+                        "collections": sorted(rag.COLLECTIONS)})
+    except KeyError as e:
+        return jsonify({"ok": False, "error": str(e.args[0])}), 404
     except Exception as e:
         logger.exception("reload_index failed: %s", e)
-        return jsonify({"ok": False, "error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+@api_bp.route("/admin/profile", methods=["GET", "POST", "DELETE", "OPTIONS"])
+@firebase_auth_required
+@admin_required
+def admin_profile():
+    """
+    Sampling profiler for the worker that serves the call (one per gunicorn
+    worker). POST {"seconds": N} or {"requests": N} (optional "interval_ms")
+    starts a profile, which ends after PROFILER_MAX_SECONDS at the latest;
+    DELETE stops it early, GET shows status and the collapsed-stack files in
+    PROFILER_DIR.
+    """
+    if request.method == "OPTIONS": return jsonify({"status": "ok"}), 200
+    if request.method == "GET":
+        return jsonify(PROFILER.status())
+    if request.method == "DELETE":
+        return jsonify({"ok": True, "file": PROFILER.stop()})
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        seconds = float(payload["seconds"]) if payload.get("seconds") else None
+        requests = int(payload["requests"]) if payload.get("requests") else None
+        interval_ms = float(payload["interval_ms"]) if payload.get("interval_ms") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds, requests and interval_ms must be numbers"}), 400
+    try:
+        return jsonify({"ok": True, "session": PROFILER.start(seconds, requests, interval_ms)})
+    except RuntimeError as e:
+        return jsonify({"ok": False, "error": str(e)}), 409
@@ -25,6 +25,13 @@ class Config:
     EMBED_MODEL_NAME = os.environ.get("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
     FAISS_INDEX_PATH = os.environ.get("FAISS_INDEX_PATH", os.path.join("ingest", "faiss.index"))
     DOCS_META_PATH = os.environ.get("DOCS_META_PATH", os.path.join("ingest", "docs_meta.json"))
+    # Sharded retrieval: the index above is DEFAULT_COLLECTION, every
+    # COLLECTIONS_DIR/<name>/ is another collection. Queries search
+    # QUERY_COLLECTIONS (comma separated) unless they name their own; empty = all.
+    DEFAULT_COLLECTION = os.environ.get("DEFAULT_COLLECTION", "default")
+    COLLECTIONS_DIR = os.environ.get("COLLECTIONS_DIR", os.path.join("ingest", "collections"))
+    QUERY_COLLECTIONS = [c.strip() for c in os.environ.get("QUERY_COLLECTIONS", "").split(",") if c.strip()]
+    RETRIEVAL_FANOUT_WORKERS = int(os.environ.get("RETRIEVAL_FANOUT_WORKERS", str(min(8, os.cpu_count() or 1))))
 
     # Logging
     LOGFILE = os.environ.get("LOGFILE", "interactions.log")
@@ -36,9 +43,125 @@ class Config:
     TOP_K = int(os.environ.get("TOP_K", "3"))
     SCORE_THRESHOLD = float(os.environ.get("SCORE_THRESHOLD", "0.25"))
 
+    # Re-ranking (cross-encoder over an over-fetched candidate set)
+    RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "0") == "1"
+    RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "30"))
+    RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "150"))
+
+    # Query caches, pre-warmed at worker start from the analytics warm-up set
+    EMBED_CACHE_MAX = int(os.environ.get("EMBED_CACHE_MAX", "20000"))
+    ANSWER_CACHE_TTL_S = float(os.environ.get("ANSWER_CACHE_TTL_S", "86400"))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+    WARMUP_DIR = os.environ.get("WARMUP_DIR", "warmup")
+    WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "1") == "1"
+
     # App
     PORT = int(os.environ.get("PORT", 8000))
 
+    # Conversation context (chat_sessions write-through)
+    SESSION_CACHE_MAX = int(os.environ.get("SESSION_CACHE_MAX", "5000"))
+    SESSION_MAX_TURNS = int(os.environ.get("SESSION_MAX_TURNS", "6"))
+    SESSION_PROMPT_TURNS = int(os.environ.get("SESSION_PROMPT_TURNS", "3"))
+    SESSION_FOLLOWUP_MAX_WORDS = int(os.environ.get("SESSION_FOLLOWUP_MAX_WORDS", "6"))
+    SESSION_TOPIC_SIM = float(os.environ.get("SESSION_TOPIC_SIM", "0.6"))
+    SESSION_FLUSH_INTERVAL_S = float(os.environ.get("SESSION_FLUSH_INTERVAL_S", "0.5"))
+    # How long a cached session is trusted before its chat_sessions version is
+    # re-checked; a write from a stale copy is caught by the conditional flush.
+    SESSION_REVALIDATE_S = float(os.environ.get("SESSION_REVALIDATE_S", "30"))
+
+    # Schema migrations take a session-level advisory lock and build indexes
+    # CONCURRENTLY, which needs one server session: a direct (non-pooler)
+    # endpoint. Default: DATABASE_URL, with Neon's "-pooler" host swapped for
+    # the direct one. Migrations are skipped when this is still a pooler.
+    MIGRATIONS_DATABASE_URL = os.environ.get("MIGRATIONS_DATABASE_URL")
+
+    # Order-status cache (invalidation: auto | notify | poll | off).
+    # LISTEN needs a session-mode connection. Default listen URL: DATABASE_URL
+    # with Neon's "-pooler" host swapped for the direct endpoint (as for
+    # migrations); behind other poolers set ORDER_CACHE_LISTEN_URL, or "auto"
+    # falls back to polling.
+    ORDER_CACHE_TTL_S = float(os.environ.get("ORDER_CACHE_TTL_S", "30"))
+    ORDER_CACHE_MAX_ENTRIES = int(os.environ.get("ORDER_CACHE_MAX_ENTRIES", "10000"))
+    ORDER_CACHE_INVALIDATION = os.environ.get("ORDER_CACHE_INVALIDATION", "auto")
+    ORDER_CACHE_LISTEN_URL = os.environ.get("ORDER_CACHE_LISTEN_URL")
+    ORDER_CACHE_POLL_S = float(os.environ.get("ORDER_CACHE_POLL_S", "10"))
+    ORDER_CACHE_WARM = os.environ.get("ORDER_CACHE_WARM", "0") == "1"
+    ORDER_INACTIVE_STATUSES = [s.strip() for s in os.environ.get("ORDER_INACTIVE_STATUSES", "delivered,cancelled,returned").split(",") if s.strip()]
+
+    # /history paging
+    HISTORY_DEFAULT_LIMIT = int(os.environ.get("HISTORY_DEFAULT_LIMIT", "20"))
+    HISTORY_MAX_LIMIT = int(os.environ.get("HISTORY_MAX_LIMIT", "100"))
+
+    # Batch API (/query/batch)
+    BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "10000"))
+    BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "256"))
+    BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", "4"))
+    # Total back-off one batch may spend at the admission gates before the
+    # rest of its work is shed
+    BATCH_ADMISSION_MAX_WAIT_S = float(os.environ.get("BATCH_ADMISSION_MAX_WAIT_S", "60"))
+
+    # Admission control (queue-delay driven load shedding for /query)
+    ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+    ADMISSION_NLU_CONCURRENCY = int(os.environ.get("ADMISSION_NLU_CONCURRENCY", str(max(2, os.cpu_count() or 1))))
+    ADMISSION_RETRIEVAL_CONCURRENCY = int(os.environ.get("ADMISSION_RETRIEVAL_CONCURRENCY", str(2 * max(2, os.cpu_count() or 1))))
+    ADMISSION_LLM_CONCURRENCY = int(os.environ.get("ADMISSION_LLM_CONCURRENCY", "32"))
+    ADMISSION_TARGET_MS = float(os.environ.get("ADMISSION_TARGET_MS", "50"))
+    ADMISSION_INTERVAL_MS = float(os.environ.get("ADMISSION_INTERVAL_MS", "500"))
+    ADMISSION_MAX_WAIT_MS = float(os.environ.get("ADMISSION_MAX_WAIT_MS", "2000"))
+    # Cheap requests (greetings, order lookups) queue longer, but not forever
+    ADMISSION_CHEAP_MAX_WAIT_MS = float(os.environ.get("ADMISSION_CHEAP_MAX_WAIT_MS", "10000"))
+    ADMISSION_RETRY_AFTER_S = float(os.environ.get("ADMISSION_RETRY_AFTER_S", "2"))
+
+    # Async serving mode (uvicorn asgi:app). DATABASE_URL's driver is swapped
+    # for asyncpg unless ASYNC_DATABASE_URL is set; NLU, embedding and FAISS
+    # run on ASGI_CPU_WORKERS threads, LLM calls are capped at ASGI_LLM_CONCURRENCY.
+    ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL")
+    ASYNC_DB_POOL_SIZE = int(os.environ.get("ASYNC_DB_POOL_SIZE", "20"))
+    ASGI_CPU_WORKERS = int(os.environ.get("ASGI_CPU_WORKERS", str(max(2, os.cpu_count() or 1))))
+    ASGI_LLM_CONCURRENCY = int(os.environ.get("ASGI_LLM_CONCURRENCY", "256"))
+
+    # Streaming speech-to-text (/query/audio). ASR_BACKEND: whisper | stub | off
+    # Opt-in: every worker process that enables whisper loads its own model.
+    ASR_BACKEND = os.environ.get("ASR_BACKEND", "off")
+    ASR_MODEL = os.environ.get("ASR_MODEL", "base.en")
+    ASR_LANGUAGE = os.environ.get("ASR_LANGUAGE", "en")
+    ASR_STUB_TEXT = os.environ.get("ASR_STUB_TEXT", "where is my order")
+    ASR_SAMPLE_RATE = int(os.environ.get("ASR_SAMPLE_RATE", "16000"))
+    ASR_READ_BYTES = int(os.environ.get("ASR_READ_BYTES", "8192"))
+    ASR_PARTIAL_MS = int(os.environ.get("ASR_PARTIAL_MS", "800"))
+    # Partials stop once the utterance is longer than this (each one re-reads the buffer)
+    ASR_PARTIAL_WINDOW_S = float(os.environ.get("ASR_PARTIAL_WINDOW_S", "10"))
+    # Concurrent transcriptions per process (whisper workers and partial threads)
+    ASR_WORKERS = int(os.environ.get("ASR_WORKERS", "2"))
+    ASR_MAX_SECONDS = float(os.environ.get("ASR_MAX_SECONDS", "30"))
+    ASR_VAD_RATIO = float(os.environ.get("ASR_VAD_RATIO", "3.0"))
+    ASR_VAD_MIN_RMS = float(os.environ.get("ASR_VAD_MIN_RMS", "0.01"))
+    ASR_MIN_SPEECH_MS = int(os.environ.get("ASR_MIN_SPEECH_MS", "200"))
+    ASR_END_SILENCE_MS = int(os.environ.get("ASR_END_SILENCE_MS", "700"))
+    ASR_PREFETCH_WORKERS = int(os.environ.get("ASR_PREFETCH_WORKERS", "2"))
+    ASR_PREFETCH_REUSE_RATIO = float(os.environ.get("ASR_PREFETCH_REUSE_RATIO", "0.8"))
+    ASR_PREFETCH_WAIT_S = float(os.environ.get("ASR_PREFETCH_WAIT_S", "2"))
+
+    # Sampling profiler (admin /admin/profile) and slow-request capture.
+    # Admins (/admin/*, /reload_index): ADMIN_EMAILS (comma separated, verified
+    # emails only) or an `admin: true` custom claim.
+    ADMIN_EMAILS = [e.strip().lower() for e in os.environ.get("ADMIN_EMAILS", "").split(",") if e.strip()]
+    PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "1") == "1"
+    PROFILER_DIR = os.environ.get("PROFILER_DIR", "profiles")
+    PROFILER_INTERVAL_MS = float(os.environ.get("PROFILER_INTERVAL_MS", "10"))
+    PROFILER_MIN_INTERVAL_MS = float(os.environ.get("PROFILER_MIN_INTERVAL_MS", "2"))
+    PROFILER_DEFAULT_SECONDS = float(os.environ.get("PROFILER_DEFAULT_SECONDS", "30"))
+    PROFILER_MAX_SECONDS = float(os.environ.get("PROFILER_MAX_SECONDS", "600"))
+    PROFILER_MAX_DEPTH = int(os.environ.get("PROFILER_MAX_DEPTH", "64"))
+    PROFILER_SLOW_MS = float(os.environ.get("PROFILER_SLOW_MS", "3000"))
+    PROFILER_BACKGROUND_HZ = float(os.environ.get("PROFILER_BACKGROUND_HZ", "20"))
+    PROFILER_SLOW_MIN_INTERVAL_S = float(os.environ.get("PROFILER_SLOW_MIN_INTERVAL_S", "10"))
+    PROFILER_MAX_FILES = int(os.environ.get("PROFILER_MAX_FILES", "200"))
+
+    # Metrics
+    METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", "2048"))
+
     @staticmethod
     def get_firebase_credentials():
         """
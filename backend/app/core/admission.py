@@ -0,0 +1,192 @@
+import re
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from app.config import Config
+from app.core.metrics import inc, record_stage, register_gauge
+from app.services.rules import RULES
+
+logger = logging.getLogger("voicebot")
+
+# Cheap pre-NLU hint for order lookups (answered from the order cache/DB).
+# Asks about the user's own order, not about ordering or delivery in general.
+_ORDER_HINT = re.compile(r"\b((my|our) (order|package|parcel|shipment|delivery)|order status|track(ing)? (my|an|the) \w+)\b",
+                         re.I)
+# Canned rules count as cheap only for short utterances, matched on whole
+# words/phrases (rules.py matches substrings, where "hi" hits "this").
+# Single keywords that also turn up in ordinary questions ("how do I return
+# a damaged product") are left to NLU + RAG.
+_RULE_MAX_WORDS = 4
+_AMBIGUOUS_KEYWORDS = {"open", "call", "service", "services", "product", "issue", "error", "problem", "device",
+                       "support", "email", "phone", "contact", "return", "timing"}
+
+
+def _rule_patterns():
+    patterns = []
+    for r in RULES:
+        keywords = [kw for kw in r["keywords"] if kw not in _AMBIGUOUS_KEYWORDS]
+        if keywords:
+            patterns.append((re.compile(r"\b(" + "|".join(re.escape(kw) for kw in keywords) + r")\b", re.I),
+                             r["intent"], r["response"]))
+    return patterns
+
+
+_RULE_PATTERNS = _rule_patterns()
+_WORD_RE = re.compile(r"[a-z']+", re.I)
+
+
+class Overloaded(Exception):
+    """Raised when a stage sheds the request; the route answers 503 + Retry-After."""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"{stage} overloaded")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class StageGate:
+    """
+    Concurrency gate for one pipeline stage with CoDel-style overload
+    detection: the stage counts as overloaded once every request in the last
+    `interval` waited longer than `target` to get a slot, and recovers as
+    soon as one request gets through under target. Decisions follow queue
+    delay, the concurrency limit only bounds the work in flight.
+    """
+
+    def __init__(self, name: str, limit: int, target_ms: float, interval_ms: float, max_wait_ms: float,
+                 cheap_max_wait_ms: Optional[float] = None):
+        self.name = name
+        self.limit = limit
+        self.target_ms = target_ms
+        self.interval_ms = interval_ms
+        self.max_wait_s = max_wait_ms / 1000
+        self.cheap_max_wait_s = (Config.ADMISSION_CHEAP_MAX_WAIT_MS if cheap_max_wait_ms is None
+                                 else cheap_max_wait_ms) / 1000
+        self._sem = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.waiting = 0
+        self.overloaded = False
+        self.last_delay_ms = 0.0
+        self._above_since: Optional[float] = None
+
+    def _observe(self, delay_ms: float):
+        now = time.monotonic()
+        with self._lock:
+            self.last_delay_ms = delay_ms
+            if delay_ms < self.target_ms:
+                self._above_since = None
+                self.overloaded = False
+            elif self._above_since is None:
+                self._above_since = now
+            elif (now - self._above_since) * 1000 >= self.interval_ms:
+                if not self.overloaded:
+                    logger.warning("Admission: %s overloaded (queue delay %.0fms)", self.name, delay_ms)
+                self.overloaded = True
+        record_stage(f"queue_{self.name}", delay_ms)
+
+    def retry_after(self) -> int:
+        return max(1, int(math.ceil(max(self.last_delay_ms / 1000, Config.ADMISSION_RETRY_AFTER_S))))
+
+    @contextmanager
+    def enter(self, tier: str):
+        """
+        Yields True when the caller got a slot, False when it should degrade
+        or shed instead. The cheap tier queues even while the stage is
+        overloaded, up to cheap_max_wait; other tiers are turned away while
+        it is overloaded or after max_wait.
+        """
+        if self.overloaded and tier != "cheap":
+            # Rejected work never measures queue delay, so recover as soon as
+            # the stage is visibly idle rather than waiting for cheap traffic.
+            with self._lock:
+                idle = self.waiting == 0 and self.inflight < self.limit
+                if idle:
+                    self.overloaded = False
+                    self._above_since = None
+            if not idle:
+                inc("admission_total", stage=self.name, decision="rejected")
+                yield False
+                return
+
+        start = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        acquired = self._sem.acquire(timeout=self.cheap_max_wait_s if tier == "cheap" else self.max_wait_s)
+        with self._lock:
+            self.waiting -= 1
+        self._observe((time.monotonic() - start) * 1000)
+        if not acquired:
+            inc("admission_total", stage=self.name, decision="timed_out")
+            yield False
+            return
+
+        with self._lock:
+            self.inflight += 1
+        inc("admission_total", stage=self.name, decision="admitted")
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self.inflight -= 1
+            self._sem.release()
+
+
+_gates: Dict[str, StageGate] = {}
+
+
+def init_admission():
+    if _gates:
+        return
+    for name, limit in (("nlu", Config.ADMISSION_NLU_CONCURRENCY),
+                        ("retrieval", Config.ADMISSION_RETRIEVAL_CONCURRENCY),
+                        ("llm", Config.ADMISSION_LLM_CONCURRENCY)):
+        _gates[name] = StageGate(name, limit, Config.ADMISSION_TARGET_MS,
+                                 Config.ADMISSION_INTERVAL_MS, Config.ADMISSION_MAX_WAIT_MS)
+    register_gauge("admission_inflight", "Requests running in a stage.",
+                   lambda: {(("stage", n),): g.inflight for n, g in _gates.items()})
+    register_gauge("admission_waiting", "Requests queued for a stage.",
+                   lambda: {(("stage", n),): g.waiting for n, g in _gates.items()})
+    register_gauge("admission_overloaded", "1 while a stage is shedding non-cheap work.",
+                   lambda: {(("stage", n),): int(g.overloaded) for n, g in _gates.items()})
+
+
+@contextmanager
+def admit(stage: str, tier: str = "standard"):
+    gate = _gates.get(stage)
+    if gate is None or not Config.ADMISSION_ENABLED:
+        yield True
+        return
+    with gate.enter(tier) as ok:
+        yield ok
+
+
+def is_overloaded(stage: str) -> bool:
+    gate = _gates.get(stage)
+    return bool(Config.ADMISSION_ENABLED and gate is not None and gate.overloaded)
+
+
+def shed(stage: str):
+    gate = _gates.get(stage)
+    inc("admission_shed_total", stage=stage)
+    raise Overloaded(stage, gate.retry_after() if gate else int(Config.ADMISSION_RETRY_AFTER_S))
+
+
+def classify_cost(transcript: str) -> Tuple[str, Optional[str], Optional[Tuple[str, str]]]:
+    """
+    Expected-cost class before any model runs: ("cheap", "rule", (intent, reply))
+    for short utterances matching a canned rule, ("cheap", "order", None) for
+    likely lookups of the user's order, else ("standard", None, None) for the
+    RAG + LLM path.
+    """
+    if len(_WORD_RE.findall(transcript)) <= _RULE_MAX_WORDS:
+        for pattern, rule_intent, rule_reply in _RULE_PATTERNS:
+            if pattern.search(transcript):
+                return "cheap", "rule", (rule_intent, rule_reply)
+    if _ORDER_HINT.search(transcript):
+        return "cheap", "order", None
+    return "standard", None, None
@@ -0,0 +1,137 @@
+import uuid
+import logging
+import datetime
+from typing import Optional, List, Dict, Any, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.config import Config
+from app.core.database import (
+    USER_BY_FIREBASE_UID_SQL,
+    TOUCH_USER_SQL,
+    INSERT_USER_SQL,
+    voice_query_insert_sql,
+    voice_query_params,
+    history_query,
+    history_page,
+)
+
+logger = logging.getLogger("voicebot")
+
+# asyncio twin of app.core.database for the ASGI serving mode. Statements are
+# shared with the sync module (its engine points at the same database, so its
+# dialect decides the casts); only the driver differs: asyncpg on Postgres,
+# aiosqlite for the benchmark's SQLite file.
+
+engine: Optional[AsyncEngine] = None
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_url(url: str) -> str:
+    """DATABASE_URL with the driver swapped for its asyncio counterpart."""
+    scheme, sep, rest = url.partition("://")
+    driver = _ASYNC_DRIVERS.get(scheme.split("+", 1)[0])
+    if not driver:
+        return url
+    if driver.endswith("asyncpg"):
+        # libpq options asyncpg does not take: sslmode is spelled ssl, the rest are dropped
+        base, _, query = rest.partition("?")
+        opts = []
+        for opt in query.split("&") if query else []:
+            key, _, value = opt.partition("=")
+            if key == "sslmode":
+                opts.append(f"ssl={value}")
+            elif key not in ("channel_binding", "connect_timeout", "application_name"):
+                opts.append(opt)
+        rest = base + ("?" + "&".join(opts) if opts else "")
+    return f"{driver}{sep}{rest}"
+
+
+def init_async_db():
+    global engine
+    if engine is not None:
+        return
+    url = Config.ASYNC_DATABASE_URL or (async_url(Config.DATABASE_URL) if Config.DATABASE_URL else None)
+    if not url:
+        logger.error("No DATABASE_URL; async DB will remain uninitialized.")
+        return
+    try:
+        kwargs = {"pool_pre_ping": True}
+        if url.startswith("postgresql"):
+            kwargs.update(pool_size=Config.ASYNC_DB_POOL_SIZE, max_overflow=Config.ASYNC_DB_POOL_SIZE)
+        engine = create_async_engine(url, **kwargs)
+        logger.info("Async SQLAlchemy engine created (%s).", engine.dialect.driver)
+    except Exception as e:
+        logger.exception("Failed to create async SQLAlchemy engine: %s", e)
+        engine = None
+
+
+async def dispose_async_db():
+    global engine
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+
+
+def _is_postgres() -> bool:
+    return engine is not None and engine.dialect.name == "postgresql"
+
+
+# ---------- Queries ----------
+
+async def get_user_id(firebase_uid: str) -> Optional[str]:
+    if engine is None: return None
+    async with engine.connect() as conn:
+        row = (await conn.execute(USER_BY_FIREBASE_UID_SQL, {"fu": firebase_uid})).fetchone()
+    return str(row[0]) if row else None
+
+
+async def get_or_create_user_by_firebase_uid(firebase_uid: str, email: Optional[str] = None, name: Optional[str] = None,
+                                             photo_url: Optional[str] = None) -> Optional[str]:
+    if engine is None: return None
+    try:
+        async with engine.begin() as conn:
+            row = (await conn.execute(USER_BY_FIREBASE_UID_SQL, {"fu": firebase_uid})).fetchone()
+            if row:
+                await conn.execute(TOUCH_USER_SQL, {"email": email, "id": row[0]})
+                return str(row[0])
+            res = await conn.execute(INSERT_USER_SQL, {"fu": firebase_uid, "email": email, "name": name,
+                                                       "photo_url": photo_url})
+            return str(res.fetchone()[0])
+    except Exception as e:
+        logger.exception("User fetch failed: %s", e)
+    return None
+
+
+async def insert_voice_query(user_id: Optional[str], session_id: str, transcript: str, intent: Optional[str],
+                             reply: Optional[str], model_response: Optional[str],
+                             sources: Optional[List[Dict[str, Any]]], model_ms: Optional[int],
+                             audio_url: Optional[str] = None, duration_ms: Optional[int] = None) -> Optional[str]:
+    if engine is None: return None
+    try:
+        params = voice_query_params(user_id, session_id, transcript, intent, reply, model_response, sources,
+                                    model_ms, audio_url=audio_url, duration_ms=duration_ms)
+        if _is_postgres() and duration_ms is not None:
+            # asyncpg binds int4 strictly; psycopg2 coerced whatever the client sent
+            params["duration_ms"] = int(duration_ms)
+        async with engine.begin() as conn:
+            res = await conn.execute(voice_query_insert_sql(), params)
+            return str(res.fetchone()[0])
+    except Exception as e:
+        logger.exception("Failed to insert voice_query: %s", e)
+        return None
+
+
+async def get_voice_query_history(user_id: str, limit: int = 20,
+                                  cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """database.get_voice_query_history over the async engine; raises ValueError on a bad cursor."""
+    if engine is None: return [], None
+    q, params = history_query(user_id, limit, cursor)
+    if cursor and _is_postgres():
+        # asyncpg wants typed values for the timestamptz / uuid casts
+        params["ts"] = datetime.datetime.fromisoformat(params["ts"])
+        params["qid"] = uuid.UUID(params["qid"])
+    async with engine.connect() as conn:
+        rows = (await conn.execute(q, params)).fetchall()
+    return history_page(rows, limit)
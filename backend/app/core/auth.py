@@ -8,8 +8,15 @@ from flask import request, jsonify, make_response
 import firebase_admin
 from firebase_admin import credentials, auth as firebase_auth
 
+from app.config import Config
+from app.core.metrics import timed
+
 logger = logging.getLogger("voicebot")
 
+# Optional override for token verification (benchmarks / local runs plug in a
+# verifier for locally signed JWTs instead of calling Firebase).
+_token_verifier = None
+
 # -----------------------------------------------------------
 #  🔥 ROBUST Firebase Admin Initialization
 # -----------------------------------------------------------
@@ -69,6 +76,25 @@ def init_auth():
         # We log but don't crash immediately, so /health check can still pass
 
 
+def set_token_verifier(verifier):
+    """
+    Replace Firebase token verification with `verifier(id_token) -> dict`.
+    Pass None to go back to Firebase.
+    """
+    global _token_verifier
+    _token_verifier = verifier
+
+
+def verify_token(id_token: str) -> dict:
+    if _token_verifier is not None:
+        return _token_verifier(id_token)
+
+    # Lazy load: Ensure auth is initialized before checking token
+    if not firebase_admin._apps:
+        init_auth()
+    return firebase_auth.verify_id_token(id_token)
+
+
 # -----------------------------------------------------------
 #  🔐 Token Verification Decorator (With Manual CORS)
 # -----------------------------------------------------------
@@ -97,11 +123,8 @@ def firebase_auth_required(f):
 
         # 3. VERIFY TOKEN
         try:
-            # Lazy load: Ensure auth is initialized before checking token
-            if not firebase_admin._apps:
-                init_auth()
-
-            decoded = firebase_auth.verify_id_token(id_token)
+            with timed("auth"):
+                decoded = verify_token(id_token)
             request.firebase_user = decoded
             
         except Exception as e:
@@ -110,4 +133,23 @@ def firebase_auth_required(f):
 
         return f(*args, **kwargs)
 
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+def admin_required(f):
+    """
+    Use below @firebase_auth_required. Admins are listed in ADMIN_EMAILS (the
+    token's email must be verified) or carry an `admin: true` custom claim;
+    with neither configured nobody is.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if request.method == "OPTIONS":
+            return f(*args, **kwargs)
+        user = getattr(request, "firebase_user", {}) or {}
+        email = (user.get("email") or "").lower()
+        listed = email and email in Config.ADMIN_EMAILS and user.get("email_verified") is True
+        if user.get("admin") is True or listed:
+            return f(*args, **kwargs)
+        return jsonify({"error": "admin only"}), 403
+
+    return wrapper
@@ -1,9 +1,12 @@
 import logging
 import json
 import time
+import uuid
+import base64
+from urllib.parse import urlparse
 import sqlalchemy as sa
 from sqlalchemy import text as sql_text
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 
 from app.config import Config
 
@@ -34,8 +37,50 @@ def init_db():
         metadata = None
 
 
+def is_pooled_url(url: Optional[str]) -> bool:
+    """
+    True for a transaction-mode pooler endpoint: Neon's "-pooler" hosts and
+    the usual pgbouncer / Supabase pooler ports. Consecutive statements there
+    may land on different server sessions, so LISTEN and session-level
+    advisory locks do not work through it.
+    """
+    if not url:
+        return False
+    try:
+        parsed = urlparse(url)
+        host, port = parsed.hostname or "", parsed.port
+    except ValueError:
+        return False
+    return "-pooler" in host or port in (6432, 6543)
+
+
+def direct_url(url: Optional[str]) -> Optional[str]:
+    """Neon's direct endpoint for a "-pooler" URL (same host without the suffix); other URLs unchanged."""
+    if not url:
+        return url
+    try:
+        host = urlparse(url).hostname or ""
+    except ValueError:
+        return url
+    if "-pooler" not in host:
+        return url
+    return url.replace(host, host.replace("-pooler", "", 1), 1)
+
+
 # ---------- Database helpers & schema ----------
 
+def _cast(name: str, pg_type: str) -> str:
+    """Bind param typed as `pg_type` on Postgres; left untyped on other backends."""
+    if engine is not None and engine.dialect.name == "postgresql":
+        return f"CAST(:{name} AS {pg_type})"
+    return f":{name}"
+
+
+def _jsonb(name: str) -> str:
+    """Bind param for a JSON string: cast to jsonb on Postgres, stored as text elsewhere."""
+    return _cast(name, "jsonb")
+
+
 def create_tables():
     """
     Create or ensure users, voice_queries, orders, AND chat_sessions tables exist.
@@ -43,6 +88,11 @@ def create_tables():
     if engine is None:
         logger.warning("Engine is None; skipping create_tables()")
         return
+    if engine.dialect.name != "postgresql":
+        # The DDL below is Postgres-only (uuid/jsonb/pgcrypto); other backends
+        # (e.g. the benchmark's SQLite) bring their own schema.
+        logger.warning("create_tables() skipped for %s backend", engine.dialect.name)
+        return
     try:
         with engine.begin() as conn:
             try:
@@ -70,7 +120,8 @@ def create_tables():
                 session_uuid text PRIMARY KEY,
                 user_email text,
                 current_context text,
-                updated_at timestamptz DEFAULT now()
+                updated_at timestamptz DEFAULT now(),
+                version integer NOT NULL DEFAULT 0
             )
             """))
 
@@ -108,25 +159,50 @@ def create_tables():
         logger.exception("create_tables() failed: %s", e)
 
 
+USER_BY_FIREBASE_UID_SQL = sa.text("SELECT id FROM users WHERE firebase_uid = :fu")
+TOUCH_USER_SQL = sa.text("UPDATE users SET last_seen = now(), email = coalesce(:email, email) WHERE id = :id")
+INSERT_USER_SQL = sa.text("INSERT INTO users (firebase_uid, email, display_name, photo_url) VALUES (:fu, :email, :name, :photo_url) RETURNING id")
+
+
 def get_or_create_user_by_firebase_uid(firebase_uid: str, email: Optional[str] = None, name: Optional[str] = None, photo_url: Optional[str] = None) -> Optional[str]:
     if engine is None: return None
     try:
         with engine.begin() as conn:
-            q = sa.text("SELECT id FROM users WHERE firebase_uid = :fu")
-            row = conn.execute(q, {"fu": firebase_uid}).fetchone()
+            row = conn.execute(USER_BY_FIREBASE_UID_SQL, {"fu": firebase_uid}).fetchone()
             if row:
                 user_id = row[0]
-                conn.execute(sa.text("UPDATE users SET last_seen = now(), email = coalesce(:email, email) WHERE id = :id"),
-                             {"email": email, "id": user_id})
+                conn.execute(TOUCH_USER_SQL, {"email": email, "id": user_id})
                 return str(user_id)
-            ins = sa.text("INSERT INTO users (firebase_uid, email, display_name, photo_url) VALUES (:fu, :email, :name, :photo_url) RETURNING id")
-            res = conn.execute(ins, {"fu": firebase_uid, "email": email, "name": name, "photo_url": photo_url})
+            res = conn.execute(INSERT_USER_SQL, {"fu": firebase_uid, "email": email, "name": name, "photo_url": photo_url})
             return str(res.fetchone()[0])
     except Exception as e:
         logger.exception("User fetch failed: %s", e)
     return None
 
 
+def voice_query_insert_sql():
+    return sa.text(f"""
+        INSERT INTO voice_queries
+          (user_id, session_id, transcript, audio_url, intent, slots, response, rag_sources, confidence, duration_ms, created_at)
+        VALUES
+          (:user_id, :session_id, :transcript, :audio_url, :intent, {_jsonb("slots")}, {_jsonb("response")}, {_jsonb("rag_sources")}, :confidence, :duration_ms, now())
+        RETURNING id
+    """)
+
+
+def voice_query_params(user_id: Optional[str], session_id: str, transcript: str, intent: Optional[str],
+                       reply: Optional[str], model_response: Optional[str], sources: Optional[List[Dict[str, Any]]],
+                       model_ms: Optional[int], audio_url: Optional[str] = None, slots: Optional[dict] = None,
+                       confidence: Optional[float] = None, duration_ms: Optional[int] = None) -> Dict[str, Any]:
+    """Bind params for voice_query_insert_sql()."""
+    response_obj = {"reply": reply, "model_text": model_response, "model_ms": model_ms, "ts": int(time.time())}
+    return {
+        "user_id": user_id, "session_id": session_id, "transcript": transcript, "audio_url": audio_url,
+        "intent": intent, "slots": json.dumps(slots or {}), "response": json.dumps(response_obj),
+        "rag_sources": json.dumps(sources or []), "confidence": confidence, "duration_ms": duration_ms
+    }
+
+
 def insert_voice_query(conn_or_engine, user_id: Optional[str], session_id: str, transcript: str,
                        intent: Optional[str], reply: Optional[str], model_response: Optional[str],
                        sources: Optional[List[Dict[str, Any]]], model_ms: Optional[int], success: bool,
@@ -137,42 +213,150 @@ def insert_voice_query(conn_or_engine, user_id: Optional[str], session_id: str,
     if conn_or_engine is None: conn_or_engine = engine
     if conn_or_engine is None: return None
 
-    slots_json = json.dumps(slots or {})
-    response_obj = {"reply": reply, "model_text": model_response, "ts": int(time.time())}
-    response_json = json.dumps(response_obj)
-    rag_json = json.dumps(sources or [])
-
-    insert_sql = sa.text("""
-        INSERT INTO voice_queries
-          (user_id, session_id, transcript, audio_url, intent, slots, response, rag_sources, confidence, duration_ms, created_at)
-        VALUES
-          (:user_id, :session_id, :transcript, :audio_url, :intent, :slots::jsonb, :response::jsonb, :rag_sources::jsonb, :confidence, :duration_ms, now())
-        RETURNING id
-    """)
+    insert_sql = voice_query_insert_sql()
+    params = voice_query_params(user_id, session_id, transcript, intent, reply, model_response, sources, model_ms,
+                                audio_url=audio_url, slots=slots, confidence=confidence, duration_ms=duration_ms)
 
     try:
         # Check if we are in a transaction or need to start one
         if hasattr(conn_or_engine, "begin"):
             with conn_or_engine.begin() as conn:
-                res = conn.execute(insert_sql, {
-                    "user_id": user_id, "session_id": session_id, "transcript": transcript, "audio_url": audio_url,
-                    "intent": intent, "slots": slots_json, "response": response_json, "rag_sources": rag_json,
-                    "confidence": confidence, "duration_ms": duration_ms
-                })
+                res = conn.execute(insert_sql, params)
                 return str(res.fetchone()[0])
         else:
-            res = conn_or_engine.execute(insert_sql, {
-                "user_id": user_id, "session_id": session_id, "transcript": transcript, "audio_url": audio_url,
-                "intent": intent, "slots": slots_json, "response": response_json, "rag_sources": rag_json,
-                "confidence": confidence, "duration_ms": duration_ms
-            })
+            res = conn_or_engine.execute(insert_sql, params)
             return str(res.fetchone()[0])
     except Exception as e:
         logger.exception("Failed to insert voice_query: %s", e)
         return None
 
+def insert_voice_queries_bulk(rows: List[Dict[str, Any]]) -> List[str]:
+    """
+    Insert many voice_queries in a single multi-row INSERT. Each row takes the
+    same fields as insert_voice_query(); ids are generated client-side so
+    callers can hand them out without a RETURNING round trip per row.
+    Returns the ids in row order, or [] on failure.
+    """
+    if engine is None or not rows:
+        return []
+
+    cols = ["id", "user_id", "session_id", "transcript", "audio_url", "intent",
+            "slots", "response", "rag_sources", "confidence", "duration_ms"]
+    params: Dict[str, Any] = {}
+    values_sql = []
+    ids = []
+    now_ts = int(time.time())
+    for n, r in enumerate(rows):
+        qid = r.get("id") or str(uuid.uuid4())
+        ids.append(qid)
+        response_obj = {"reply": r.get("reply"), "model_text": r.get("model_response"),
+                        "model_ms": r.get("model_ms"), "ts": now_ts}
+        row_params = {
+            "id": qid, "user_id": r.get("user_id"), "session_id": r.get("session_id"),
+            "transcript": r.get("transcript"), "audio_url": r.get("audio_url"), "intent": r.get("intent"),
+            "slots": json.dumps(r.get("slots") or {}), "response": json.dumps(response_obj),
+            "rag_sources": json.dumps(r.get("sources") or []), "confidence": r.get("confidence"),
+            "duration_ms": r.get("duration_ms"),
+        }
+        placeholders = []
+        for c in cols:
+            name = f"{c}_{n}"
+            params[name] = row_params[c]
+            placeholders.append(_jsonb(name) if c in ("slots", "response", "rag_sources") else f":{name}")
+        values_sql.append(f"({', '.join(placeholders)}, now())")
+
+    insert_sql = sa.text(
+        f"INSERT INTO voice_queries ({', '.join(cols)}, created_at) VALUES " + ", ".join(values_sql)
+    )
+    try:
+        with engine.begin() as conn:
+            conn.execute(insert_sql, params)
+        return ids
+    except Exception as e:
+        logger.exception("Failed to bulk insert %d voice_queries: %s", len(rows), e)
+        return []
+
+# ---------- History (keyset pagination) ----------
+
+def encode_history_cursor(created_at, qid) -> str:
+    ts = created_at.isoformat() if hasattr(created_at, "isoformat") else str(created_at)
+    return base64.urlsafe_b64encode(f"{ts}|{qid}".encode()).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple[str, str]:
+    """Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, qid = raw.split("|", 1)
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not ts or not qid:
+        raise ValueError("invalid cursor")
+    return ts, qid
+
+
+def history_query(user_id: str, limit: int, cursor: Optional[str] = None):
+    """(statement, params) for one /history page; raises ValueError on a bad cursor."""
+    params: Dict[str, Any] = {"uid": user_id, "lim": limit + 1}
+    after = ""
+    if cursor:
+        params["ts"], params["qid"] = decode_history_cursor(cursor)
+        after = f"AND (created_at, id) < ({_cast('ts', 'timestamptz')}, {_cast('qid', 'uuid')})"
+
+    q = sa.text(f"""
+        SELECT id, session_id, transcript, intent, response, rag_sources, confidence, duration_ms, created_at
+        FROM voice_queries
+        WHERE user_id = :uid {after}
+        ORDER BY created_at DESC, id DESC
+        LIMIT :lim
+    """)
+    return q, params
+
+
+def history_page(rows, limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Rows fetched with history_query() -> (page, next cursor or None)."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_history_cursor(rows[-1][8], rows[-1][0])
+
+    result = []
+    for r in rows:
+        result.append({
+            "id": str(r[0]),
+            "session_id": r[1],
+            "transcript": r[2],
+            "intent": r[3],
+            "response": r[4],
+            "rag_sources": r[5],
+            "confidence": r[6],
+            "duration_ms": r[7],
+            "created_at": r[8].isoformat() if hasattr(r[8], "isoformat") else r[8]
+        })
+    return result, next_cursor
+
+
+def get_voice_query_history(user_id: str, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of a user's voice_queries, newest first, plus the cursor for the
+    next page (None on the last page). Keyset on (created_at, id) so each page
+    is an index range scan on idx_voice_queries_user_created, however deep.
+    """
+    if engine is None: return [], None
+    q, params = history_query(user_id, limit, cursor)
+    with engine.connect() as conn:
+        rows = conn.execute(q, params).fetchall()
+    return history_page(rows, limit)
+
 # ---------- Order & Context Helpers ----------
 
+ORDER_DB_ERRORS = ("DB Error", "Error checking orders.")
+
+
+def format_order_status(item_name: Optional[str], status: Optional[str]) -> str:
+    return f"Your order for {item_name} is {status}."
+
+
 def get_order_status_by_email(email: str) -> str:
     """Legacy helper, kept for backward compatibility."""
     if engine is None: return "DB Error"
@@ -181,11 +365,37 @@ def get_order_status_by_email(email: str) -> str:
             query = sql_text("SELECT item_name, status, delivery_date FROM orders WHERE user_email = :email ORDER BY id DESC LIMIT 1")
             result = conn.execute(query, {"email": email}).fetchone()
             if result:
-                return f"Your order for {result[0]} is {result[1]}."
+                return format_order_status(result[0], result[1])
             return "No orders found."
     except Exception:
         return "Error checking orders."
 
-# Initialize
-init_db()
-create_tables()
\ No newline at end of file
+
+def get_latest_orders(emails: Optional[List[str]] = None, exclude_statuses: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    Latest order summary per email in one query: for `emails` when given,
+    else for every customer whose latest order status is not excluded.
+    Returns {email: summary}; emails without orders are absent.
+    """
+    if engine is None: return {}
+    params: Dict[str, Any] = {}
+    inner_where = outer_where = ""
+    if emails is not None:
+        if not emails:
+            return {}
+        inner_where = "WHERE user_email IN :emails"
+        params["emails"] = list(emails)
+    if exclude_statuses:
+        outer_where = "WHERE o.status NOT IN :excluded"
+        params["excluded"] = list(exclude_statuses)
+    query = sql_text(f"""
+        SELECT o.user_email, o.item_name, o.status
+        FROM orders o
+        JOIN (SELECT user_email, max(id) AS id FROM orders {inner_where} GROUP BY user_email) latest ON latest.id = o.id
+        {outer_where}
+    """)
+    for name in ("emails", "excluded"):
+        if name in params:
+            query = query.bindparams(sa.bindparam(name, expanding=True))
+    with engine.connect() as conn:
+        return {r[0]: format_order_status(r[1], r[2]) for r in conn.execute(query, params)}
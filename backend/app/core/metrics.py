@@ -0,0 +1,246 @@
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import g, has_request_context, request
+
+from app.config import Config
+
+logger = logging.getLogger("voicebot")
+
+# Pipeline stages we time for every /query. Anything else passed to
+# timed()/record_stage() is still tracked, these are just declared up front
+# so /metrics always lists them (even before the first request).
+STAGES = (
+    "auth",
+    "user_upsert",
+    "asr_partial",
+    "asr_final",
+    "nlu",
+    "embed",
+    "faiss_search",
+    "rerank",
+    "context_build",
+    "llm",
+    "persist",
+    "request",
+)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+COUNTER_HELP = {
+    "requests_total": "Requests served, by endpoint.",
+    "cache_hits_total": "Cache lookups that returned a value, by cache.",
+    "cache_misses_total": "Cache lookups that missed, by cache.",
+    "fallbacks_total": "Replies served from a fallback path, by kind.",
+    "gemini_retries_total": "Gemini calls retried after ResourceExhausted.",
+    "session_reuse_total": "Turns that reused the previous turn's retrieval, by kind.",
+    "admission_total": "Admission decisions, by stage and decision.",
+    "admission_shed_total": "Requests answered 503 by admission control, by stage.",
+    "rerank_skips_total": "Re-ranks skipped because they would exceed RERANK_BUDGET_MS.",
+    "slow_requests_total": "Requests over PROFILER_SLOW_MS, by whether a profile was captured.",
+    "asr_prefetch_total": "Streamed utterances by reuse of partial-transcript NLU/retrieval (exact, prefix, none).",
+}
+
+
+# ---------- Rolling latency histogram ----------
+
+class RollingHistogram:
+    """
+    Keeps the last `size` observations (in ms) and computes quantiles on read.
+    Reads are rare (/metrics scrapes) and writes are hot, so we keep writes O(1)
+    and pay the sort on snapshot.
+    """
+
+    def __init__(self, size: int):
+        self._samples = deque(maxlen=size)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms: float):
+        with self._lock:
+            self._samples.append(ms)
+            self._count += 1
+            self._sum += ms
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total = self._count, self._sum
+        snap = {"count": count, "sum": total}
+        for q in QUANTILES:
+            if samples:
+                idx = min(len(samples) - 1, int(round(q * (len(samples) - 1))))
+                snap[q] = samples[idx]
+            else:
+                snap[q] = 0.0
+        return snap
+
+
+_HISTOGRAMS: Dict[str, RollingHistogram] = {}
+_COUNTERS: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+# name -> (help, fn returning {labels_tuple: value}); read at scrape time
+_GAUGES: Dict[str, Tuple[str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = {}
+_lock = threading.Lock()
+
+# Per-request stage breakdown outside Flask (the ASGI app). The dict is shared
+# by the request's task and the executor calls it makes with a copied context.
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def _histogram(stage: str) -> RollingHistogram:
+    h = _HISTOGRAMS.get(stage)
+    if h is None:
+        with _lock:
+            h = _HISTOGRAMS.setdefault(stage, RollingHistogram(Config.METRICS_WINDOW))
+    return h
+
+
+for _s in STAGES:
+    _histogram(_s)
+
+
+# ---------- Recording ----------
+
+def record_stage(stage: str, ms: float):
+    """
+    Record one stage duration into the rolling histogram and, when called
+    inside a request, into the per-request breakdown used for the
+    Server-Timing header.
+    """
+    _histogram(stage).observe(ms)
+    if has_request_context():
+        timings = g.setdefault("stage_timings", {})
+    else:
+        timings = _request_timings.get()
+        if timings is None:
+            return
+    timings[stage] = timings.get(stage, 0.0) + ms
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, (time.perf_counter() - start) * 1000)
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+
+def register_gauge(name: str, help_text: str, fn):
+    """Expose a live value on /metrics; `fn` returns {labels_tuple: value}."""
+    _GAUGES[name] = (help_text, fn)
+
+
+def record_cache(cache: str, hit: bool):
+    inc("cache_hits_total" if hit else "cache_misses_total", cache=cache)
+
+
+def stage_timings() -> Dict[str, float]:
+    """Stage breakdown (ms) for the current request, empty outside one."""
+    if not has_request_context():
+        return dict(_request_timings.get() or {})
+    return dict(g.get("stage_timings", {}))
+
+
+def start_request_timings() -> Dict[str, float]:
+    """Begin a per-request breakdown in the current context (non-Flask servers)."""
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def stage_snapshot() -> Dict[str, Dict[str, float]]:
+    return {stage: h.snapshot() for stage, h in list(_HISTOGRAMS.items())}
+
+
+# ---------- Export ----------
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in timings.items())
+
+
+def _fmt_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def render_prometheus() -> str:
+    """
+    Prometheus text exposition. Values are per worker process; with several
+    gunicorn workers the scraper sees whichever worker served the scrape.
+    """
+    lines = [
+        "# HELP voicebot_stage_latency_ms Rolling per-stage latency (ms).",
+        "# TYPE voicebot_stage_latency_ms summary",
+    ]
+    for stage, snap in sorted(stage_snapshot().items()):
+        for q in QUANTILES:
+            lines.append(f'voicebot_stage_latency_ms{{stage="{stage}",quantile="{q}"}} {snap[q]:.3f}')
+        lines.append(f'voicebot_stage_latency_ms_sum{{stage="{stage}"}} {snap["sum"]:.3f}')
+        lines.append(f'voicebot_stage_latency_ms_count{{stage="{stage}"}} {snap["count"]}')
+
+    with _lock:
+        counters = dict(_COUNTERS)
+    for name, help_text in COUNTER_HELP.items():
+        lines.append(f"# HELP voicebot_{name} {help_text}")
+        lines.append(f"# TYPE voicebot_{name} counter")
+        series = [(labels, v) for (n, labels), v in counters.items() if n == name]
+        if not series:
+            lines.append(f"voicebot_{name} 0")
+        for labels, v in sorted(series):
+            lines.append(f"voicebot_{name}{_fmt_labels(labels)} {v:g}")
+
+    for name, (help_text, fn) in sorted(_GAUGES.items()):
+        try:
+            values = fn()
+        except Exception as e:
+            logger.warning("Gauge %s failed: %s", name, e)
+            continue
+        lines.append(f"# HELP voicebot_{name} {help_text}")
+        lines.append(f"# TYPE voicebot_{name} gauge")
+        for labels, v in sorted(values.items()):
+            lines.append(f"voicebot_{name}{_fmt_labels(labels)} {v:g}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Flask wiring ----------
+
+def init_metrics(app):
+    """
+    Time every request end to end and attach a Server-Timing header with the
+    stage breakdown collected via timed()/record_stage().
+    """
+
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+        g.stage_timings = {}
+
+    @app.after_request
+    def _emit_timing(response):
+        start: Optional[float] = g.get("request_start")
+        if start is None:
+            return response
+        total_ms = (time.perf_counter() - start) * 1000
+        timings = g.get("stage_timings", {})
+        if timings:
+            record_stage("request", total_ms)
+            timings = dict(timings)
+            timings["total"] = total_ms
+            response.headers["Server-Timing"] = server_timing_header(timings)
+            response.headers.add("Access-Control-Expose-Headers", "Server-Timing")
+        inc("requests_total", endpoint=request.endpoint or "unknown")
+        return response
@@ -0,0 +1,168 @@
+import logging
+from typing import List, Optional
+
+import sqlalchemy as sa
+from sqlalchemy import text as sql_text
+from sqlalchemy.pool import NullPool
+
+from app.config import Config
+from app.core import database
+
+logger = logging.getLogger("voicebot")
+
+# Arbitrary constant for pg_advisory_lock so only one worker migrates at a time.
+_MIGRATION_LOCK_ID = 734_201_906
+
+
+class Migration:
+    """
+    One schema change. `index` migrations are built with CREATE INDEX
+    CONCURRENTLY on Postgres (outside a transaction, no table lock); plain
+    migrations run their statements in a single transaction.
+    `postgres_only` migrations are recorded but not executed on other backends.
+    """
+
+    def __init__(self, version: int, name: str, statements: Optional[List[str]] = None,
+                 index: Optional[str] = None, definition: Optional[str] = None,
+                 postgres_only: bool = False):
+        self.version = version
+        self.name = name
+        self.statements = statements or []
+        self.index = index
+        self.definition = definition
+        self.postgres_only = postgres_only
+
+
+# Append only. Never edit or renumber a migration that has shipped.
+MIGRATIONS: List[Migration] = [
+    # /history: WHERE user_id = ? ORDER BY created_at DESC, id DESC (keyset)
+    Migration(1, "voice_queries_user_created_idx",
+              index="idx_voice_queries_user_created",
+              definition="voice_queries (user_id, created_at DESC, id DESC)"),
+    # get_order_status_by_email: WHERE user_email = ? ORDER BY id DESC LIMIT 1
+    Migration(2, "orders_user_email_idx",
+              index="idx_orders_user_email_id",
+              definition="orders (user_email, id DESC)"),
+    # Order-status cache invalidation: NOTIFY orders_changed with the email
+    Migration(3, "orders_change_notify", postgres_only=True, statements=[
+        """
+        CREATE OR REPLACE FUNCTION notify_order_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_email IS NOT NULL THEN
+                PERFORM pg_notify('orders_changed', NEW.user_email);
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.user_email IS NOT NULL
+               AND (TG_OP = 'DELETE' OR OLD.user_email IS DISTINCT FROM NEW.user_email) THEN
+                PERFORM pg_notify('orders_changed', OLD.user_email);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS orders_change_notify ON orders",
+        """
+        CREATE TRIGGER orders_change_notify
+        AFTER INSERT OR UPDATE OR DELETE ON orders
+        FOR EACH ROW EXECUTE FUNCTION notify_order_change()
+        """,
+    ]),
+    # Session context: optimistic concurrency between workers' write-behind flushes
+    Migration(4, "chat_sessions_version", postgres_only=True, statements=[
+        "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 0",
+    ]),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(sql_text("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version integer PRIMARY KEY,
+        name text NOT NULL,
+        applied_at timestamp DEFAULT CURRENT_TIMESTAMP
+    )
+    """))
+
+
+def current_version(conn) -> int:
+    row = conn.execute(sql_text("SELECT max(version) FROM schema_migrations")).fetchone()
+    return int(row[0]) if row and row[0] is not None else 0
+
+
+def _apply_index(conn, m: Migration, is_pg: bool):
+    if is_pg:
+        # A failed CONCURRENTLY build leaves an INVALID index behind that
+        # IF NOT EXISTS would happily skip; drop it and rebuild.
+        invalid = conn.execute(sql_text("""
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name AND NOT i.indisvalid
+        """), {"name": m.index}).fetchone()
+        if invalid:
+            logger.warning("Dropping invalid index %s before rebuilding", m.index)
+            conn.execute(sql_text(f"DROP INDEX CONCURRENTLY IF EXISTS {m.index}"))
+        conn.execute(sql_text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {m.index} ON {m.definition}"))
+    else:
+        conn.execute(sql_text(f"CREATE INDEX IF NOT EXISTS {m.index} ON {m.definition}"))
+
+
+def run_migrations(engine: Optional[sa.engine.Engine] = None, target: Optional[int] = None) -> int:
+    """
+    Apply pending migrations up to `target` (default: latest) and record each
+    applied version in schema_migrations. Safe to call from every worker at
+    startup. Returns the schema version afterwards (-1 when the DB is unavailable).
+
+    Without an explicit `engine`, Postgres migrations run on a short-lived
+    engine for MIGRATIONS_DATABASE_URL (see Config): the advisory lock is
+    held by one server session, which a transaction-mode pooler does not give.
+    """
+    own_engine = None
+    if engine is None:
+        engine = database.engine
+        if engine is not None and engine.dialect.name == "postgresql":
+            url = Config.MIGRATIONS_DATABASE_URL or database.direct_url(Config.DATABASE_URL)
+            if url and url != Config.DATABASE_URL:
+                engine = own_engine = sa.create_engine(url, poolclass=NullPool)
+    if engine is None:
+        logger.warning("Engine is None; skipping run_migrations()")
+        return -1
+    is_pg = engine.dialect.name == "postgresql"
+    if is_pg and database.is_pooled_url(engine.url.render_as_string(hide_password=False)):
+        logger.error("Migrations need a direct (non-pooler) connection; set MIGRATIONS_DATABASE_URL. Skipping.")
+        return -1
+
+    try:
+        # AUTOCOMMIT: CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if is_pg:
+                conn.execute(sql_text("SELECT pg_advisory_lock(:id)"), {"id": _MIGRATION_LOCK_ID})
+            try:
+                _ensure_version_table(conn)
+                version = current_version(conn)
+                for m in MIGRATIONS:
+                    if m.version <= version or (target is not None and m.version > target):
+                        continue
+                    logger.info("Applying migration %d: %s", m.version, m.name)
+                    if m.postgres_only and not is_pg:
+                        conn.execute(sql_text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                                     {"v": m.version, "n": m.name})
+                    elif m.index:
+                        _apply_index(conn, m, is_pg)
+                        conn.execute(sql_text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                                     {"v": m.version, "n": m.name})
+                    else:
+                        # Separate transactional connection; `conn` is autocommit.
+                        with engine.begin() as tx:
+                            for stmt in m.statements:
+                                tx.execute(sql_text(stmt))
+                            tx.execute(sql_text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                                       {"v": m.version, "n": m.name})
+                    version = m.version
+                return version
+            finally:
+                if is_pg:
+                    conn.execute(sql_text("SELECT pg_advisory_unlock(:id)"), {"id": _MIGRATION_LOCK_ID})
+    except Exception as e:
+        logger.exception("run_migrations() failed: %s", e)
+        return -1
+    finally:
+        if own_engine is not None:
+            own_engine.dispose()
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Optional, Dict, Any, List
+
+from flask import g, request
+
+from app.config import Config
+from app.core.metrics import inc, stage_timings
+
+logger = logging.getLogger("voicebot")
+
+# Sampling profiler over sys._current_frames(): one daemon thread per worker
+# snapshots every thread's stack at a fixed interval. Output is the collapsed
+# stack format ("frame;frame;frame count") read by flamegraph.pl, speedscope
+# and friends. Cost is one stack walk per thread per tick, so it stays cheap
+# at the low background rate used for slow-request capture.
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame, max_depth: int) -> str:
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class ProfileSession:
+    """One on-demand profile: ends after `seconds` or `requests`, whichever comes first."""
+
+    def __init__(self, seconds: Optional[float], requests: Optional[int], interval_ms: float):
+        self.started = time.time()
+        self.deadline = self.started + seconds if seconds else None
+        self.max_requests = requests
+        self.interval_s = interval_ms / 1000
+        self.requests = 0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def done(self) -> bool:
+        if self.deadline is not None and time.time() >= self.deadline:
+            return True
+        return self.max_requests is not None and self.requests >= self.max_requests
+
+    def status(self) -> Dict[str, Any]:
+        return {"started": int(self.started), "deadline": int(self.deadline) if self.deadline else None,
+                "requests": self.requests, "max_requests": self.max_requests,
+                "samples": self.samples, "interval_ms": self.interval_s * 1000}
+
+
+class Profiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.session: Optional[ProfileSession] = None
+        # thread id -> stacks sampled while that thread serves a request
+        self._active: Dict[int, Counter] = {}
+        self._last_slow_capture = 0.0
+
+    # ----- sampling thread -----
+
+    def start_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    def _interval(self) -> Optional[float]:
+        session = self.session
+        if session is not None:
+            return session.interval_s
+        if Config.PROFILER_SLOW_MS > 0 and Config.PROFILER_BACKGROUND_HZ > 0:
+            return 1.0 / Config.PROFILER_BACKGROUND_HZ
+        return None
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            interval = self._interval()
+            if interval is None:
+                # Nothing to sample for; sleep until a session starts
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(interval)
+            frames = sys._current_frames()
+            with self._lock:
+                session = self.session
+                for tid, frame in frames.items():
+                    if tid == own:
+                        continue
+                    per_request = self._active.get(tid)
+                    if session is None and per_request is None:
+                        continue
+                    stack = _collapse(frame, Config.PROFILER_MAX_DEPTH)
+                    if session is not None:
+                        session.stacks[stack] += 1
+                        session.samples += 1
+                    if per_request is not None:
+                        per_request[stack] += 1
+            if session is not None and session.done():
+                self.stop()
+
+    # ----- on-demand sessions -----
+
+    def start(self, seconds: Optional[float] = None, requests: Optional[int] = None,
+              interval_ms: Optional[float] = None) -> Dict[str, Any]:
+        if not seconds and not requests:
+            seconds = Config.PROFILER_DEFAULT_SECONDS
+        # A request-count session still ends by PROFILER_MAX_SECONDS, e.g. on an idle worker
+        seconds = min(seconds or Config.PROFILER_MAX_SECONDS, Config.PROFILER_MAX_SECONDS)
+        interval_ms = max(interval_ms or Config.PROFILER_INTERVAL_MS, Config.PROFILER_MIN_INTERVAL_MS)
+        session = ProfileSession(seconds, requests, interval_ms)
+        with self._lock:
+            if self.session is not None:
+                raise RuntimeError("a profile is already running")
+            self.session = session
+        self.start_thread()
+        self._wake.set()
+        logger.info("Profiler started (seconds=%s, requests=%s, interval=%.1fms)", seconds, requests, interval_ms)
+        return session.status()
+
+    def stop(self) -> Optional[str]:
+        """End the running session and write its profile; returns the file path."""
+        with self._lock:
+            session, self.session = self.session, None
+        if session is None:
+            return None
+        path = _write_profile("profile", session.stacks, {
+            **session.status(), "ended": int(time.time()), "pid": os.getpid(),
+        })
+        logger.info("Profiler stopped: %d samples over %d requests -> %s", session.samples, session.requests, path)
+        return path
+
+    # ----- per-request hooks -----
+
+    def request_started(self):
+        if Config.PROFILER_SLOW_MS > 0 or self.session is not None:
+            with self._lock:
+                self._active[threading.get_ident()] = Counter()
+
+    def request_finished(self, duration_ms: float, status: int):
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+            session = self.session
+            if session is not None:
+                session.requests += 1
+        if session is not None and session.done():
+            self.stop()
+
+        if stacks is None or Config.PROFILER_SLOW_MS <= 0 or duration_ms < Config.PROFILER_SLOW_MS:
+            return
+        now = time.monotonic()
+        if now - self._last_slow_capture < Config.PROFILER_SLOW_MIN_INTERVAL_S:
+            inc("slow_requests_total", captured="rate_limited")
+            return
+        self._last_slow_capture = now
+        inc("slow_requests_total", captured="yes")
+        _write_profile("slow", stacks, {
+            "method": request.method, "path": request.path, "endpoint": request.endpoint,
+            "status": status, "duration_ms": round(duration_ms, 1),
+            "stages_ms": {k: round(v, 1) for k, v in stage_timings().items()},
+            "samples": sum(stacks.values()), "pid": os.getpid(), "ts": int(time.time()),
+        })
+
+    def request_teardown(self):
+        # after_request is skipped on unhandled errors; never leave a thread registered
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def status(self) -> Dict[str, Any]:
+        session = self.session
+        return {
+            "pid": os.getpid(),
+            "session": session.status() if session is not None else None,
+            "slow_ms": Config.PROFILER_SLOW_MS,
+            "background_hz": Config.PROFILER_BACKGROUND_HZ,
+            "files": list_profiles(),
+        }
+
+
+# ---------- Output ----------
+
+def _write_profile(kind: str, stacks: Counter, info: Dict[str, Any]) -> Optional[str]:
+    """
+    <kind>-<time>-<pid>.collapsed plus a .json sidecar (request, stage
+    breakdown, sample counts). Oldest files beyond PROFILER_MAX_FILES are removed.
+    """
+    try:
+        os.makedirs(Config.PROFILER_DIR, exist_ok=True)
+        base = os.path.join(Config.PROFILER_DIR,
+                            f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{os.getpid()}")
+        with open(base + ".collapsed", "w", encoding="utf8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(base + ".json", "w", encoding="utf8") as f:
+            json.dump(info, f, indent=2)
+        _rotate()
+        return base + ".collapsed"
+    except Exception as e:
+        logger.warning("Writing %s profile failed: %s", kind, e)
+        return None
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:  # removed by another worker's rotation
+        return 0.0
+
+
+def _profile_files() -> List[str]:
+    """.collapsed files in PROFILER_DIR, oldest first."""
+    if not os.path.isdir(Config.PROFILER_DIR):
+        return []
+    paths = [os.path.join(Config.PROFILER_DIR, f) for f in os.listdir(Config.PROFILER_DIR) if f.endswith(".collapsed")]
+    return sorted(paths, key=_mtime)
+
+
+def list_profiles() -> List[str]:
+    return [os.path.basename(p) for p in reversed(_profile_files())]
+
+
+def _rotate():
+    files = _profile_files()
+    for path in files[:max(0, len(files) - Config.PROFILER_MAX_FILES)]:
+        for p in (path, path[:-len(".collapsed")] + ".json"):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+PROFILER = Profiler()
+
+
+def init_profiler(app):
+    """
+    Per-request hooks for slow-request capture and request-count sessions.
+    Register after init_metrics so g.request_start is already set.
+    """
+    if not Config.PROFILER_ENABLED:
+        return
+
+    @app.before_request
+    def _profile_start():
+        PROFILER.request_started()
+
+    @app.after_request
+    def _profile_finish(response):
+        start = g.get("request_start")
+        if start is not None:
+            PROFILER.request_finished((time.perf_counter() - start) * 1000, response.status_code)
+        return response
+
+    @app.teardown_request
+    def _profile_teardown(_exc):
+        PROFILER.request_teardown()
+
+    if Config.PROFILER_SLOW_MS > 0 and Config.PROFILER_BACKGROUND_HZ > 0:
+        PROFILER.start_thread()
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
+
+import numpy as np
+
+from app.config import Config
+from app.core.metrics import record_cache
+from app.services import rag
+
+logger = logging.getLogger("voicebot")
+
+# Answers to context-free open questions, keyed by normalised transcript.
+# Only turns without session history are cached: with history the prompt (and
+# so the answer) depends on the conversation, not just the question.
+_cache: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _key(transcript: str, scope: Optional[str]) -> str:
+    key = rag.normalise_transcript(transcript)
+    return f"{scope}|{key}" if scope and key else key
+
+
+def get_answer(transcript: str, scope: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Cached {"reply", "model_text", "sources"} for a transcript, or None.
+    `scope` names the collections searched when a query routes explicitly.
+    """
+    if Config.ANSWER_CACHE_TTL_S <= 0:
+        return None
+    key = _key(transcript, scope)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry[1] > now:
+            _cache.move_to_end(key)
+            hit = entry[0]
+        else:
+            hit = None
+            if entry:
+                _cache.pop(key, None)
+    record_cache("answer", hit is not None)
+    return hit
+
+
+def store_answer(transcript: str, reply: str, model_text: Optional[str], sources: List[Dict[str, Any]],
+                 ttl_s: Optional[float] = None, scope: Optional[str] = None):
+    if Config.ANSWER_CACHE_TTL_S <= 0:
+        return
+    key = _key(transcript, scope)
+    if not key:
+        return
+    entry = {"reply": reply, "model_text": model_text,
+             "sources": [{"id": s.get("id"), "source": s.get("source"), "score": s.get("score"),
+                          "collection": s.get("collection")} for s in sources or []]}
+    with _lock:
+        _cache[key] = (entry, time.monotonic() + (ttl_s or Config.ANSWER_CACHE_TTL_S))
+        _cache.move_to_end(key)
+        while len(_cache) > Config.ANSWER_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def clear():
+    """Drop every cached answer (e.g. after the index was reloaded)."""
+    with _lock:
+        _cache.clear()
+
+
+# ---------- Warm-up set (written by python -m analytics.job) ----------
+
+def load_warmup(warmup_dir: str = Config.WARMUP_DIR) -> Tuple[int, int]:
+    """
+    Seed the embedding and answer caches from the analytics warm-up set.
+    Embeddings are used only if they came from the same embedding model and
+    answers only if they were taken against the same index build.
+    Returns (embeddings seeded, answers seeded).
+    """
+    n_emb = n_ans = 0
+    manifest_path = os.path.join(warmup_dir, "warmup.json")
+    if not os.path.exists(manifest_path):
+        return 0, 0
+    try:
+        with open(manifest_path, "r", encoding="utf8") as f:
+            manifest = json.load(f)
+
+        emb_path = os.path.join(warmup_dir, "embeddings.npz")
+        if manifest.get("embed_model") != Config.EMBED_MODEL_NAME:
+            logger.warning("Warm-up embeddings are from %s, not %s; skipped.",
+                           manifest.get("embed_model"), Config.EMBED_MODEL_NAME)
+        elif os.path.exists(emb_path) and Config.EMBED_CACHE_MAX > 0:
+            data = np.load(emb_path)
+            texts = [str(t) for t in data["texts"]][:Config.EMBED_CACHE_MAX]
+            rag.seed_embeddings(texts, data["embeddings"][:len(texts)])
+            n_emb = len(texts)
+
+        if manifest.get("index_fingerprint") != rag.INDEX_FINGERPRINT:
+            logger.warning("Warm-up answers were taken against another index build; skipped.")
+        else:
+            for a in manifest.get("answers", [])[:Config.ANSWER_CACHE_MAX_ENTRIES]:
+                store_answer(a["text"], a["reply"], a.get("model_text"), a.get("sources") or [])
+                n_ans += 1
+    except Exception as e:
+        logger.exception("Loading warm-up set from %s failed: %s", warmup_dir, e)
+    logger.info("Warm-up: %d embeddings, %d answers.", n_emb, n_ans)
+    return n_emb, n_ans
+
+
+def init_answer_cache():
+    if Config.WARMUP_ON_START:
+        load_warmup()
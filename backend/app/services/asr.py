@@ -0,0 +1,280 @@
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any
+
+import numpy as np
+
+from app.config import Config
+from app.core.metrics import timed, inc
+
+logger = logging.getLogger("voicebot")
+
+# faster-whisper (optional; CPU int8 whisper)
+try:
+    from faster_whisper import WhisperModel
+    FASTER_WHISPER_AVAILABLE = True
+except Exception:
+    WhisperModel = None
+    FASTER_WHISPER_AVAILABLE = False
+
+SAMPLE_WIDTH = 2  # s16le
+
+
+# ---------- ASR backends ----------
+
+class StubASR:
+    """
+    Test/bench backend: reveals Config.ASR_STUB_TEXT word by word in
+    proportion to the audio received, so partials behave like a real model.
+    """
+
+    def __init__(self, text: str, words_per_second: float = 2.5):
+        self.words = text.split()
+        self.words_per_second = words_per_second
+
+    def transcribe(self, audio: np.ndarray, sample_rate: int) -> str:
+        n = int(len(audio) / sample_rate * self.words_per_second) + 1
+        return " ".join(self.words[:n])
+
+
+class WhisperASR:
+    """
+    CTranslate2 runs up to `workers` transcribe() calls in parallel on one
+    loaded model, so streams only queue once that many are in flight.
+    """
+
+    def __init__(self, model_name: str, workers: int = 1):
+        self.model = WhisperModel(model_name, device="cpu", compute_type="int8", num_workers=max(1, workers))
+
+    def transcribe(self, audio: np.ndarray, sample_rate: int) -> str:
+        if sample_rate != 16000:
+            # whisper expects 16 kHz; linear resample is plenty for speech
+            n = int(len(audio) * 16000 / sample_rate)
+            audio = np.interp(np.linspace(0, len(audio), n, endpoint=False), np.arange(len(audio)), audio)
+        segments, _ = self.model.transcribe(audio.astype(np.float32), beam_size=1, language=Config.ASR_LANGUAGE)
+        return " ".join(s.text.strip() for s in segments).strip()
+
+
+ASR_BACKEND = None
+_prefetch_pool: Optional[ThreadPoolExecutor] = None
+_partial_pool: Optional[ThreadPoolExecutor] = None
+
+
+def init_asr():
+    global ASR_BACKEND, _prefetch_pool, _partial_pool
+    backend = Config.ASR_BACKEND
+    try:
+        if backend == "stub":
+            ASR_BACKEND = StubASR(Config.ASR_STUB_TEXT)
+        elif backend == "whisper":
+            if not FASTER_WHISPER_AVAILABLE:
+                logger.warning("faster-whisper not available; streaming audio disabled.")
+                return
+            logger.info("Loading ASR model: %s", Config.ASR_MODEL)
+            ASR_BACKEND = WhisperASR(Config.ASR_MODEL, workers=Config.ASR_WORKERS)
+        else:
+            return
+    except Exception as e:
+        logger.exception("ASR init failed: %s", e)
+        ASR_BACKEND = None
+        return
+    _prefetch_pool = ThreadPoolExecutor(max_workers=Config.ASR_PREFETCH_WORKERS, thread_name_prefix="asr-prefetch")
+    _partial_pool = ThreadPoolExecutor(max_workers=Config.ASR_WORKERS, thread_name_prefix="asr-partial")
+
+
+def asr_available() -> bool:
+    return ASR_BACKEND is not None
+
+
+def parse_wav_header(head: bytes):
+    """
+    (sample_rate, data_offset) for a RIFF/WAVE stream, (None, 0) for raw PCM.
+    Raises ValueError for anything but 16-bit PCM mono, the only layout the
+    VAD and the model read.
+    """
+    if not (head[:4] == b"RIFF" and head[8:12] == b"WAVE"):
+        return None, 0
+    sample_rate = None
+    pos = 12
+    while pos + 8 <= len(head):
+        chunk_id = head[pos:pos + 4]
+        size = int.from_bytes(head[pos + 4:pos + 8], "little")
+        if chunk_id == b"fmt " and pos + 24 <= len(head):
+            fmt = head[pos + 8:pos + 24]
+            audio_format = int.from_bytes(fmt[0:2], "little")
+            channels = int.from_bytes(fmt[2:4], "little")
+            bits = int.from_bytes(fmt[14:16], "little")
+            # 0xFFFE: WAVE_FORMAT_EXTENSIBLE, which 16-bit PCM writers also use
+            if audio_format not in (1, 0xFFFE) or channels != 1 or bits != 16:
+                raise ValueError(f"unsupported WAV audio (format {audio_format}, {channels} channel(s), "
+                                 f"{bits}-bit); send 16-bit PCM mono")
+            sample_rate = int.from_bytes(fmt[4:8], "little") or None
+        elif chunk_id == b"data":
+            if sample_rate is None:
+                raise ValueError("WAV stream has no fmt chunk before its data")
+            return sample_rate, pos + 8
+        pos += 8 + size + (size & 1)
+    if sample_rate is None:
+        raise ValueError("WAV header is truncated")
+    return sample_rate, 44
+
+
+# ---------- Voice activity detection ----------
+
+class EnergyVAD:
+    """
+    Frame-energy VAD: a frame is speech when its RMS clears an adaptive
+    noise floor by ASR_VAD_RATIO. End of utterance = ASR_END_SILENCE_MS of
+    non-speech after some speech.
+    """
+
+    def __init__(self, sample_rate: int, frame_ms: int = 30):
+        self.frame = int(sample_rate * frame_ms / 1000)
+        self.frame_ms = frame_ms
+        self.noise_floor: Optional[float] = None
+        self.speech_ms = 0
+        self.trailing_silence_ms = 0
+
+    def push(self, frames: np.ndarray):
+        for start in range(0, len(frames) - self.frame + 1, self.frame):
+            rms = float(np.sqrt(np.mean(frames[start:start + self.frame] ** 2)) + 1e-9)
+            if self.noise_floor is None:
+                self.noise_floor = rms
+            is_speech = rms > max(self.noise_floor * Config.ASR_VAD_RATIO, Config.ASR_VAD_MIN_RMS)
+            if is_speech:
+                self.speech_ms += self.frame_ms
+                self.trailing_silence_ms = 0
+            else:
+                self.trailing_silence_ms += self.frame_ms
+                # Track the floor only on non-speech so speech does not raise it
+                self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+
+    @property
+    def ended(self) -> bool:
+        return self.speech_ms >= Config.ASR_MIN_SPEECH_MS and self.trailing_silence_ms >= Config.ASR_END_SILENCE_MS
+
+
+# ---------- Streaming session ----------
+
+def _normalise(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9']+", text.lower()))
+
+
+class AudioStream:
+    """
+    Consumes PCM s16le mono chunks as they arrive. Every ASR_PARTIAL_MS of
+    new audio it re-transcribes the buffer on the partial pool, so reading
+    the upload never waits on the model; each new partial transcript
+    speculatively starts NLU + retrieval in the background (`prefetch_fn`) so
+    the work overlaps with the rest of the utterance.
+
+    At most one partial per stream is in flight (intervals that come due
+    meanwhile are skipped), and partials stop once the buffer outgrows
+    ASR_PARTIAL_WINDOW_S: past that only finish() transcribes, which keeps
+    the model time per utterance linear in its length. A transcript of just
+    the tail would not be a prefix of the final one, so its prefetch could
+    never be reused.
+    """
+
+    def __init__(self, sample_rate: int, prefetch_fn=None):
+        self.sample_rate = sample_rate
+        self.prefetch_fn = prefetch_fn
+        self.vad = EnergyVAD(sample_rate)
+        self._chunks = []
+        self._samples = 0
+        self._pending = b""
+        self._last_partial_at = 0
+        self.partial = ""
+        self.partials = 0
+        self._prefetch: Dict[str, Future] = {}
+        self._partial_future: Optional[Future] = None
+        self._finished = False
+        self._lock = threading.Lock()
+
+    @property
+    def duration_ms(self) -> int:
+        return int(self._samples * 1000 / self.sample_rate)
+
+    @property
+    def ended(self) -> bool:
+        return self.vad.ended or self.duration_ms >= Config.ASR_MAX_SECONDS * 1000
+
+    def _audio(self) -> np.ndarray:
+        return np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.float32)
+
+    def feed(self, data: bytes):
+        data = self._pending + data
+        usable = len(data) - len(data) % SAMPLE_WIDTH
+        self._pending = data[usable:]
+        if not usable:
+            return
+        samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        self._chunks.append(samples)
+        self._samples += len(samples)
+        self.vad.push(samples)
+
+        new_ms = (self._samples - self._last_partial_at) * 1000 / self.sample_rate
+        if (new_ms >= Config.ASR_PARTIAL_MS and self.vad.speech_ms > 0 and not self.ended
+                and self.duration_ms <= Config.ASR_PARTIAL_WINDOW_S * 1000
+                and _partial_pool is not None
+                and (self._partial_future is None or self._partial_future.done())):
+            self._last_partial_at = self._samples
+            self._partial_future = _partial_pool.submit(self._run_partial, self._audio())
+
+    def _run_partial(self, audio: np.ndarray):
+        with timed("asr_partial"):
+            text = ASR_BACKEND.transcribe(audio, self.sample_rate)
+        key = _normalise(text)
+        with self._lock:
+            self.partials += 1
+            if self._finished or not key or key == _normalise(self.partial):
+                return
+            self.partial = text
+            if self.prefetch_fn is not None and _prefetch_pool is not None:
+                self._prefetch[key] = _prefetch_pool.submit(self.prefetch_fn, text)
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        Final transcript plus any prefetched results that still apply:
+        an exact (normalised) match reuses NLU and retrieval; a partial that is
+        a prefix covering most of the final words reuses retrieval only.
+        """
+        if self._partial_future is not None:
+            self._partial_future.cancel()
+        with timed("asr_final"):
+            transcript = ASR_BACKEND.transcribe(self._audio(), self.sample_rate) if self._samples else ""
+        with self._lock:
+            # a partial still running now can no longer start a prefetch
+            self._finished = True
+            partials = self.partials
+            prefetch = dict(self._prefetch)
+        result = {"transcript": transcript, "duration_ms": self.duration_ms, "partials": partials,
+                  "prefetched": None, "prefetch": "none"}
+        final_key = _normalise(transcript)
+        final_words = final_key.split()
+
+        fut = prefetch.get(final_key)
+        mode = "exact"
+        if fut is None:
+            mode = "prefix"
+            best = 0
+            for key, f in prefetch.items():
+                words = key.split()
+                if (final_words[:len(words)] == words and len(words) > best
+                        and len(words) >= Config.ASR_PREFETCH_REUSE_RATIO * len(final_words)):
+                    fut, best = f, len(words)
+        if fut is not None:
+            try:
+                prefetched = fut.result(timeout=Config.ASR_PREFETCH_WAIT_S)
+                if mode == "prefix":
+                    prefetched = {"docs": prefetched.get("docs")}
+                result["prefetched"] = prefetched
+                result["prefetch"] = mode
+            except Exception as e:
+                logger.warning("ASR prefetch unusable: %s", e)
+        inc("asr_prefetch_total", result=result["prefetch"])
+        for f in prefetch.values():
+            f.cancel()
+        return result
@@ -0,0 +1,206 @@
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Iterator, Union
+
+from app.config import Config
+from app.core.admission import Overloaded, admit, shed
+from app.core.database import insert_voice_queries_bulk
+from app.core.metrics import timed, inc
+from app.services.nlu import classify_intents_hf
+from app.services.rerank import retrieve_ranked_batch
+from app.services.pipeline import order_reply, rag_reply, public_sources, ERROR_REPLY
+
+logger = logging.getLogger("voicebot")
+
+BatchItem = Union[str, Dict[str, Any]]
+
+# LLM calls for every batch in the process share this pool, so
+# BATCH_LLM_CONCURRENCY caps batch traffic as a whole, not per request.
+_llm_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _batch_llm_pool() -> ThreadPoolExecutor:
+    global _llm_pool
+    if _llm_pool is None:
+        with _pool_lock:
+            if _llm_pool is None:
+                _llm_pool = ThreadPoolExecutor(max_workers=max(1, Config.BATCH_LLM_CONCURRENCY),
+                                               thread_name_prefix="batch-llm")
+    return _llm_pool
+
+
+class _Backoff:
+    """Back-off budget shared by every stage and LLM thread of one batch."""
+
+    def __init__(self, budget_s: float):
+        self.left = budget_s
+        self._lock = threading.Lock()
+
+    def wait(self) -> bool:
+        """Sleep before the next attempt; False once the budget is spent."""
+        with self._lock:
+            if self.left <= 0:
+                return False
+            delay = min(Config.ADMISSION_RETRY_AFTER_S, self.left)
+            self.left -= delay
+        time.sleep(delay)
+        return True
+
+
+def _admitted(stage: str, backoff: _Backoff, fn, *args, **kwargs):
+    """
+    Run fn inside the stage's admission gate. Batch work takes the same
+    slots as /query; when turned away it backs off and tries again, so
+    interactive requests keep priority under load. Raises Overloaded once
+    the batch's BATCH_ADMISSION_MAX_WAIT_S back-off budget is spent.
+    """
+    while True:
+        with admit(stage) as ok:
+            if ok:
+                return fn(*args, **kwargs)
+        if not backoff.wait():
+            shed(stage)
+
+
+def _normalise(items: List[BatchItem], session_id: Optional[str]) -> List[Dict[str, Any]]:
+    out = []
+    for n, item in enumerate(items):
+        if isinstance(item, dict):
+            transcript = (item.get("transcript") or "").strip()
+            sid = item.get("session_id") or session_id
+        else:
+            transcript = (str(item) if item is not None else "").strip()
+            sid = session_id
+        out.append({"index": n, "transcript": transcript, "session_id": sid})
+    return out
+
+
+def _failed(item: Dict[str, Any], error: str, stage: Optional[str] = None) -> Dict[str, Any]:
+    result = {**item, "intent": None, "reply": None, "sources": [], "error": error, "success": False}
+    if stage:
+        result["stage"] = stage
+    return result
+
+
+def _answer_chunk(chunk: List[Dict[str, Any]], email: Optional[str], backoff: _Backoff,
+                  collections: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    texts = [it["transcript"] for it in chunk]
+    results: List[Dict[str, Any]] = [None] * len(chunk)
+    spoken = []
+    for pos, it in enumerate(chunk):
+        if it["transcript"]:
+            spoken.append(pos)
+        else:
+            results[pos] = _failed(it, "empty transcript")
+    if not spoken:
+        return results
+
+    def _nlu():
+        with timed("nlu"):
+            return classify_intents_hf([texts[p] for p in spoken])
+
+    try:
+        nlu = _admitted("nlu", backoff, _nlu)
+    except Overloaded as e:
+        for pos in spoken:
+            results[pos] = _failed(chunk[pos], "overloaded", e.stage)
+        return results
+
+    needs_rag = []
+    for pos, (hf_intent, hf_score) in zip(spoken, nlu):
+        order = order_reply(hf_intent, hf_score, email)
+        if order:
+            results[pos] = {**chunk[pos], "intent": order[0], "reply": order[1], "sources": [], "model_text": None,
+                            "model_ms": None, "success": True}
+        else:
+            needs_rag.append(pos)
+    if not needs_rag:
+        return results
+
+    try:
+        docs_per_item = _admitted("retrieval", backoff, retrieve_ranked_batch, [texts[p] for p in needs_rag],
+                                  top_k=Config.TOP_K, collections=collections)
+    except Overloaded as e:
+        for pos in needs_rag:
+            results[pos] = _failed(chunk[pos], "overloaded", e.stage)
+        return results
+
+    def _generate(pos: int, docs: List[Dict[str, Any]]):
+        try:
+            gen = _admitted("llm", backoff, rag_reply, texts[pos], docs)
+        except Overloaded as e:
+            return pos, _failed(chunk[pos], "overloaded", e.stage)
+        except Exception as e:
+            logger.exception("Batch item %d failed: %s", chunk[pos]["index"], e)
+            inc("fallbacks_total", kind="error")
+            gen = {"reply": ERROR_REPLY, "model_text": None,
+                   "model_ms": None, "success": False}
+        return pos, {**chunk[pos], "intent": "open_question", "sources": docs, **gen}
+
+    # LLM calls are I/O bound; run them concurrently but capped so batches
+    # cannot exhaust the Gemini quota for interactive traffic.
+    for pos, res in _batch_llm_pool().map(lambda args: _generate(*args), zip(needs_rag, docs_per_item)):
+        results[pos] = res
+    return results
+
+
+def run_batch(items: List[BatchItem], user_id: Optional[str] = None, email: Optional[str] = None,
+              session_id: Optional[str] = None, persist: bool = True,
+              chunk_size: int = Config.BATCH_CHUNK_SIZE,
+              collections: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    In-process batch API. Answers `items` (transcripts, or dicts with
+    "transcript" and optional "session_id") chunk by chunk, searching
+    `collections` (default routing when None): NLU, embedding and
+    FAISS search run vectorised per chunk, LLM calls run on a process-wide
+    pool of BATCH_LLM_CONCURRENCY, every stage passes the /query admission
+    gates, and each chunk is persisted with one bulk insert. Once the batch
+    has backed off BATCH_ADMISSION_MAX_WAIT_S in total, work still turned
+    away fails with error "overloaded" and the stage that shed it.
+
+    Yields one result dict per item, in input order, as each chunk finishes.
+    Requires the services to be initialised (create_app() or init_rag/init_llm).
+    """
+    normalised = _normalise(items, session_id)
+    backoff = _Backoff(Config.BATCH_ADMISSION_MAX_WAIT_S)
+    for start in range(0, len(normalised), chunk_size):
+        chunk = normalised[start:start + chunk_size]
+        results = _answer_chunk(chunk, email, backoff, collections)
+
+        ids: List[str] = []
+        if persist:
+            to_persist = [r for r in results if not r.get("error")]
+            with timed("persist"):
+                ids = insert_voice_queries_bulk([{
+                    "user_id": user_id, "session_id": r["session_id"], "transcript": r["transcript"],
+                    "intent": r["intent"], "reply": r["reply"], "model_response": r.get("model_text"),
+                    "sources": r["sources"], "model_ms": r.get("model_ms"),
+                } for r in to_persist])
+            id_by_index = dict(zip((r["index"] for r in to_persist), ids))
+        else:
+            id_by_index = {}
+
+        for r in results:
+            out = {
+                "index": r["index"],
+                "transcript": r["transcript"],
+                "reply": r["reply"],
+                "intent": r["intent"],
+                "sources": public_sources(r["sources"]),
+                "query_id": id_by_index.get(r["index"]),
+            }
+            if r.get("error"):
+                out["error"] = r["error"]
+            if r.get("stage"):
+                out["stage"] = r["stage"]
+            yield out
+
+
+def run_batch_ndjson(items: List[BatchItem], **kwargs) -> Iterator[str]:
+    """run_batch() rendered as NDJSON lines (what /query/batch streams)."""
+    for result in run_batch(items, **kwargs):
+        yield json.dumps(result, ensure_ascii=False) + "\n"
@@ -1,4 +1,5 @@
 import time
+import asyncio
 import logging
 from typing import Optional, List, Dict, Any
 
@@ -6,6 +7,7 @@ from google import genai
 from google.api_core import exceptions as google_exceptions
 
 from app.config import Config
+from app.core.metrics import timed, inc
 from app.services.rag import safe_build_context
 
 logger = logging.getLogger("voicebot")
@@ -24,17 +26,23 @@ def init_llm():
 def generate_with_retry(model_name: str, prompt: str, max_retries: int = 3) -> Optional[str]:
     if not GENAI_CLIENT:
         return None
+    with timed("llm"):
+        return _generate_with_retry(model_name, prompt, max_retries)
 
+def _generation_config() -> Dict[str, Any]:
+    return {
+        "max_output_tokens": Config.MAX_RESPONSE_TOKENS,
+        "temperature": Config.TEMPERATURE,
+    }
+
+def _generate_with_retry(model_name: str, prompt: str, max_retries: int) -> Optional[str]:
     for attempt in range(max_retries):
         try:
             # Send inputs as simple strings/dicts to avoid SDK ValidationErrors
             response = GENAI_CLIENT.models.generate_content(
                 model=model_name,
                 contents=str(prompt),
-                config={
-                    "max_output_tokens": Config.MAX_RESPONSE_TOKENS,
-                    "temperature": Config.TEMPERATURE,
-                }
+                config=_generation_config()
             )
             
             if response.text:
@@ -42,6 +50,7 @@ def generate_with_retry(model_name: str, prompt: str, max_retries: int = 3) -> O
             return None
 
         except google_exceptions.ResourceExhausted:
+            inc("gemini_retries_total")
             time.sleep(2 * (attempt + 1))
         except Exception as e:
             logger.error(f"GenAI Error: {e}")
@@ -49,13 +58,59 @@ def generate_with_retry(model_name: str, prompt: str, max_retries: int = 3) -> O
             
     return None
 
-def call_gemini_rag(question: str, chunks: List[Dict[str, Any]]) -> Optional[str]:
+async def agenerate_with_retry(model_name: str, prompt: str, max_retries: int = 3) -> Optional[str]:
+    """generate_with_retry on the SDK's asyncio client (client.aio): no thread is held while Gemini thinks."""
+    if not GENAI_CLIENT:
+        return None
+    with timed("llm"):
+        for attempt in range(max_retries):
+            try:
+                response = await GENAI_CLIENT.aio.models.generate_content(
+                    model=model_name,
+                    contents=str(prompt),
+                    config=_generation_config()
+                )
+                if response.text:
+                    return response.text.strip()
+                return None
+            except google_exceptions.ResourceExhausted:
+                inc("gemini_retries_total")
+                await asyncio.sleep(2 * (attempt + 1))
+            except Exception as e:
+                logger.error(f"GenAI Error: {e}")
+                return None
+    return None
+
+def _history_block(history: Optional[List[Dict[str, Any]]]) -> str:
+    """Compact recap of the last few turns so follow-ups resolve ("and how much is it?")."""
+    if not history:
+        return ""
+    lines = []
+    for turn in history[-Config.SESSION_PROMPT_TURNS:]:
+        lines.append(f"User: {(turn.get('q') or '')[:200]}")
+        lines.append(f"Assistant: {(turn.get('a') or '')[:300]}")
+    return "CONVERSATION SO FAR:\n" + "\n".join(lines) + "\n\n"
+
+def _rag_prompt(question: str, chunks: List[Dict[str, Any]], history: Optional[List[Dict[str, Any]]]) -> str:
+    with timed("context_build"):
+        context_text, _ = safe_build_context(chunks, question)
+    return f"SYSTEM: You are a helpful assistant. Use these sources to answer.\n\nSOURCES:\n{context_text}\n\n{_history_block(history)}QUESTION: {question}"
+
+def _general_prompt(question: str, history: Optional[List[Dict[str, Any]]]) -> str:
+    return f"SYSTEM: You are a helpful assistant. Answer concisely.\n\n{_history_block(history)}QUESTION: {question}"
+
+def call_gemini_rag(question: str, chunks: List[Dict[str, Any]], history: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
+    if GENAI_CLIENT is None: return None
+    return generate_with_retry(Config.LLM_MODEL, _rag_prompt(question, chunks, history))
+
+def call_gemini_general(question: str, history: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
+    if GENAI_CLIENT is None: return None
+    return generate_with_retry(Config.LLM_MODEL, _general_prompt(question, history))
+
+async def acall_gemini_rag(question: str, chunks: List[Dict[str, Any]], history: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
     if GENAI_CLIENT is None: return None
-    context_text, _ = safe_build_context(chunks, question)
-    prompt = f"SYSTEM: You are a helpful assistant. Use these sources to answer.\n\nSOURCES:\n{context_text}\n\nQUESTION: {question}"
-    return generate_with_retry(Config.LLM_MODEL, prompt)
+    return await agenerate_with_retry(Config.LLM_MODEL, _rag_prompt(question, chunks, history))
 
-def call_gemini_general(question: str) -> Optional[str]:
+async def acall_gemini_general(question: str, history: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
     if GENAI_CLIENT is None: return None
-    prompt = f"SYSTEM: You are a helpful assistant. Answer concisely.\n\nQUESTION: {question}"
-    return generate_with_retry(Config.LLM_MODEL, prompt)
\ No newline at end of file
+    return await agenerate_with_retry(Config.LLM_MODEL, _general_prompt(question, history))
\ No newline at end of file
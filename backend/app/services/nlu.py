@@ -1,4 +1,5 @@
 import logging
+from typing import List, Tuple
 from transformers import pipeline
 
 logger = logging.getLogger("voicebot")
@@ -14,41 +15,41 @@ def load_nlu_model():
     classifier = pipeline("zero-shot-classification", model="valhalla/distilbart-mnli-12-1")
     _model_loaded = True
 
+# --- REFINED LABELS (Stronger Separation) ---
+LABELS_MAP = {
+    # TRACKING (Strong keywords: status, arrive, where, tracking)
+    "check the status of an existing order": "track_order",
+    "track my package delivery": "track_order",
+    "when will my order arrive": "track_order",
+    "where is my shipment": "track_order",
+    "check delivery date": "track_order",
+    
+    # CREATION (Strong keywords: buy, purchase, new, place)
+    "create a new purchase order": "create_order",
+    "buy a new product": "create_order",
+    "place a new order for an item": "create_order",
+    "i want to buy something": "create_order",
+    
+    # COUNTING
+    "count how many orders i have": "count_orders",
+    "total number of orders": "count_orders",
+    
+    # OTHER
+    "say hello": "greeting",
+    "say goodbye": "goodbye",
+    "complain about a problem": "complaint",
+    
+    # FALLBACK
+    "ask a general knowledge question": "general_question"
+}
+
 def is_nlu_model_loaded() -> bool:
     return _model_loaded
 
 def classify_intent_hf(text: str):
     if not classifier: return "general_question", 0.0
     
-    # --- REFINED LABELS (Stronger Separation) ---
-    labels_map = {
-        # TRACKING (Strong keywords: status, arrive, where, tracking)
-        "check the status of an existing order": "track_order",
-        "track my package delivery": "track_order",
-        "when will my order arrive": "track_order",
-        "where is my shipment": "track_order",
-        "check delivery date": "track_order",
-        
-        # CREATION (Strong keywords: buy, purchase, new, place)
-        "create a new purchase order": "create_order",
-        "buy a new product": "create_order",
-        "place a new order for an item": "create_order",
-        "i want to buy something": "create_order",
-        
-        # COUNTING
-        "count how many orders i have": "count_orders",
-        "total number of orders": "count_orders",
-        
-        # OTHER
-        "say hello": "greeting",
-        "say goodbye": "goodbye",
-        "complain about a problem": "complaint",
-        
-        # FALLBACK
-        "ask a general knowledge question": "general_question"
-    }
-    
-    candidate_labels = list(labels_map.keys())
+    candidate_labels = list(LABELS_MAP.keys())
     
     try:
         # "hypothesis_template" helps the model understand the context is a REQUEST
@@ -57,7 +58,7 @@ def classify_intent_hf(text: str):
         top_description = result['labels'][0]
         top_score = result['scores'][0]
         
-        mapped_intent = labels_map.get(top_description, "general_question")
+        mapped_intent = LABELS_MAP.get(top_description, "general_question")
         
         # Debug log
         print(f"🧠 NLU: '{text}' -> '{top_description}' ({top_score:.2f}) -> {mapped_intent}")
@@ -66,4 +67,24 @@ def classify_intent_hf(text: str):
 
     except Exception as e:
         logger.error(f"NLU Error: {e}")
-        return "general_question", 0.0
\ No newline at end of file
+        return "general_question", 0.0
+
+def classify_intents_hf(texts: List[str], batch_size: int = 32) -> List[Tuple[str, float]]:
+    """
+    Batched classify_intent_hf: one pipeline call over all texts so the NLI
+    pairs go through the model in batches instead of one text at a time.
+    """
+    if not texts:
+        return []
+    if not classifier: return [("general_question", 0.0)] * len(texts)
+
+    try:
+        results = classifier(list(texts), list(LABELS_MAP.keys()),
+                             hypothesis_template="The user wants to {}.", batch_size=batch_size)
+        if isinstance(results, dict):
+            results = [results]
+        return [(LABELS_MAP.get(r['labels'][0], "general_question"), r['scores'][0]) for r in results]
+
+    except Exception as e:
+        logger.error(f"NLU batch Error: {e}")
+        return [("general_question", 0.0)] * len(texts)
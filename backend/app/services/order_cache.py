@@ -0,0 +1,199 @@
+import time
+import select
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Tuple
+
+from app.config import Config
+from app.core import database
+from app.core.metrics import record_cache
+
+logger = logging.getLogger("voicebot")
+
+# psycopg2 (optional; only needed for LISTEN/NOTIFY invalidation)
+try:
+    import psycopg2
+    import psycopg2.extensions
+    PSYCOPG2_AVAILABLE = True
+except Exception:
+    psycopg2 = None
+    PSYCOPG2_AVAILABLE = False
+
+NOTIFY_CHANNEL = "orders_changed"
+
+# email -> (summary, expires_at); OrderedDict as a small LRU
+_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_lock = threading.Lock()
+# Bumped on every invalidation so a DB read that raced an invalidation is not cached.
+_generation = 0
+_started = False
+
+
+# ---------- Read-through cache ----------
+
+def _store(email: str, summary: str, generation: Optional[int] = None):
+    with _lock:
+        if generation is not None and generation != _generation:
+            return
+        _cache[email] = (summary, time.monotonic() + Config.ORDER_CACHE_TTL_S)
+        _cache.move_to_end(email)
+        while len(_cache) > Config.ORDER_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def get_order_status_cached(email: str) -> str:
+    """get_order_status_by_email with a short-TTL, change-invalidated cache in front."""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(email)
+        if entry and entry[1] > now:
+            _cache.move_to_end(email)
+            hit = entry[0]
+        else:
+            hit = None
+        generation = _generation
+    if hit is not None:
+        record_cache("order_status", True)
+        return hit
+
+    record_cache("order_status", False)
+    summary = database.get_order_status_by_email(email)
+    if summary not in database.ORDER_DB_ERRORS:
+        _store(email, summary, generation)
+    return summary
+
+
+def invalidate(email: Optional[str] = None):
+    """Drop one email's entry, or everything when email is None."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if email is None:
+            _cache.clear()
+        else:
+            _cache.pop(email, None)
+
+
+def warm_order_cache(emails: Optional[List[str]] = None) -> int:
+    """
+    Pre-load summaries in one query: for `emails`, or by default for every
+    customer whose latest order is still active (not in ORDER_INACTIVE_STATUSES).
+    """
+    try:
+        if emails is None:
+            latest = database.get_latest_orders(exclude_statuses=Config.ORDER_INACTIVE_STATUSES)
+        else:
+            latest = database.get_latest_orders(emails=emails)
+    except Exception as e:
+        logger.exception("Order cache warm-up failed: %s", e)
+        return 0
+    for email, summary in latest.items():
+        _store(email, summary)
+    logger.info("Order cache warmed with %d entries.", len(latest))
+    return len(latest)
+
+
+# ---------- Invalidation: LISTEN/NOTIFY ----------
+
+def _listen_url() -> Optional[str]:
+    """ORDER_CACHE_LISTEN_URL, else DATABASE_URL with Neon's "-pooler" host swapped for the direct one."""
+    return Config.ORDER_CACHE_LISTEN_URL or database.direct_url(Config.DATABASE_URL)
+
+
+def _listen_dsn() -> str:
+    url = _listen_url()
+    # libpq understands postgresql:// URIs but not SQLAlchemy driver suffixes
+    return url.replace("postgresql+psycopg2://", "postgresql://", 1)
+
+
+def _listen_loop():
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(_listen_dsn())
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            # Anything may have changed while we were not listening
+            invalidate()
+            logger.info("Order cache listening on %s", NOTIFY_CHANNEL)
+            backoff = 1
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    invalidate(conn.notifies.pop(0).payload or None)
+        except Exception as e:
+            logger.warning("Order cache listener error (retrying in %ss): %s", backoff, e)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+# ---------- Invalidation: polling fallback ----------
+
+def _poll_loop():
+    """
+    For backends without NOTIFY: re-read the latest order for every cached
+    email in one query per interval and refresh entries that changed.
+    """
+    while True:
+        time.sleep(Config.ORDER_CACHE_POLL_S)
+        with _lock:
+            cached = dict((e, v[0]) for e, v in _cache.items())
+        if not cached:
+            continue
+        try:
+            emails = list(cached.keys())
+            latest = {}
+            for i in range(0, len(emails), 500):
+                latest.update(database.get_latest_orders(emails=emails[i:i + 500]))
+        except Exception as e:
+            logger.warning("Order cache poll failed: %s", e)
+            continue
+        for email, old in cached.items():
+            new = latest.get(email, "No orders found.")
+            if new != old:
+                invalidate(email)
+                _store(email, new)
+
+
+def init_order_cache():
+    """
+    Start the invalidation thread (once per process) and optionally warm the
+    cache. ORDER_CACHE_INVALIDATION: auto | notify | poll | off. "auto" listens
+    on Postgres when the listen URL (see _listen_url) is a direct endpoint, as
+    derived from Neon's "-pooler" URL, and polls behind other poolers.
+    """
+    global _started
+    if _started or Config.ORDER_CACHE_TTL_S <= 0:
+        return
+    _started = True
+    engine = database.engine
+    mode = Config.ORDER_CACHE_INVALIDATION
+    if mode == "auto":
+        # LISTEN through a transaction-mode pooler never sees a notification
+        is_pg = engine is not None and engine.dialect.name == "postgresql"
+        direct = not database.is_pooled_url(_listen_url())
+        mode = "notify" if is_pg and direct and PSYCOPG2_AVAILABLE else "poll"
+        logger.info("Order cache invalidation auto-selected %s (postgres=%s, direct listen url=%s)", mode, is_pg, direct)
+    if mode == "notify" and not PSYCOPG2_AVAILABLE:
+        logger.warning("psycopg2 not available; order cache falls back to polling.")
+        mode = "poll"
+
+    if mode == "notify":
+        threading.Thread(target=_listen_loop, name="order-cache-listen", daemon=True).start()
+    elif mode == "poll":
+        threading.Thread(target=_poll_loop, name="order-cache-poll", daemon=True).start()
+    logger.info("Order cache invalidation: %s", mode)
+
+    if Config.ORDER_CACHE_WARM:
+        threading.Thread(target=warm_order_cache, name="order-cache-warm", daemon=True).start()
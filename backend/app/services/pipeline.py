@@ -0,0 +1,85 @@
+import time
+import logging
+from typing import Optional, List, Dict, Any, Tuple
+
+from app.services.order_cache import get_order_status_cached
+from app.core.metrics import inc
+from app.services.llm import call_gemini_rag, call_gemini_general, acall_gemini_rag, acall_gemini_general
+
+logger = logging.getLogger("voicebot")
+
+# Decision + answer steps shared by /query and the batch API, so both paths
+# answer a transcript the same way.
+
+# Canned replies of the fallback paths (the analytics job counts these)
+NO_ANSWER_REPLY = "I don't know the answer to that right now."
+ERROR_REPLY = "Internal server error processing your request."
+TOP_CHUNK_PREFIX = "I found info in "
+
+
+def is_fallback_reply(reply: Optional[str]) -> bool:
+    if not reply:
+        return True
+    return reply in (NO_ANSWER_REPLY, ERROR_REPLY) or reply.startswith(TOP_CHUNK_PREFIX) or reply.startswith("DEBUG_GENAI_ERROR")
+
+
+def order_reply(hf_intent: str, hf_score: float, email: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(intent, reply) when NLU says this is an order lookup, else None."""
+    # classify_intent_hf returns the mapped intent ("track_order"), never the
+    # label text the baseline compared against ("check order status")
+    is_order_intent = (hf_intent == "track_order" and hf_score > 0.4)
+    if not is_order_intent:
+        return None
+    logger.info("✅ HF Model decided to check Database")
+    if email:
+        return "order_tracking", get_order_status_cached(email)
+    return "auth_required", "Please sign in so I can look up your order details."
+
+
+def _rag_result(gen: Optional[str], docs: List[Dict[str, Any]], model_ms: int) -> Dict[str, Any]:
+    if docs:
+        reply = gen if gen else f"{TOP_CHUNK_PREFIX}{docs[0].get('source','unknown')}."
+        if not gen:
+            inc("fallbacks_total", kind="top_chunk")
+        success = True
+    else:
+        reply = gen if gen else NO_ANSWER_REPLY
+        if not gen:
+            inc("fallbacks_total", kind="no_answer")
+        success = False if not gen else True
+    return {"reply": reply, "model_text": gen, "model_ms": model_ms, "success": success}
+
+
+def rag_reply(transcript: str, docs: List[Dict[str, Any]], history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Generate an answer from retrieved chunks (or a general answer when there
+    are none). `history` is the session's recent turns, if any.
+    Returns reply, model_text, model_ms and success.
+    """
+    start = time.time()
+    gen = call_gemini_rag(transcript, docs, history) if docs else call_gemini_general(transcript, history)
+    return _rag_result(gen, docs, int((time.time() - start) * 1000))
+
+
+async def arag_reply(transcript: str, docs: List[Dict[str, Any]], history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """rag_reply for the ASGI app, on the asyncio Gemini client."""
+    start = time.time()
+    if docs:
+        gen = await acall_gemini_rag(transcript, docs, history)
+    else:
+        gen = await acall_gemini_general(transcript, history)
+    return _rag_result(gen, docs, int((time.time() - start) * 1000))
+
+
+def public_sources(sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"id": s.get("id"), "source": s.get("source"), "score": s.get("score"), "collection": s.get("collection")}
+            for s in sources] if sources else []
+
+
+def top_chunk_reply(docs: List[Dict[str, Any]]) -> str:
+    """Degraded answer without the LLM: quote the best retrieved chunk."""
+    top = docs[0]
+    snippet = (top.get("text") or "").strip()
+    if len(snippet) > 300:
+        snippet = snippet[:300].rsplit(" ", 1)[0] + "..."
+    return f"{TOP_CHUNK_PREFIX}{top.get('source','unknown')}: {snippet}" if snippet else f"{TOP_CHUNK_PREFIX}{top.get('source','unknown')}."
@@ -1,12 +1,19 @@
 import os
+import re
 import json
+import heapq
+import hashlib
 import logging
-from typing import List, Dict, Any, Tuple
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, Optional
 
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
 from app.config import Config
+from app.core.metrics import timed, record_cache
 
 logger = logging.getLogger("voicebot")
 
@@ -27,8 +34,13 @@ except Exception:
 
 # ---------- Load embedding model ----------
 EMBED_MODEL = None
-FAISS_INDEX = None
-DOCS_META: Dict[str, Dict[str, Any]] = {}
+# Retrieval collections: name -> Shard. The dict is replaced as a whole on
+# (re)load, so a search never sees a half-updated set of shards.
+COLLECTIONS: Dict[str, "Shard"] = {}
+# Combined fingerprint of the loaded shards; lets cached answers be tied to an index build
+INDEX_FINGERPRINT = None
+_collections_lock = threading.Lock()
+_fanout_pool: Optional[ThreadPoolExecutor] = None
 
 def init_rag():
     global EMBED_MODEL
@@ -41,27 +53,154 @@ def init_rag():
     
     load_index()
 
-def load_index(index_path: str = Config.FAISS_INDEX_PATH, meta_path: str = Config.DOCS_META_PATH):
-    global FAISS_INDEX, DOCS_META
+def index_fingerprint(meta_path: str = Config.DOCS_META_PATH):
+    """Short content hash of a docs meta file, or None when it does not exist."""
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+def combined_fingerprint(fingerprints: Dict[str, Optional[str]]) -> Optional[str]:
+    parts = [f"{name}={fp}" for name, fp in sorted(fingerprints.items()) if fp]
+    return hashlib.sha1("|".join(parts).encode("utf8")).hexdigest()[:16] if parts else None
+
+def discover_collections(base: str = "") -> Dict[str, Tuple[str, str]]:
+    """
+    name -> (index_path, meta_path): the single index at FAISS_INDEX_PATH /
+    DOCS_META_PATH as DEFAULT_COLLECTION, plus every COLLECTIONS_DIR/<name>/
+    holding a faiss.index and docs_meta.json (what ingest.py --collection writes).
+    """
+    found = {}
+    index_path = os.path.join(base, Config.FAISS_INDEX_PATH)
+    meta_path = os.path.join(base, Config.DOCS_META_PATH)
+    if os.path.exists(index_path) and os.path.exists(meta_path):
+        found[Config.DEFAULT_COLLECTION] = (index_path, meta_path)
+    root = os.path.join(base, Config.COLLECTIONS_DIR)
+    if os.path.isdir(root):
+        for name in sorted(os.listdir(root)):
+            index_path = os.path.join(root, name, "faiss.index")
+            meta_path = os.path.join(root, name, "docs_meta.json")
+            if os.path.exists(index_path) and os.path.exists(meta_path):
+                found[name] = (index_path, meta_path)
+    return found
+
+class Shard:
+    """One collection: a FAISS index and its chunk metadata. Never mutated once loaded."""
+
+    def __init__(self, name: str, index_path: str, meta_path: str):
+        self.name = name
+        self.index = faiss.read_index(index_path)
+        with open(meta_path, "r", encoding="utf8") as f:
+            self.meta: Dict[str, Dict[str, Any]] = json.load(f)
+        self.fingerprint = index_fingerprint(meta_path)
+
+    def doc(self, idx: int, score: float) -> Optional[Dict[str, Any]]:
+        meta = self.meta.get(str(int(idx)))
+        if not meta:
+            return None
+        return {
+            "id": int(idx),
+            "score": float(score),
+            "text": meta.get("chunk","")[:2000],
+            "source": meta.get("source","unknown"),
+            # Every file a deduplicated chunk appeared in (ingest.py collapses near-duplicates)
+            "sources": meta.get("sources") or [meta.get("source","unknown")],
+            "collection": self.name,
+        }
+
+    def search(self, q_emb: "np.ndarray", top_k: int) -> List[List[Dict[str, Any]]]:
+        # FAISS releases the GIL here, so shards searched from the fan-out pool run in parallel
+        D, I = self.index.search(q_emb, top_k)
+        results = []
+        for row in range(len(q_emb)):
+            docs = []
+            for score, idx in zip(D[row], I[row]):
+                if int(idx) < 0 or float(score) < Config.SCORE_THRESHOLD:
+                    continue
+                doc = self.doc(idx, score)
+                if doc is not None:
+                    docs.append(doc)
+            results.append(docs)
+        return results
+
+def load_index(collection: Optional[str] = None) -> List[str]:
+    """
+    (Re)load shards from disk: every discovered collection, or only
+    `collection` while the others keep serving. A shard that fails to load
+    keeps its previous version. Returns the names (re)loaded.
+    """
+    global COLLECTIONS, INDEX_FINGERPRINT
     if not FAISS_AVAILABLE:
         logger.warning("faiss not available; retrieval disabled.")
-        FAISS_INDEX = None
-        DOCS_META = {}
-        return
-    try:
-        if os.path.exists(index_path) and os.path.exists(meta_path):
-            FAISS_INDEX = faiss.read_index(index_path)
-            with open(meta_path, "r", encoding="utf8") as f:
-                DOCS_META = json.load(f)
-            logger.info("Loaded FAISS index and docs meta.")
+        COLLECTIONS = {}
+        INDEX_FINGERPRINT = None
+        return []
+    found = discover_collections()
+    if collection is not None and collection not in found and collection not in COLLECTIONS:
+        raise KeyError(f"unknown collection: {collection}")
+    names = [collection] if collection is not None else list(found)
+
+    loaded = {}
+    for name in names:
+        if name not in found:
+            continue
+        try:
+            loaded[name] = Shard(name, *found[name])
+        except Exception as e:
+            logger.exception("Failed to load collection %s: %s", name, e)
+
+    with _collections_lock:
+        if collection is not None:
+            shards = dict(COLLECTIONS)
+            if collection not in found:
+                shards.pop(collection, None)
         else:
-            logger.warning("FAISS index/meta not found at configured paths.")
-            FAISS_INDEX = None
-            DOCS_META = {}
-    except Exception as e:
-        logger.exception("Failed to load index/meta: %s", e)
-        FAISS_INDEX = None
-        DOCS_META = {}
+            shards = {n: s for n, s in COLLECTIONS.items() if n in found}
+        shards.update(loaded)
+        COLLECTIONS = shards
+        INDEX_FINGERPRINT = combined_fingerprint({n: s.fingerprint for n, s in shards.items()})
+    if not shards:
+        logger.warning("No FAISS collections found at configured paths.")
+    else:
+        logger.info("Loaded collections: %s", ", ".join(f"{n} ({s.index.ntotal})" for n, s in sorted(shards.items())))
+    return sorted(loaded)
+
+def retrieval_ready() -> bool:
+    return EMBED_MODEL is not None and bool(COLLECTIONS)
+
+def unknown_collections(names: Optional[List[str]]) -> List[str]:
+    return [n for n in names or [] if n not in COLLECTIONS]
+
+def parse_collections(value) -> Tuple[Optional[List[str]], Optional[str]]:
+    """
+    Collections a request routes to ("collections": list or comma separated),
+    as (names or None for default routing, error message or None).
+    """
+    if not value:
+        return None, None
+    names = value.split(",") if isinstance(value, str) else value
+    if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+        return None, "collections must be a list of names"
+    names = sorted({n.strip() for n in names if n.strip()})
+    unknown = unknown_collections(names)
+    if unknown:
+        return None, f"unknown collections: {', '.join(unknown)}"
+    return names or None, None
+
+def resolve_collections(names: Optional[List[str]] = None) -> List["Shard"]:
+    """Shards a query searches: `names`, else QUERY_COLLECTIONS, else every loaded collection."""
+    shards = COLLECTIONS
+    names = names or Config.QUERY_COLLECTIONS or list(shards)
+    return [shards[n] for n in names if n in shards]
+
+def _fanout() -> ThreadPoolExecutor:
+    global _fanout_pool
+    if _fanout_pool is None:
+        with _collections_lock:
+            if _fanout_pool is None:
+                _fanout_pool = ThreadPoolExecutor(max_workers=Config.RETRIEVAL_FANOUT_WORKERS,
+                                                  thread_name_prefix="faiss-fanout")
+    return _fanout_pool
 
 def estimate_tokens(text: str) -> int:
     """
@@ -77,28 +216,102 @@ def estimate_tokens(text: str) -> int:
             pass
     return max(1, len(text) // 4)
 
-def retrieve_docs(query: str, top_k: int = Config.TOP_K) -> List[Dict[str, Any]]:
-    if FAISS_INDEX is None or EMBED_MODEL is None:
-        return []
-    q_emb = EMBED_MODEL.encode([query], convert_to_numpy=True)
+def retrieve_docs(query: str, top_k: int = Config.TOP_K, collections: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    return retrieve_docs_batch([query], top_k=top_k, collections=collections)[0]
+
+def retrieve_docs_batch(queries: List[str], top_k: int = Config.TOP_K,
+                        collections: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+    """
+    Encode all queries in one pass and run a single FAISS search per shard
+    for the whole batch. Returns one result list per query, in order.
+    """
+    if not retrieval_ready() or not queries:
+        return [[] for _ in queries]
+    return search_embeddings(embed_queries(queries), top_k=top_k, collections=collections)
+
+# ---------- Query embedding cache ----------
+# normalised transcript -> L2-normalised embedding row; LRU, seeded at worker
+# start from the analytics warm-up set (see app/services/answer_cache.py).
+_embed_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_embed_lock = threading.Lock()
+_NORMALISE_RE = re.compile(r"[a-z0-9']+")
+
+def normalise_transcript(text: str) -> str:
+    """Lower-case words only; the key shared by the query caches and the analytics job."""
+    return " ".join(_NORMALISE_RE.findall((text or "").lower()))
+
+def seed_embeddings(texts: List[str], embeddings: "np.ndarray"):
+    with _embed_lock:
+        for text, row in zip(texts, embeddings):
+            _embed_cache[normalise_transcript(text)] = np.asarray(row, dtype="float32")
+        while len(_embed_cache) > Config.EMBED_CACHE_MAX:
+            _embed_cache.popitem(last=False)
+
+def _encode(queries: List[str]) -> "np.ndarray":
+    q_emb = EMBED_MODEL.encode(list(queries), convert_to_numpy=True)
     try:
         faiss.normalize_L2(q_emb)
     except Exception:
         pass
-    D, I = FAISS_INDEX.search(q_emb, top_k)
+    return q_emb
+
+def embed_queries(queries: List[str]) -> "np.ndarray":
+    """L2-normalised query embeddings (one row per query); repeats come from the cache."""
+    with timed("embed"):
+        if Config.EMBED_CACHE_MAX <= 0 or not queries:
+            return _encode(queries)
+        keys = [normalise_transcript(q) for q in queries]
+        rows: List[Any] = [None] * len(keys)
+        with _embed_lock:
+            for i, key in enumerate(keys):
+                row = _embed_cache.get(key)
+                if row is not None:
+                    _embed_cache.move_to_end(key)
+                    rows[i] = row
+        missing = [i for i, row in enumerate(rows) if row is None]
+        for i in range(len(keys)):
+            record_cache("embedding", rows[i] is not None)
+        if missing:
+            fresh = _encode([queries[i] for i in missing])
+            with _embed_lock:
+                for i, row in zip(missing, fresh):
+                    rows[i] = row
+                    _embed_cache[keys[i]] = row
+                while len(_embed_cache) > Config.EMBED_CACHE_MAX:
+                    _embed_cache.popitem(last=False)
+        return np.vstack(rows).astype("float32")
+
+def search_embeddings(q_emb: "np.ndarray", top_k: int = Config.TOP_K,
+                      collections: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+    """
+    Search the routed shards (in parallel when there are several) and merge
+    each query's hits into one top_k by score. Scores are comparable across
+    shards: every collection is built with the same embedding model.
+    """
+    shards = resolve_collections(collections)
+    if not shards:
+        return [[] for _ in range(len(q_emb))]
+    with timed("faiss_search"):
+        if len(shards) == 1:
+            return shards[0].search(q_emb, top_k)
+        per_shard = list(_fanout().map(lambda shard: shard.search(q_emb, top_k), shards))
+    return [
+        heapq.nlargest(top_k, (d for hits in per_shard for d in hits[row]), key=lambda d: d["score"])
+        for row in range(len(q_emb))
+    ]
+
+def docs_by_ids(hits: List[Tuple]) -> List[Dict[str, Any]]:
+    """
+    Rebuild retrieved chunks from (id, score[, collection]) tuples, e.g. ones
+    kept from an earlier turn. Hits without a collection are in DEFAULT_COLLECTION.
+    """
+    shards = COLLECTIONS
     results = []
-    for score, idx in zip(D[0], I[0]):
-        if int(idx) < 0:
-            continue
-        if float(score) < Config.SCORE_THRESHOLD:
-            continue
-        meta = DOCS_META.get(str(int(idx)), {})
-        results.append({
-            "id": int(idx),
-            "score": float(score),
-            "text": meta.get("chunk","")[:2000],
-            "source": meta.get("source","unknown")
-        })
+    for hit in hits:
+        shard = shards.get(hit[2] if len(hit) > 2 and hit[2] else Config.DEFAULT_COLLECTION)
+        doc = shard.doc(hit[0], hit[1]) if shard is not None else None
+        if doc is not None:
+            results.append(doc)
     return results
 
 def safe_build_context(chunks: List[Dict[str, Any]], question: str, token_budget: int = Config.MAX_PROMPT_TOKENS) -> Tuple[str, List[Dict[str, Any]]]:
@@ -0,0 +1,117 @@
+import time
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+from app.config import Config
+from app.core.metrics import timed, inc
+from app.services.rag import retrieve_docs, retrieve_docs_batch, search_embeddings
+
+logger = logging.getLogger("voicebot")
+
+# Cross-encoder (optional; sentence-transformers ships it)
+try:
+    from sentence_transformers import CrossEncoder
+    CROSS_ENCODER_AVAILABLE = True
+except Exception:
+    CrossEncoder = None
+    CROSS_ENCODER_AVAILABLE = False
+
+RERANKER = None
+
+# Rolling cost estimate (ms per query/chunk pair) and in-flight count, used to
+# skip re-ranking when it would blow the latency budget.
+_ms_per_pair = 0.0
+_inflight = 0
+_lock = threading.Lock()
+
+
+def init_reranker():
+    global RERANKER
+    if not Config.RERANK_ENABLED:
+        return
+    if not CROSS_ENCODER_AVAILABLE:
+        logger.warning("CrossEncoder not available; re-ranking disabled.")
+        return
+    logger.info("Loading re-ranker: %s", Config.RERANK_MODEL)
+    try:
+        RERANKER = CrossEncoder(Config.RERANK_MODEL)
+    except Exception as e:
+        logger.exception("Failed to load re-ranker: %s", e)
+        RERANKER = None
+
+
+def _over_budget(n_pairs: int) -> bool:
+    """
+    Estimated cost grows with candidates and with concurrent re-ranks sharing
+    the CPU. Each skip decays the estimate so we probe again once load drops.
+    """
+    global _ms_per_pair
+    with _lock:
+        estimate = _ms_per_pair * n_pairs * (_inflight + 1)
+        if estimate > Config.RERANK_BUDGET_MS:
+            _ms_per_pair *= 0.9
+            return True
+    return False
+
+
+def rerank(query: str, docs: List[Dict[str, Any]], top_n: int = Config.TOP_K) -> List[Dict[str, Any]]:
+    """
+    Score (query, chunk) pairs in one batched cross-encoder pass and keep the
+    best `top_n`. Falls back to bi-encoder order when the re-ranker is off or
+    over its time budget.
+    """
+    global _ms_per_pair, _inflight
+    if RERANKER is None or len(docs) <= 1:
+        return docs[:top_n]
+    if _over_budget(len(docs)):
+        inc("rerank_skips_total")
+        return docs[:top_n]
+
+    with _lock:
+        _inflight += 1
+    start = time.perf_counter()
+    try:
+        with timed("rerank"):
+            scores = RERANKER.predict([(query, d.get("text", "")) for d in docs], batch_size=len(docs))
+    except Exception as e:
+        logger.error(f"Re-rank Error: {e}")
+        return docs[:top_n]
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        with _lock:
+            _inflight -= 1
+            per_pair = elapsed / len(docs)
+            _ms_per_pair = per_pair if _ms_per_pair == 0 else 0.8 * _ms_per_pair + 0.2 * per_pair
+
+    ranked = sorted(
+        ({**d, "rerank_score": float(s)} for d, s in zip(docs, scores)),
+        key=lambda d: d["rerank_score"],
+        reverse=True,
+    )
+    return ranked[:top_n]
+
+
+def retrieve_ranked(query: str, top_k: int = Config.TOP_K, q_emb=None,
+                    collections: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    retrieve_docs, over-fetching and re-ranking when a re-ranker is loaded.
+    Pass `q_emb` (a 1-row normalised embedding) to skip re-encoding the query.
+    """
+    fetch_k = top_k if RERANKER is None else max(top_k, Config.RERANK_CANDIDATES)
+    if q_emb is not None:
+        candidates = search_embeddings(q_emb, top_k=fetch_k, collections=collections)[0]
+    else:
+        candidates = retrieve_docs(query, top_k=fetch_k, collections=collections)
+    if RERANKER is None:
+        return candidates
+    return rerank(query, candidates, top_n=top_k)
+
+
+def retrieve_ranked_batch(queries: List[str], top_k: int = Config.TOP_K,
+                          collections: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+    """Batched retrieve_ranked: one encode + search for all queries, then per-query re-rank."""
+    if RERANKER is None:
+        return retrieve_docs_batch(queries, top_k=top_k, collections=collections)
+    candidates = retrieve_docs_batch(queries, top_k=max(top_k, Config.RERANK_CANDIDATES), collections=collections)
+    return [rerank(q, docs, top_n=top_k) for q, docs in zip(queries, candidates)]
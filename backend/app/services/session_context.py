@@ -0,0 +1,337 @@
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Optional, List, Dict, Any, Tuple
+
+import numpy as np
+import sqlalchemy as sa
+
+from app.config import Config
+from app.core import database
+from app.core.metrics import record_cache, inc
+from app.services import rag
+from app.services.rerank import retrieve_ranked
+
+logger = logging.getLogger("voicebot")
+
+# Short utterances leaning on the previous turn ("what about that one?")
+_FOLLOWUP_CUES = {"it", "its", "that", "this", "those", "these", "they", "them", "one", "more",
+                  "else", "also", "and", "same", "there", "then", "why"}
+_WORD_RE = re.compile(r"[a-z']+")
+
+
+class SessionState:
+    """Hot per-session context: recent turns, resolved intent and last retrieval."""
+
+    def __init__(self, session_id: str, user_email: Optional[str] = None, persist: bool = True):
+        self.session_id = session_id
+        self.user_email = user_email
+        # False for a session id already owned by another user: serve the
+        # request statelessly rather than overwrite their context.
+        self.persist = persist
+        self.turns = deque(maxlen=Config.SESSION_MAX_TURNS)
+        self.intent: Optional[str] = None
+        # (chunk id, score, collection)
+        self.chunk_hits: List[Tuple[int, float, str]] = []
+        # Last query embedding; in-memory only (not persisted to chat_sessions)
+        self.embedding: Optional[np.ndarray] = None
+        # chat_sessions.version this state was read at or last written as (0: no row)
+        self.version = 0
+        # time.monotonic() of the last read / write of the row
+        self.checked_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "v": 1,
+            "turns": list(self.turns),
+            "intent": self.intent,
+            "chunks": [list(hit) for hit in self.chunk_hits],
+        }, ensure_ascii=False)
+
+    @classmethod
+    def from_row(cls, session_id: str, user_email: Optional[str], context: Optional[str],
+                 version: int = 0) -> "SessionState":
+        state = cls(session_id, user_email)
+        state.merge_row(context, version)
+        return state
+
+    def merge_row(self, context: Optional[str], version: int):
+        """
+        Fold a newer chat_sessions row into this state (caller holds the lock
+        or owns the state): turns from both sides in time order, and the
+        intent / chunks of whichever side has the latest turn.
+        """
+        try:
+            data = json.loads(context) if context else {}
+        except ValueError:
+            data = {}
+        theirs = data.get("turns", [])
+        mine_latest = self.turns[-1].get("ts", 0) if self.turns else -1
+        theirs_latest = theirs[-1].get("ts", 0) if theirs else -1
+
+        seen = set()
+        merged = []
+        for t in sorted(list(self.turns) + theirs, key=lambda t: t.get("ts", 0)):
+            key = (t.get("ts"), t.get("q"), t.get("a"))
+            if key not in seen:
+                seen.add(key)
+                merged.append(t)
+        self.turns.clear()
+        self.turns.extend(merged)
+
+        if theirs_latest >= mine_latest:
+            self.intent = data.get("intent")
+            # Contexts written before sharding hold [id, score] (the default collection)
+            self.chunk_hits = [(int(c[0]), float(c[1]), c[2] if len(c) > 2 else Config.DEFAULT_COLLECTION)
+                               for c in data.get("chunks", [])]
+            self.embedding = None
+        self.version = version
+        self.checked_at = time.monotonic()
+
+
+_sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+_lock = threading.Lock()
+
+# Write-behind queue: latest state per session, flushed by one writer thread
+_pending: Dict[str, SessionState] = {}
+_pending_cv = threading.Condition()
+_writer_started = False
+
+
+# ---------- Lookup ----------
+
+def _load_from_db(session_id: str) -> Optional[Tuple[Optional[str], Optional[str], int]]:
+    if database.engine is None:
+        return None
+    try:
+        with database.engine.connect() as conn:
+            row = conn.execute(sa.text(
+                "SELECT user_email, current_context, version FROM chat_sessions WHERE session_uuid = :sid"
+            ), {"sid": session_id}).fetchone()
+        return (row[0], row[1], int(row[2] or 0)) if row else None
+    except Exception as e:
+        logger.warning("chat_sessions read failed for %s: %s", session_id, e)
+        return None
+
+
+def _db_version(session_id: str) -> Optional[int]:
+    """chat_sessions.version for the session (0 when there is no row); None when unknown."""
+    if database.engine is None:
+        return None
+    try:
+        with database.engine.connect() as conn:
+            row = conn.execute(sa.text("SELECT version FROM chat_sessions WHERE session_uuid = :sid"),
+                               {"sid": session_id}).fetchone()
+        return int(row[0] or 0) if row else 0
+    except Exception as e:
+        logger.warning("chat_sessions version check failed for %s: %s", session_id, e)
+        return None
+
+
+def get_session(session_id: str, user_email: Optional[str] = None) -> SessionState:
+    """
+    Session state from the in-process LRU, falling back to chat_sessions
+    (e.g. after a restart or when another worker served the previous turn).
+    An LRU hit older than SESSION_REVALIDATE_S is checked against the row's
+    version and refreshed when another worker has written since; within that
+    window a stale copy is reconciled by the conditional flush. A session belonging to a different
+    user is never reused or overwritten, and without an email there is
+    nothing to tie a session to, so those requests get a fresh one.
+    """
+    if not user_email:
+        return SessionState(session_id, None, persist=False)
+
+    with _lock:
+        state = _sessions.get(session_id)
+        if state is not None:
+            _sessions.move_to_end(session_id)
+    if state is not None:
+        if state.user_email != user_email:
+            return SessionState(session_id, user_email, persist=False)
+        if time.monotonic() - state.checked_at < Config.SESSION_REVALIDATE_S:
+            record_cache("session", True)
+            return state
+        version = _db_version(session_id)
+        if version is None or version == state.version:
+            with state.lock:
+                state.checked_at = time.monotonic()
+            record_cache("session", True)
+            return state
+        record_cache("session", False)
+        row = _load_from_db(session_id)
+        if row and row[0] != user_email:
+            return SessionState(session_id, user_email, persist=False)
+        if row:
+            with state.lock:
+                state.merge_row(row[1], row[2])
+        return state
+
+    record_cache("session", False)
+    row = _load_from_db(session_id)
+    if row and row[0] != user_email:
+        return SessionState(session_id, user_email, persist=False)
+    if row:
+        state = SessionState.from_row(session_id, row[0], row[1], row[2])
+    else:
+        state = SessionState(session_id, user_email)
+
+    with _lock:
+        _sessions[session_id] = state
+        _sessions.move_to_end(session_id)
+        while len(_sessions) > Config.SESSION_CACHE_MAX:
+            _sessions.popitem(last=False)
+    return state
+
+
+# ---------- Follow-up aware retrieval ----------
+
+def _is_short_followup(transcript: str) -> bool:
+    words = _WORD_RE.findall(transcript.lower())
+    return 0 < len(words) <= Config.SESSION_FOLLOWUP_MAX_WORDS and any(w in _FOLLOWUP_CUES for w in words)
+
+
+def retrieve_for_turn(state: SessionState, transcript: str, top_k: int = Config.TOP_K,
+                      q_emb=None, docs: Optional[List[Dict[str, Any]]] = None,
+                      collections: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    retrieve_ranked, but reuse the previous turn's chunks when the query stays
+    within SESSION_TOPIC_SIM of the previous one: the query is always embedded,
+    only the search + re-rank is skipped. A follow-up cue ("what about that
+    one?") does not bypass the check. `q_emb` / `docs` are results already
+    computed for this transcript (e.g. speculatively from a partial ASR
+    transcript); fresh `docs` are returned as-is rather than older chunks.
+    Only chunks from the routed `collections` are reused.
+    """
+    with state.lock:
+        prev_hits = list(state.chunk_hits)
+        prev_emb = state.embedding
+        prev_q = state.turns[-1].get("q") if state.turns else None
+    if collections:
+        prev_hits = [h for h in prev_hits if h[2] in collections]
+
+    if docs is not None:
+        if q_emb is not None:
+            with state.lock:
+                state.embedding = q_emb
+        return docs
+
+    if q_emb is None:
+        if not rag.retrieval_ready():
+            return []
+        q_emb = rag.embed_queries([transcript])
+    if prev_hits and prev_emb is None and prev_q:
+        # Restored from chat_sessions, where embeddings are not kept
+        prev_emb = rag.embed_queries([prev_q])
+    if prev_hits and prev_emb is not None:
+        similarity = float(np.dot(q_emb[0], prev_emb[0]))
+        if similarity >= Config.SESSION_TOPIC_SIM:
+            reused = rag.docs_by_ids(prev_hits)
+            if reused:
+                inc("session_reuse_total", kind="followup" if _is_short_followup(transcript) else "same_topic")
+                with state.lock:
+                    state.embedding = q_emb
+                return reused
+
+    docs = retrieve_ranked(transcript, top_k=top_k, q_emb=q_emb, collections=collections)
+    with state.lock:
+        state.embedding = q_emb
+    return docs
+
+
+# ---------- Recording + write-through ----------
+
+def record_turn(state: SessionState, transcript: str, reply: Optional[str], intent: Optional[str],
+                docs: Optional[List[Dict[str, Any]]] = None):
+    with state.lock:
+        state.turns.append({"q": transcript, "a": reply, "intent": intent, "ts": int(time.time())})
+        state.intent = intent
+        if docs:
+            state.chunk_hits = [(d["id"], d.get("score", 0.0), d.get("collection") or Config.DEFAULT_COLLECTION)
+                                for d in docs if d.get("id") is not None]
+    _enqueue_write(state)
+
+
+def history_for_prompt(state: SessionState) -> List[Dict[str, Any]]:
+    with state.lock:
+        return list(state.turns)
+
+
+def _enqueue_write(state: SessionState):
+    if database.engine is None or not state.persist:
+        return
+    _start_writer()
+    with _pending_cv:
+        _pending[state.session_id] = state
+        _pending_cv.notify()
+
+
+# Optimistic write: only over the version this worker last saw, and only for
+# the same user. No row back means someone else wrote in between.
+_UPSERT_SQL = sa.text("""
+    INSERT INTO chat_sessions (session_uuid, user_email, current_context, updated_at, version)
+    VALUES (:sid, :email, :ctx, now(), 1)
+    ON CONFLICT (session_uuid) DO UPDATE
+    SET current_context = EXCLUDED.current_context, updated_at = now(), version = chat_sessions.version + 1
+    WHERE chat_sessions.version = :ver AND chat_sessions.user_email = EXCLUDED.user_email
+    RETURNING version
+""")
+
+
+def _flush(batch: Dict[str, SessionState]):
+    rows = []
+    for sid, state in batch.items():
+        with state.lock:
+            rows.append(({"sid": sid, "email": state.user_email, "ctx": state.to_json(), "ver": state.version},
+                         state))
+    conflicts = []
+    with database.engine.begin() as conn:
+        for params, state in rows:
+            row = conn.execute(_UPSERT_SQL, params).fetchone()
+            if row is None:
+                conflicts.append(state)
+                continue
+            with state.lock:
+                state.version = int(row[0])
+                state.checked_at = time.monotonic()
+
+    # Lost the race: merge the other worker's turns and write again
+    for state in conflicts:
+        current = _load_from_db(state.session_id)
+        if current is None:
+            continue
+        if current[0] != state.user_email:
+            state.persist = False
+            continue
+        with state.lock:
+            state.merge_row(current[1], current[2])
+        _enqueue_write(state)
+
+
+def _writer_loop():
+    while True:
+        with _pending_cv:
+            while not _pending:
+                _pending_cv.wait()
+            batch = dict(_pending)
+            _pending.clear()
+        try:
+            _flush(batch)
+        except Exception as e:
+            logger.warning("chat_sessions write-through failed (%d sessions): %s", len(batch), e)
+        # Coalesce bursts: later turns of the same session overwrite earlier ones
+        time.sleep(Config.SESSION_FLUSH_INTERVAL_S)
+
+
+def _start_writer():
+    global _writer_started
+    if _writer_started:
+        return
+    with _lock:
+        if _writer_started:
+            return
+        _writer_started = True
+    threading.Thread(target=_writer_loop, name="session-writer", daemon=True).start()
@@ -0,0 +1,45 @@
+# asgi.py
+# Async serving mode: uvicorn asgi:app --workers 2 --port 8000
+# Same /query, /history and /auth/sync contracts as wsgi.py (the Flask app
+# keeps the remaining endpoints: streamed audio, batch, admin, reload).
+
+import os
+import logging
+import threading
+from starlette.middleware.cors import CORSMiddleware
+from app import create_asgi_app
+from app.services.nlu import load_nlu_model
+
+app = create_asgi_app()
+
+FRONTEND_ORIGINS = [
+    "https://ai-voice-bot-ashen.vercel.app",
+    "http://localhost:3000"
+]
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=FRONTEND_ORIGINS,
+    allow_credentials=True,
+    allow_headers=["Content-Type", "Authorization", "X-Requested-With", "Accept"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+    expose_headers=["Server-Timing"],
+)
+
+logger = logging.getLogger("voicebot")
+
+def _background_load_nlu():
+    try:
+        logger.info("Background: starting NLU model load")
+        load_nlu_model()
+        logger.info("Background: NLU model loaded successfully")
+    except Exception as e:
+        logger.exception("Background: NLU model failed to load: %s", e)
+
+t = threading.Thread(target=_background_load_nlu, daemon=True)
+t.start()
+
+# local run
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
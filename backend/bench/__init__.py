@@ -0,0 +1,7 @@
+"""
+Load-test / benchmark harness for the voice bot backend.
+
+Runs the real Flask app against local stand-ins for every external service
+(Firebase token verify, Postgres, Gemini) so numbers are comparable across
+branches and machines. Entry point: `python -m bench.run --help`.
+"""
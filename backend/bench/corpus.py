@@ -0,0 +1,41 @@
+import json
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger("voicebot.bench")
+
+DEFAULT_LOG = Path(__file__).resolve().parent.parent / "interactions.log"
+
+
+def load_corpus(log_path: Optional[str] = None, extra_path: Optional[str] = None, dedupe: bool = True) -> List[str]:
+    """
+    Transcripts to replay. Seeded from interactions.log (one JSON object per
+    line with a "transcript" field); `extra_path` may add plain-text lines.
+    """
+    transcripts: List[str] = []
+    path = Path(log_path) if log_path else DEFAULT_LOG
+    if path.exists():
+        with open(path, "r", encoding="utf8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    t = (json.loads(line).get("transcript") or "").strip()
+                except ValueError:
+                    continue
+                if t:
+                    transcripts.append(t)
+    else:
+        logger.warning("Interaction log not found at %s", path)
+
+    if extra_path:
+        with open(extra_path, "r", encoding="utf8") as f:
+            transcripts.extend(l.strip() for l in f if l.strip())
+
+    if dedupe:
+        transcripts = list(dict.fromkeys(transcripts))
+    if not transcripts:
+        raise ValueError("empty benchmark corpus")
+    return transcripts
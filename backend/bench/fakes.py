@@ -0,0 +1,177 @@
+import os
+import hmac
+import json
+import time
+import uuid
+import asyncio
+import base64
+import random
+import hashlib
+import sqlite3
+import datetime
+from types import SimpleNamespace
+from typing import Optional
+
+# ---------- Locally signed JWTs (stand-in for Firebase ID tokens) ----------
+
+JWT_SECRET = os.environ.get("BENCH_JWT_SECRET", "bench-secret")
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def sign_token(uid: str, email: Optional[str] = None, ttl_s: int = 3600, secret: str = JWT_SECRET) -> str:
+    """HS256 token carrying the claims the app reads from a Firebase token."""
+    now = int(time.time())
+    header = {"alg": "HS256", "typ": "JWT"}
+    claims = {"uid": uid, "user_id": uid, "sub": uid, "email": email, "name": uid, "iat": now, "exp": now + ttl_s}
+    signing_input = _b64url(json.dumps(header).encode()) + "." + _b64url(json.dumps(claims).encode())
+    sig = hmac.new(secret.encode(), signing_input.encode(), hashlib.sha256).digest()
+    return signing_input + "." + _b64url(sig)
+
+
+def verify_token(token: str, secret: str = JWT_SECRET) -> dict:
+    """Verifier for app.core.auth.set_token_verifier(). Raises ValueError on bad tokens."""
+    try:
+        header_b64, claims_b64, sig_b64 = token.split(".")
+    except ValueError:
+        raise ValueError("malformed token")
+    expected = hmac.new(secret.encode(), f"{header_b64}.{claims_b64}".encode(), hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, _b64url_decode(sig_b64)):
+        raise ValueError("bad signature")
+    claims = json.loads(_b64url_decode(claims_b64))
+    if claims.get("exp", 0) < time.time():
+        raise ValueError("token expired")
+    return claims
+
+
+# ---------- Fake Gemini ----------
+
+class FakeGeminiClient:
+    """
+    Mimics the slice of google.genai.Client the app uses:
+    `client.models.generate_content(model=..., contents=..., config=...)` and
+    its asyncio twin `client.aio.models.generate_content(...)`.
+    Latency is drawn uniformly from latency_ms ± jitter_ms; `error_rate` of
+    calls raise ResourceExhausted so the retry path gets exercised too.
+    """
+
+    def __init__(self, latency_ms: float = 800, jitter_ms: float = 200, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.models = SimpleNamespace(generate_content=self.generate_content)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self.generate_content_async))
+
+    def _delay_s(self) -> float:
+        return max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def _response(self, model: str, contents: str):
+        if self.error_rate and random.random() < self.error_rate:
+            from google.api_core import exceptions as google_exceptions
+            raise google_exceptions.ResourceExhausted("fake quota exceeded")
+        words = str(contents).split()
+        return SimpleNamespace(text=f"[fake {model}] answer based on {len(words)} prompt words.")
+
+    def generate_content(self, model: str, contents: str, config: Optional[dict] = None):
+        time.sleep(self._delay_s())
+        return self._response(model, contents)
+
+    async def generate_content_async(self, model: str, contents: str, config: Optional[dict] = None):
+        await asyncio.sleep(self._delay_s())
+        return self._response(model, contents)
+
+
+# ---------- SQLite stand-in for Postgres ----------
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id text PRIMARY KEY DEFAULT (gen_random_uuid()),
+    firebase_uid text UNIQUE NOT NULL,
+    email text,
+    display_name text,
+    photo_url text,
+    meta text DEFAULT '{}',
+    created_at text DEFAULT (now()),
+    last_seen text
+);
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_uuid text PRIMARY KEY,
+    user_email text,
+    current_context text,
+    updated_at text DEFAULT (now()),
+    version integer NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS voice_queries (
+    id text PRIMARY KEY DEFAULT (gen_random_uuid()),
+    user_id text REFERENCES users(id),
+    session_id text,
+    transcript text,
+    audio_url text,
+    intent text,
+    slots text DEFAULT '{}',
+    response text DEFAULT '{}',
+    rag_sources text DEFAULT '[]',
+    confidence real,
+    duration_ms integer,
+    created_at text DEFAULT (now())
+);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_email text,
+    status text,
+    delivery_date text,
+    item_name text
+);
+"""
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def register_sqlite_functions(conn: sqlite3.Connection):
+    """Postgres functions the app's SQL relies on."""
+    conn.create_function("now", 0, _now)
+    conn.create_function("gen_random_uuid", 0, lambda: str(uuid.uuid4()))
+
+
+def install_sqlite_hooks():
+    """
+    Register the Postgres shims on every SQLite connection SQLAlchemy opens,
+    sync (sqlite3) or async (aiosqlite, used by the ASGI app).
+    """
+    import sqlalchemy as sa
+
+    @sa.event.listens_for(sa.engine.Engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        if isinstance(dbapi_conn, sqlite3.Connection) or type(dbapi_conn).__module__.endswith(".aiosqlite"):
+            register_sqlite_functions(dbapi_conn)
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA busy_timeout=5000")
+            cur.close()
+
+
+def create_sqlite_db(path: str, seed_orders_for=()):
+    """Create (or reuse) a SQLite file with the app schema and a few orders."""
+    conn = sqlite3.connect(path)
+    try:
+        register_sqlite_functions(conn)
+        conn.executescript(SQLITE_SCHEMA)
+        # bench files created before chat_sessions had a version column
+        if "version" not in {r[1] for r in conn.execute("PRAGMA table_info(chat_sessions)")}:
+            conn.execute("ALTER TABLE chat_sessions ADD COLUMN version integer NOT NULL DEFAULT 0")
+        for email in seed_orders_for:
+            conn.execute(
+                "INSERT INTO orders (user_email, status, delivery_date, item_name) VALUES (?, ?, ?, ?)",
+                (email, "shipped", "2025-12-01", "Smart Hub"),
+            )
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,133 @@
+# bench/history_bench.py
+# Seed a THROWAWAY Postgres with ~1M voice_queries and time the hot-path
+# queries before and after the schema migrations (indexes + keyset paging).
+# Usage (from backend/):
+#   python -m bench.history_bench --database-url postgresql://localhost/voicebot_bench --rows 1000000
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Before/after benchmark for /history and order lookups.")
+    parser.add_argument("--database-url", required=True, help="throwaway Postgres; tables are truncated")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--orders", type=int, default=200_000)
+    parser.add_argument("--samples", type=int, default=50, help="timed lookups per query shape")
+    parser.add_argument("--page-depth", type=int, default=10, help="pages walked for the deep-page case")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    # Must be set before the app package reads Config at import time.
+    os.environ["DATABASE_URL"] = args.database_url
+    import sqlalchemy as sa
+    from app.core import database
+    from app.core.migrations import MIGRATIONS, run_migrations, _ensure_version_table
+
+    database.init_db()
+    database.create_tables()
+    engine = database.engine
+    if engine is None or engine.dialect.name != "postgresql":
+        sys.exit("history_bench needs a Postgres DATABASE_URL")
+
+    print(f"Seeding {args.rows} voice_queries / {args.users} users / {args.orders} orders...", file=sys.stderr)
+    with engine.begin() as conn:
+        conn.execute(sa.text("TRUNCATE voice_queries, orders, users RESTART IDENTITY CASCADE"))
+        conn.execute(sa.text("""
+            INSERT INTO users (firebase_uid, email)
+            SELECT 'bench-' || g, 'user' || g || '@bench.local' FROM generate_series(1, :n) g
+        """), {"n": args.users})
+        conn.execute(sa.text("""
+            WITH u AS (SELECT array_agg(id) AS ids FROM users)
+            INSERT INTO voice_queries (user_id, session_id, transcript, intent, response, created_at)
+            SELECT u.ids[1 + g % :users], 'sess-' || (g % 5000), 'transcript ' || g, 'open_question',
+                   '{"reply": "ok"}'::jsonb, now() - (g || ' seconds')::interval
+            FROM generate_series(1, :rows) g, u
+        """), {"rows": args.rows, "users": args.users})
+        conn.execute(sa.text("""
+            INSERT INTO orders (user_email, status, delivery_date, item_name)
+            SELECT 'user' || (1 + g % :users) || '@bench.local', 'shipped', '2025-12-01', 'Item ' || g
+            FROM generate_series(1, :n) g
+        """), {"n": args.orders, "users": args.users})
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for m in MIGRATIONS:
+            if m.index:
+                conn.execute(sa.text(f"DROP INDEX IF EXISTS {m.index}"))
+        _ensure_version_table(conn)
+        conn.execute(sa.text("DELETE FROM schema_migrations"))
+        conn.execute(sa.text("ANALYZE"))
+        user_ids = [r[0] for r in conn.execute(sa.text(
+            "SELECT id FROM users ORDER BY random() LIMIT :n"), {"n": args.samples})]
+        emails = [r[0] for r in conn.execute(sa.text(
+            "SELECT email FROM users ORDER BY random() LIMIT :n"), {"n": args.samples})]
+
+    def timed_runs(fn, inputs):
+        ms = []
+        for x in inputs:
+            start = time.perf_counter()
+            fn(x)
+            ms.append((time.perf_counter() - start) * 1000)
+        ms.sort()
+        return {"p50": round(statistics.median(ms), 3), "p95": round(ms[int(0.95 * (len(ms) - 1))], 3),
+                "max": round(ms[-1], 3)}
+
+    def legacy_first_page(uid):
+        # The pre-migration /history query shape
+        with engine.connect() as conn:
+            conn.execute(sa.text("""SELECT id, session_id, transcript, intent, response, rag_sources, confidence,
+                duration_ms, created_at FROM voice_queries WHERE user_id = :uid ORDER BY created_at DESC LIMIT 20"""),
+                {"uid": uid}).fetchall()
+
+    def keyset_first_page(uid):
+        database.get_voice_query_history(uid, limit=20)
+
+    def keyset_deep_page(uid):
+        cursor = None
+        for _ in range(args.page_depth):
+            _, cursor = database.get_voice_query_history(uid, limit=20, cursor=cursor)
+            if cursor is None:
+                break
+
+    def order_lookup(email):
+        database.get_order_status_by_email(email)
+
+    def measure():
+        return {
+            "history_legacy_first_page_ms": timed_runs(legacy_first_page, user_ids),
+            "history_keyset_first_page_ms": timed_runs(keyset_first_page, user_ids),
+            f"history_keyset_{args.page_depth}_pages_ms": timed_runs(keyset_deep_page, user_ids),
+            "order_status_by_email_ms": timed_runs(order_lookup, emails),
+        }
+
+    print("Measuring without indexes...", file=sys.stderr)
+    before = measure()
+    print("Applying migrations...", file=sys.stderr)
+    start = time.perf_counter()
+    version = run_migrations(engine)
+    migrate_s = time.perf_counter() - start
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(sa.text("ANALYZE"))
+    print("Measuring with indexes...", file=sys.stderr)
+    after = measure()
+
+    report = {
+        "rows": args.rows, "users": args.users, "orders": args.orders, "samples": args.samples,
+        "schema_version": version, "migration_s": round(migrate_s, 2),
+        "before": before, "after": after,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf8")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
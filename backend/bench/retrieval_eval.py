@@ -0,0 +1,234 @@
+# bench/retrieval_eval.py
+# Offline retrieval quality vs latency sweep.
+# Usage (from backend/):
+#   python -m bench.retrieval_eval --labels bench/data/retrieval_labels.jsonl --docs ingest/docs \
+#       --chunk-sizes 200,400 --overlaps 50,100 --top-k 3,5 --thresholds 0.2,0.25,0.3 \
+#       --index-types Flat,HNSW32 --min-recall 0.8 --out retrieval_eval.json
+#
+# Labels file: one JSON object per line
+#   {"question": "what are your support hours", "sources": ["sample.txt"], "contains": "9:00 AM"}
+# A retrieved chunk is relevant when its source is listed and, if "contains"
+# is given, the chunk text contains that snippet (case-insensitive).
+import sys
+import json
+import time
+import hashlib
+import argparse
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import faiss
+from sentence_transformers import SentenceTransformer
+
+from app.services.rag import safe_build_context, estimate_tokens
+from ingest.ingest import read_text_files, chunk_text
+from bench.run import summarize
+
+logger = logging.getLogger("voicebot.bench")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE = BACKEND_DIR / ".eval_cache"
+
+
+def _csv(cast):
+    return lambda s: [cast(x) for x in s.split(",") if x.strip()]
+
+
+def load_labels(path: str) -> List[dict]:
+    labels = []
+    with open(path, "r", encoding="utf8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                item["sources"] = set(item.get("sources") or [])
+                labels.append(item)
+    if not labels:
+        raise ValueError(f"no labelled questions in {path}")
+    return labels
+
+
+def is_relevant(label: dict, meta: dict) -> bool:
+    if meta.get("source") not in label["sources"]:
+        return False
+    snippet = label.get("contains")
+    return not snippet or snippet.lower() in meta.get("chunk", "").lower()
+
+
+# ---------- Index building (cached) ----------
+
+def _docs_fingerprint(docs: List[dict]) -> str:
+    h = hashlib.sha1()
+    for d in sorted(docs, key=lambda d: d["source"]):
+        h.update(d["source"].encode())
+        h.update(d["text"].encode())
+    return h.hexdigest()[:12]
+
+
+def build_chunks(docs: List[dict], chunk_size: int, overlap: int) -> Dict[str, dict]:
+    meta = {}
+    for d in docs:
+        for c in chunk_text(d["text"], chunk_size=chunk_size, overlap=overlap):
+            meta[str(len(meta))] = {"source": d["source"], "chunk": c}
+    return meta
+
+
+def load_or_embed(cache_dir: Path, model: SentenceTransformer, model_name: str, docs: List[dict],
+                  chunk_size: int, overlap: int):
+    key = f"{_docs_fingerprint(docs)}-{model_name.replace('/', '_')}-{chunk_size}-{overlap}"
+    d = cache_dir / key
+    emb_path, meta_path = d / "embeddings.npy", d / "docs_meta.json"
+    if emb_path.exists() and meta_path.exists():
+        with open(meta_path, "r", encoding="utf8") as f:
+            return d, np.load(emb_path), json.load(f)
+
+    meta = build_chunks(docs, chunk_size, overlap)
+    texts = [meta[str(i)]["chunk"] for i in range(len(meta))]
+    emb = model.encode(texts, convert_to_numpy=True, show_progress_bar=False).astype("float32")
+    faiss.normalize_L2(emb)
+    d.mkdir(parents=True, exist_ok=True)
+    np.save(emb_path, emb)
+    with open(meta_path, "w", encoding="utf8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return d, emb, meta
+
+
+def load_or_build_index(cache_entry: Path, emb: np.ndarray, index_type: str):
+    path = cache_entry / f"index_{index_type.replace(',', '_')}.faiss"
+    if path.exists():
+        return faiss.read_index(str(path))
+    spec = index_type
+    if spec.startswith("IVF") and "{nlist}" in spec:
+        # IVF needs fewer lists than vectors to train; scale with corpus size
+        spec = spec.format(nlist=max(1, int(np.sqrt(len(emb)))))
+    index = faiss.index_factory(emb.shape[1], spec, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(emb)
+    index.add(emb)
+    faiss.write_index(index, str(path))
+    return index
+
+
+# ---------- Evaluation ----------
+
+def evaluate(index, meta: Dict[str, dict], model: SentenceTransformer, labels: List[dict],
+             top_ks: List[int], thresholds: List[float]) -> List[dict]:
+    """
+    Runs every question through the serving-path shape (single encode +
+    search) once at max(k), then scores each (k, threshold) combination from
+    the same hits, since neither changes the search cost meaningfully.
+    """
+    max_k = max(top_ks)
+    latencies, hits = [], []
+    for label in labels:
+        start = time.perf_counter()
+        q = model.encode([label["question"]], convert_to_numpy=True).astype("float32")
+        faiss.normalize_L2(q)
+        D, I = index.search(q, max_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits.append([(float(s), int(i)) for s, i in zip(D[0], I[0]) if int(i) >= 0])
+
+    latency = summarize(latencies)
+    rows = []
+    for k in top_ks:
+        for threshold in thresholds:
+            found, rr, prompt_tokens, n_chunks = 0, 0.0, [], []
+            for label, h in zip(labels, hits):
+                kept = [(s, i) for s, i in h[:k] if s >= threshold]
+                chunks = []
+                for s, i in kept:
+                    m = meta.get(str(i), {})
+                    chunks.append({"id": i, "score": s, "text": m.get("chunk", "")[:2000], "source": m.get("source", "unknown")})
+                ranks = [r for r, (_, i) in enumerate(kept, start=1) if is_relevant(label, meta.get(str(i), {}))]
+                if ranks:
+                    found += 1
+                    rr += 1.0 / ranks[0]
+                context, used = safe_build_context(chunks, label["question"])
+                prompt_tokens.append(estimate_tokens(context) if context else 0)
+                n_chunks.append(len(used))
+            n = len(labels)
+            rows.append({
+                "top_k": k,
+                "threshold": threshold,
+                "recall_at_k": round(found / n, 4),
+                "mrr": round(rr / n, 4),
+                "prompt_tokens_mean": round(sum(prompt_tokens) / n, 1),
+                "chunks_mean": round(sum(n_chunks) / n, 2),
+                "retrieval_ms": latency,
+            })
+    return rows
+
+
+def pick_fastest(rows: List[dict], min_recall: float, min_mrr: float) -> Optional[dict]:
+    ok = [r for r in rows if r["recall_at_k"] >= min_recall and r["mrr"] >= min_mrr]
+    if not ok:
+        return None
+    # p95 first (what users feel), prompt size as the tie-breaker since it
+    # drives LLM latency downstream.
+    return min(ok, key=lambda r: (r["retrieval_ms"]["p95"], r["prompt_tokens_mean"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep retrieval parameters and report quality vs latency.")
+    parser.add_argument("--labels", required=True, help="JSONL of {question, sources, contains?}")
+    parser.add_argument("--docs", default=str(BACKEND_DIR / "ingest" / "docs"))
+    parser.add_argument("--models", type=_csv(str), default=["all-MiniLM-L6-v2"])
+    parser.add_argument("--chunk-sizes", type=_csv(int), default=[400])
+    parser.add_argument("--overlaps", type=_csv(int), default=[100])
+    parser.add_argument("--top-k", type=_csv(int), default=[3])
+    parser.add_argument("--thresholds", type=_csv(float), default=[0.25])
+    parser.add_argument("--index-types", type=_csv(str), default=["Flat"],
+                        help="faiss index_factory specs, e.g. Flat,HNSW32,IVF{nlist};Flat (use ; for , inside a spec)")
+    parser.add_argument("--min-recall", type=float, default=0.8)
+    parser.add_argument("--min-mrr", type=float, default=0.0)
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE))
+    parser.add_argument("--out", default=None, help="write JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    labels = load_labels(args.labels)
+    docs = read_text_files(args.docs)
+    cache_dir = Path(args.cache_dir)
+    index_types = [t.replace(";", ",") for t in args.index_types]
+
+    rows = []
+    for model_name in args.models:
+        model = SentenceTransformer(model_name)
+        for chunk_size in args.chunk_sizes:
+            for overlap in args.overlaps:
+                if overlap >= chunk_size:
+                    continue
+                entry, emb, meta = load_or_embed(cache_dir, model, model_name, docs, chunk_size, overlap)
+                for index_type in index_types:
+                    try:
+                        index = load_or_build_index(entry, emb, index_type)
+                    except Exception as e:
+                        logger.warning("Skipping index %s (%d vectors): %s", index_type, len(emb), e)
+                        continue
+                    for row in evaluate(index, meta, model, labels, args.top_k, args.thresholds):
+                        row.update({"model": model_name, "chunk_size": chunk_size, "overlap": overlap,
+                                    "index_type": index_type, "vectors": len(emb)})
+                        rows.append(row)
+                        print(f"{model_name} cs={chunk_size} ov={overlap} {index_type} k={row['top_k']} "
+                              f"thr={row['threshold']}: recall={row['recall_at_k']:.3f} mrr={row['mrr']:.3f} "
+                              f"tokens={row['prompt_tokens_mean']:.0f} p95={row['retrieval_ms']['p95']:.1f}ms",
+                              file=sys.stderr)
+
+    report = {
+        "labels": len(labels),
+        "quality_bar": {"min_recall": args.min_recall, "min_mrr": args.min_mrr},
+        "recommended": pick_fastest(rows, args.min_recall, args.min_mrr),
+        "results": rows,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf8")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,347 @@
+# bench/run.py
+# Usage (from backend/):
+#   python -m bench.run --workers 2 --threads 8 --concurrency 16 --duration 30 --out bench.json
+#   python -m bench.run --server werkzeug --requests 500 --llm-latency-ms 300
+#   python -m bench.run --server uvicorn --workers 2 --concurrency 256 --duration 30
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bench.corpus import load_corpus
+from bench.fakes import sign_token
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+# ---------- Stats helpers ----------
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+        "p50": round(percentile(values, 0.5), 3),
+        "p95": round(percentile(values, 0.95), 3),
+        "p99": round(percentile(values, 0.99), 3),
+        "max": round(max(values), 3) if values else 0.0,
+    }
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    timings = {}
+    for part in (header or "").split(","):
+        name, _, rest = part.strip().partition(";")
+        if rest.startswith("dur="):
+            try:
+                timings[name] = float(rest[4:])
+            except ValueError:
+                pass
+    return timings
+
+
+# ---------- Process / memory sampling ----------
+
+def _rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except Exception:
+        return None
+
+
+def _children(pid: int) -> List[int]:
+    kids = []
+    for p in Path("/proc").glob("[0-9]*"):
+        try:
+            stat = (p / "stat").read_text()
+        except OSError:
+            continue
+        # ppid is the 2nd field after the ")" closing the command name
+        fields = stat.rsplit(")", 1)[1].split()
+        if int(fields[1]) == pid:
+            kids.append(int(p.name))
+    return kids
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, server_pid: int, forked_workers: bool, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.server_pid = server_pid
+        self.forked_workers = forked_workers
+        self.interval = interval
+        self.peak: Dict[int, float] = {}
+        self.last: Dict[int, float] = {}
+        self._halt = threading.Event()
+
+    def sample(self):
+        pids = _children(self.server_pid) if self.forked_workers else [self.server_pid]
+        for pid in pids:
+            rss = _rss_mb(pid)
+            if rss is None:
+                continue
+            self.last[pid] = rss
+            self.peak[pid] = max(self.peak.get(pid, 0.0), rss)
+
+    def run(self):
+        while not self._halt.is_set():
+            self.sample()
+            self._halt.wait(self.interval)
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+
+# ---------- Server lifecycle ----------
+
+def start_server(args) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "BENCH_DB": args.db,
+        "BENCH_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "BENCH_LLM_JITTER_MS": str(args.llm_jitter_ms),
+        "BENCH_LLM_ERROR_RATE": str(args.llm_error_rate),
+        "BENCH_LOAD_NLU": "1" if args.load_nlu else "0",
+        "BENCH_ANSWER_CACHE": "1" if args.answer_cache else "0",
+        "BENCH_SEED_EMAILS": ",".join(f"user{i}@bench.local" for i in range(args.users)),
+        "BENCH_PORT": str(args.port),
+        "BENCH_APP": "asgi" if args.server == "uvicorn" else "flask",
+    })
+    if args.cpu_workers:
+        env["ASGI_CPU_WORKERS"] = str(args.cpu_workers)
+    if args.server == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "bench.server:app", "--host", "127.0.0.1", "--port", str(args.port),
+               "--workers", str(args.workers), "--no-access-log", "--backlog", "4096"]
+    elif args.server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "-k", "gthread",
+               "--threads", str(args.threads), "-b", f"127.0.0.1:{args.port}", "--timeout", "300",
+               "bench.server:app"]
+    else:
+        cmd = [sys.executable, "-m", "bench.server"]
+    return subprocess.Popen(cmd, cwd=str(BACKEND_DIR), env=env)
+
+
+def wait_healthy(base_url: str, proc: subprocess.Popen, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=2) as r:
+                if r.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("server did not become healthy in time")
+
+
+# ---------- Load generation ----------
+
+def send_query(base_url: str, token: str, transcript: str, session_id: str, timeout: float) -> dict:
+    body = json.dumps({"transcript": transcript, "session_id": session_id}).encode()
+    req = urllib.request.Request(f"{base_url}/query", data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {token}",
+    })
+    start = time.perf_counter()
+    status, headers = 0, {}
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            r.read()
+            status, headers = r.status, r.headers
+    except urllib.error.HTTPError as e:
+        status, headers = e.code, e.headers
+    except (urllib.error.URLError, OSError):
+        status = -1
+    return {
+        "ms": (time.perf_counter() - start) * 1000,
+        "status": status,
+        "stages": parse_server_timing(headers.get("Server-Timing") if headers else None),
+        "worker": headers.get("X-Bench-Worker") if headers else None,
+    }
+
+
+def run_load(args, base_url: str, corpus: List[str]) -> tuple:
+    tokens = [sign_token(f"bench-user-{i}", email=f"user{i}@bench.local") for i in range(args.users)]
+    results = []
+    results_lock = threading.Lock()
+    counter = {"n": 0}
+    deadline = time.time() + args.duration if args.duration else None
+    rng = random.Random(args.seed)
+    order = corpus[:]
+    rng.shuffle(order)
+
+    def next_job():
+        with results_lock:
+            n = counter["n"]
+            if args.requests and n >= args.requests:
+                return None
+            if deadline and time.time() >= deadline:
+                return None
+            counter["n"] += 1
+        return n
+
+    def client(client_id: int):
+        token = tokens[client_id % len(tokens)]
+        while True:
+            n = next_job()
+            if n is None:
+                return
+            # A fresh session per request: every request does its own
+            # retrieval instead of reusing the previous turn's chunks.
+            session_id = f"bench-{client_id}-{n}"
+            res = send_query(base_url, token, order[n % len(order)], session_id, args.timeout)
+            with results_lock:
+                results.append(res)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i in range(args.concurrency):
+            pool.submit(client, i)
+    return results, time.perf_counter() - start
+
+
+def build_report(args, results: List[dict], elapsed: float, sampler: MemorySampler) -> dict:
+    ok = [r for r in results if 200 <= r["status"] < 300]
+    stage_values = defaultdict(list)
+    per_worker = defaultdict(list)
+    for r in ok:
+        for stage, ms in r["stages"].items():
+            stage_values[stage].append(ms)
+        per_worker[r["worker"] or "unknown"].append(r["ms"])
+
+    workers = {}
+    for pid in set(list(sampler.peak.keys())) | {int(w) for w in per_worker if w.isdigit()}:
+        lat = per_worker.get(str(pid), [])
+        workers[str(pid)] = {
+            "requests": len(lat),
+            "throughput_rps": round(len(lat) / elapsed, 3) if elapsed else 0.0,
+            "latency_ms": summarize(lat),
+            "rss_peak_mb": round(sampler.peak.get(pid, 0.0), 1),
+            "rss_end_mb": round(sampler.last.get(pid, 0.0), 1),
+        }
+
+    statuses = defaultdict(int)
+    for r in results:
+        statuses[str(r["status"])] += 1
+
+    return {
+        "meta": {
+            "label": args.label,
+            "git": _git_describe(),
+            "timestamp": int(time.time()),
+            "config": {k: v for k, v in vars(args).items() if k not in ("out",)},
+        },
+        "totals": {
+            "requests": len(results),
+            "ok": len(ok),
+            "statuses": dict(statuses),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        },
+        "latency_ms": summarize([r["ms"] for r in ok]),
+        "stages_ms": {stage: summarize(v) for stage, v in sorted(stage_values.items())},
+        "workers": workers,
+    }
+
+
+def _git_describe() -> dict:
+    def _git(*a):
+        try:
+            return subprocess.check_output(["git", *a], cwd=str(BACKEND_DIR), stderr=subprocess.DEVNULL).decode().strip()
+        except Exception:
+            return None
+    return {"commit": _git("rev-parse", "HEAD"), "branch": _git("rev-parse", "--abbrev-ref", "HEAD")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a query corpus against the app with local fakes.")
+    parser.add_argument("--server", choices=["gunicorn", "werkzeug", "uvicorn"], default="gunicorn",
+                        help="uvicorn serves the ASGI app (asgi.py), the others the Flask app")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--cpu-workers", type=int, default=0, help="uvicorn: ASGI_CPU_WORKERS (0 = app default)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default="bench.sqlite3", help="SQLite path or SQLAlchemy URL of a throwaway DB")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=0, help="stop after N requests (0 = use --duration)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run when --requests is 0")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--load-nlu", action="store_true", help="load the real zero-shot NLU model")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="keep the answer cache and warmup on (off by default: the corpus repeats, so "
+                             "most requests would be cache hits and never reach the LLM)")
+    parser.add_argument("--corpus-log", default=None, help="interactions.log-style JSONL (default: backend/interactions.log)")
+    parser.add_argument("--corpus-extra", default=None, help="extra transcripts, one per line")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--out", default=None, help="write JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+    if args.requests:
+        args.duration = 0
+
+    corpus = load_corpus(args.corpus_log, args.corpus_extra)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    proc = start_server(args)
+    try:
+        wait_healthy(base_url, proc, args.startup_timeout)
+        token = sign_token("bench-warmup", email="user0@bench.local")
+        for i in range(args.warmup):
+            send_query(base_url, token, corpus[i % len(corpus)], "bench-warmup", args.timeout)
+
+        forked = args.server == "gunicorn" or (args.server == "uvicorn" and args.workers > 1)
+        sampler = MemorySampler(proc.pid, forked_workers=forked)
+        sampler.start()
+        results, elapsed = run_load(args, base_url, corpus)
+        sampler.stop()
+        sampler.sample()
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    report = build_report(args, results, elapsed, sampler)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf8")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
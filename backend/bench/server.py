@@ -0,0 +1,113 @@
+# bench/server.py
+# The real Flask app wired to local fakes. Configured through env vars so it
+# works both in-process and as a gunicorn target: gunicorn bench.server:app
+# BENCH_APP=asgi serves the async app instead: uvicorn bench.server:app
+# (on SQLite it uses aiosqlite, listed in requirements.txt)
+import os
+import logging
+
+from bench import fakes
+
+logger = logging.getLogger("voicebot.bench")
+
+BENCH_DB = os.environ.get("BENCH_DB", "bench.sqlite3")
+LLM_LATENCY_MS = float(os.environ.get("BENCH_LLM_LATENCY_MS", "800"))
+LLM_JITTER_MS = float(os.environ.get("BENCH_LLM_JITTER_MS", "200"))
+LLM_ERROR_RATE = float(os.environ.get("BENCH_LLM_ERROR_RATE", "0"))
+LOAD_NLU = os.environ.get("BENCH_LOAD_NLU", "0") == "1"
+ANSWER_CACHE = os.environ.get("BENCH_ANSWER_CACHE", "0") == "1"
+SEED_EMAILS = [e for e in os.environ.get("BENCH_SEED_EMAILS", "").split(",") if e]
+BENCH_APP = os.environ.get("BENCH_APP", "flask")
+
+
+def _prepare_database():
+    """
+    BENCH_DB is either a full SQLAlchemy URL (e.g. a throwaway local Postgres)
+    or a path to a SQLite file that we create with a compatible schema.
+    Must run before `app` is imported: the DB engine is created at import.
+    """
+    if "://" in BENCH_DB:
+        os.environ["DATABASE_URL"] = BENCH_DB
+        return
+    fakes.create_sqlite_db(BENCH_DB, seed_orders_for=SEED_EMAILS)
+    fakes.install_sqlite_hooks()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(BENCH_DB)}"
+
+
+def _prepare():
+    _prepare_database()
+    # Never talk to the real Gemini, even if a key is in the environment.
+    os.environ.pop("GEMINI_API_KEY", None)
+    os.environ.pop("GOOGLE_API_KEY", None)
+    if not ANSWER_CACHE:
+        # The corpus repeats: with the answer cache (and its warmup) on, most
+        # requests are cache hits and the fake LLM call never runs.
+        os.environ["ANSWER_CACHE_TTL_S"] = "0"
+        os.environ["WARMUP_ON_START"] = "0"
+
+
+def _install_fakes():
+    """After the app is created: local token verifier, fake Gemini, optional real NLU."""
+    from app.core.auth import set_token_verifier
+    from app.services import llm
+
+    set_token_verifier(fakes.verify_token)
+    llm.GENAI_CLIENT = fakes.FakeGeminiClient(LLM_LATENCY_MS, LLM_JITTER_MS, LLM_ERROR_RATE)
+
+    if LOAD_NLU:
+        from app.services.nlu import load_nlu_model
+        load_nlu_model()
+
+
+def create_bench_app():
+    _prepare()
+    from app import create_app
+
+    app = create_app()
+    _install_fakes()
+
+    @app.after_request
+    def _tag_worker(response):
+        # Lets the runner attribute requests and memory to gunicorn workers.
+        response.headers["X-Bench-Worker"] = str(os.getpid())
+        return response
+
+    logger.info("Bench app ready (db=%s, llm=%.0fms±%.0f, nlu=%s, answer cache=%s)",
+                BENCH_DB, LLM_LATENCY_MS, LLM_JITTER_MS, LOAD_NLU, ANSWER_CACHE)
+    return app
+
+
+def create_bench_asgi_app():
+    _prepare()
+    from app import create_asgi_app
+
+    asgi_app = create_asgi_app()
+    _install_fakes()
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return await asgi_app(scope, receive, send)
+
+        async def send_tagged(message):
+            # X-Bench-Worker, as the Flask app's after_request adds it
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-bench-worker", str(os.getpid()).encode())]
+            await send(message)
+
+        await asgi_app(scope, receive, send_tagged)
+
+    logger.info("Bench ASGI app ready (db=%s, llm=%.0fms±%.0f, nlu=%s, answer cache=%s)",
+                BENCH_DB, LLM_LATENCY_MS, LLM_JITTER_MS, LOAD_NLU, ANSWER_CACHE)
+    return app
+
+
+app = create_bench_asgi_app() if BENCH_APP == "asgi" else create_bench_app()
+
+# Single-process threaded server (no gunicorn): python -m bench.server
+if __name__ == "__main__":
+    port = int(os.environ.get("BENCH_PORT", 8765))
+    if BENCH_APP == "asgi":
+        import uvicorn
+        uvicorn.run(app, host="127.0.0.1", port=port)
+    else:
+        app.run(host="127.0.0.1", port=port, threaded=True)
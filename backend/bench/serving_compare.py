@@ -0,0 +1,115 @@
+# bench/serving_compare.py
+# Flask + gunicorn (gthread) vs the ASGI app on uvicorn, same fakes and corpus,
+# swept over client concurrency. Reports throughput, p99 and error rate per
+# level, and each setup's capacity: the most concurrent connections served
+# within --p99-slo-ms and --max-error-rate.
+# Usage (from backend/):
+#   python -m bench.serving_compare --concurrency 16,64,256,512 --duration 20 --out serving.json
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+from bench import run as bench_run
+
+
+def _run_level(setup: Dict, concurrency: int, args, out_dir: Path) -> Dict:
+    out = out_dir / f"{setup['name']}-c{concurrency}.json"
+    argv = ["--server", setup["server"], "--workers", str(args.workers), "--threads", str(args.threads),
+            "--concurrency", str(concurrency), "--duration", str(args.duration), "--port", str(args.port),
+            "--db", args.db, "--users", str(args.users), "--llm-latency-ms", str(args.llm_latency_ms),
+            "--llm-jitter-ms", str(args.llm_jitter_ms), "--timeout", str(args.timeout),
+            "--label", f"{setup['name']}-c{concurrency}", "--out", str(out)]
+    if args.load_nlu:
+        argv.append("--load-nlu")
+    if args.answer_cache:
+        argv.append("--answer-cache")
+    if setup["server"] == "uvicorn" and args.cpu_workers:
+        argv += ["--cpu-workers", str(args.cpu_workers)]
+    report = bench_run.main(argv)
+
+    totals = report["totals"]
+    errors = totals["requests"] - totals["ok"]
+    return {
+        "concurrency": concurrency,
+        "requests": totals["requests"],
+        "throughput_rps": totals["throughput_rps"],
+        "error_rate": round(errors / totals["requests"], 4) if totals["requests"] else 1.0,
+        "statuses": totals["statuses"],
+        "p50_ms": report["latency_ms"]["p50"],
+        "p99_ms": report["latency_ms"]["p99"],
+        "rss_peak_mb": round(sum(w["rss_peak_mb"] for w in report["workers"].values()), 1),
+        "report": str(out),
+    }
+
+
+def _capacity(levels: List[Dict], args) -> int:
+    """Highest concurrency level inside the SLO (0 when none is)."""
+    ok = [lv["concurrency"] for lv in levels
+          if lv["error_rate"] <= args.max_error_rate and lv["p99_ms"] <= args.p99_slo_ms]
+    return max(ok) if ok else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-connection capacity and p99: gunicorn+Flask vs uvicorn+ASGI.")
+    parser.add_argument("--concurrency", default="16,64,256", help="comma separated client concurrency levels")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per level")
+    parser.add_argument("--workers", type=int, default=2, help="processes, for both servers")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--cpu-workers", type=int, default=0, help="ASGI_CPU_WORKERS for the uvicorn runs")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default="bench.sqlite3")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--load-nlu", action="store_true")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="keep the answer cache on (off by default, so every request waits on the LLM)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--p99-slo-ms", type=float, default=3000.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--only", choices=["gunicorn", "uvicorn"], default=None)
+    parser.add_argument("--out-dir", default="bench_out", help="per-run bench.run reports")
+    parser.add_argument("--out", default=None, help="write the summary JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    setups = [
+        {"name": "gunicorn", "server": "gunicorn", "desc": f"Flask, gunicorn gthread {args.workers}x{args.threads}"},
+        {"name": "uvicorn", "server": "uvicorn", "desc": f"ASGI, uvicorn x{args.workers}"},
+    ]
+
+    summary = {"config": {k: v for k, v in vars(args).items() if k not in ("out",)}, "setups": {}}
+    for setup in setups:
+        if args.only and setup["name"] != args.only:
+            continue
+        results = []
+        for c in levels:
+            print(f"{setup['name']}: concurrency {c}...", file=sys.stderr)
+            results.append(_run_level(setup, c, args, out_dir))
+        summary["setups"][setup["name"]] = {
+            "desc": setup["desc"],
+            "capacity_connections": _capacity(results, args),
+            "levels": results,
+        }
+
+    for name, s in summary["setups"].items():
+        print(f"\n{name} ({s['desc']}): capacity {s['capacity_connections']} connections "
+              f"at p99 <= {args.p99_slo_ms:.0f}ms", file=sys.stderr)
+        for lv in s["levels"]:
+            print(f"  c={lv['concurrency']:<5} rps={lv['throughput_rps']:<8} p99={lv['p99_ms']:<9} "
+                  f"errors={lv['error_rate']:.2%}  rss={lv['rss_peak_mb']}MB", file=sys.stderr)
+
+    text = json.dumps(summary, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf8")
+    else:
+        print(text)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
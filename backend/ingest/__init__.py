@@ -0,0 +1,4 @@
+"""
+Offline index builder: chunk, embed and write the FAISS index and metadata
+the retrieval service loads. Entry point: `python ingest/ingest.py --help`.
+"""
@@ -0,0 +1,177 @@
+# ingest/dedup.py
+# Near-duplicate chunk elimination for ingest.py. MinHash signatures over word
+# shingles, LSH banding to find candidate pairs without comparing every chunk
+# to every other, then an embedding cosine check so chunks that share wording
+# but not meaning (templated pages with different specifics) stay apart.
+# Each cluster keeps its first chunk (ingestion order) and the sources of all.
+import re
+import zlib
+import numpy as np
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+# 16 bands x 8 rows: pairs above ~0.7 estimated Jaccard become candidates
+LSH_BANDS = 16
+JACCARD_THRESHOLD = 0.8
+COSINE_THRESHOLD = 0.95
+
+# MinHash permutations are (a*x + b) mod _PRIME. With a, x < 2**32 the
+# product stays below 2**64, so every step is exact in uint64.
+_PRIME = np.uint64(4294967291)  # largest prime below 2**32
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Token estimates for the report, as app.services.rag.estimate_tokens does them
+try:
+    import tiktoken
+    _ENC = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENC = None
+
+
+def estimate_tokens(text):
+    if not text:
+        return 1
+    if _ENC is not None:
+        return len(_ENC.encode(text))
+    return max(1, len(text) // 4)
+
+
+# ---------- MinHash / LSH ----------
+
+def shingles(text, k=SHINGLE_WORDS):
+    """Distinct crc32 hashes of the word k-grams of `text` (case and punctuation folded)."""
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    grams = [" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))]
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf8")) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+def _permutations(num_perm=NUM_PERM, seed=1):
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM):
+    """(len(texts), num_perm) uint64 signatures; rows of shingle-less texts are all max."""
+    a, b = _permutations(num_perm)
+    sigs = np.full((len(texts), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for i, text in enumerate(texts):
+        sh = shingles(text) % _PRIME
+        if len(sh):
+            sigs[i] = ((np.outer(sh, a) % _PRIME + b) % _PRIME).min(axis=0)
+    return sigs
+
+
+def _candidate_pairs(sigs, valid, bands=LSH_BANDS):
+    """
+    Pairs that share at least one LSH band bucket. Each bucket links its
+    members to its first member only, so a boilerplate block repeated in a
+    thousand files costs a thousand checks rather than half a million.
+    """
+    rows = sigs.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = {}
+        block = sigs[:, band * rows:(band + 1) * rows]
+        for i in np.flatnonzero(valid):
+            buckets.setdefault(block[i].tobytes(), []).append(int(i))
+        for members in buckets.values():
+            for other in members[1:]:
+                pairs.add((members[0], other))
+    return pairs
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def dedup_chunks(texts, embeddings, jaccard_threshold=JACCARD_THRESHOLD, cosine_threshold=COSINE_THRESHOLD):
+    """
+    Cluster near-duplicate chunks. `embeddings` must be L2-normalised rows.
+    Returns (keep, clusters): the kept chunk indices in ingestion order and
+    {kept index: [member indices, kept one first]}.
+    """
+    sigs = minhash_signatures(texts)
+    valid = sigs[:, 0] != np.iinfo(np.uint64).max
+    parent = list(range(len(texts)))
+    for i, j in sorted(_candidate_pairs(sigs, valid)):
+        if float(np.mean(sigs[i] == sigs[j])) < jaccard_threshold:
+            continue
+        if float(np.dot(embeddings[i], embeddings[j])) < cosine_threshold:
+            continue
+        ri, rj = _find(parent, i), _find(parent, j)
+        if ri != rj:
+            # the earlier chunk stays the representative
+            parent[max(ri, rj)] = min(ri, rj)
+
+    clusters = {}
+    for i in range(len(texts)):
+        clusters.setdefault(_find(parent, i), []).append(i)
+    keep = sorted(clusters)
+    return keep, clusters
+
+
+# ---------- Report ----------
+
+def _top_k(index_emb, queries, top_k, score_threshold):
+    scores = queries @ index_emb.T
+    k = min(top_k, index_emb.shape[0])
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return [[int(j) for j in row if scores[q, j] >= score_threshold] for q, row in enumerate(top)]
+
+
+def dedup_report(texts, embeddings, keep, clusters, queries=None, top_k=3, score_threshold=0.25,
+                 samples=200, seed=0):
+    """
+    Index and prompt size before vs after dedup. Prompt figures come from
+    top-k retrieval for `queries` (normalised embeddings; default: a sample
+    of the chunks themselves): context tokens per query, and the share of
+    them spent on text already in the same context (a duplicate's cluster
+    was retrieved earlier in the list).
+    """
+    root_of = {m: root for root, members in clusters.items() for m in members}
+    tokens = [estimate_tokens(t) for t in texts]
+    dim = embeddings.shape[1] if len(embeddings) else 0
+
+    if queries is None:
+        rng = np.random.RandomState(seed)
+        picked = rng.choice(len(texts), size=min(samples, len(texts)), replace=False) if len(texts) else []
+        queries = embeddings[picked]
+
+    def prompt_stats(index_ids):
+        if not len(queries) or not index_ids:
+            return {"context_tokens": 0.0, "redundant_tokens": 0.0, "distinct_chunks": 0.0}
+        hits = _top_k(embeddings[index_ids], queries, top_k, score_threshold)
+        total = redundant = distinct = 0
+        for row in hits:
+            seen = set()
+            for pos in row:
+                i = index_ids[pos]
+                total += tokens[i]
+                if root_of[i] in seen:
+                    redundant += tokens[i]
+                else:
+                    seen.add(root_of[i])
+            distinct += len(seen)
+        n = len(hits)
+        return {"context_tokens": round(total / n, 1), "redundant_tokens": round(redundant / n, 1),
+                "distinct_chunks": round(distinct / n, 2)}
+
+    before = prompt_stats(list(range(len(texts))))
+    after = prompt_stats(list(keep))
+    return {
+        "chunks_before": len(texts),
+        "chunks_after": len(keep),
+        "clusters_merged": sum(1 for m in clusters.values() if len(m) > 1),
+        "index_mb_before": round(len(texts) * dim * 4 / 2 ** 20, 3),
+        "index_mb_after": round(len(keep) * dim * 4 / 2 ** 20, 3),
+        "chunk_tokens_before": sum(tokens),
+        "chunk_tokens_after": sum(tokens[i] for i in keep),
+        "prompt": {"queries": len(queries), "top_k": top_k, "before": before, "after": after},
+    }
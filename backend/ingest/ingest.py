@@ -1,10 +1,20 @@
 # ingest/ingest.py
 # Usage: python ingest.py --input_dir ../docs --index_out faiss.index --meta_out docs_meta.json
+# Per collection (served as one retrieval shard each, see COLLECTIONS_DIR):
+#   python ingest.py --input_dir ../docs/tenant_a --collection tenant_a
+#   python ingest.py --input_dir ../docs --per_subdir [--only tenant_a,products]
+# Near-duplicate chunks are collapsed (see dedup.py) unless --no_dedup; the
+# size report lands next to the metadata as <meta>.dedup.json.
 import os, json, argparse
 from sentence_transformers import SentenceTransformer
 import faiss
 from pathlib import Path
 from tqdm import tqdm
+try:
+    from .dedup import dedup_chunks, dedup_report, JACCARD_THRESHOLD, COSINE_THRESHOLD
+except ImportError:
+    # run as a script: python ingest/ingest.py
+    from dedup import dedup_chunks, dedup_report, JACCARD_THRESHOLD, COSINE_THRESHOLD
 
 MODEL = "all-MiniLM-L6-v2"
 CHUNK_SIZE = 400
@@ -28,34 +38,93 @@ def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
         i += chunk_size - overlap
     return chunks
 
-def main(input_dir, index_out, meta_out):
-    model = SentenceTransformer(MODEL)
+def build(model, input_dir, index_out, meta_out, dedup=True, jaccard=JACCARD_THRESHOLD,
+          cosine=COSINE_THRESHOLD, query_texts=None):
     docs = read_text_files(input_dir)
     all_chunks = []
-    meta = {}
-    idx = 0
+    chunk_sources = []
     for d in docs:
         chunks = chunk_text(d["text"])
         for c in chunks:
-            meta[str(idx)] = {"source": d["source"], "chunk": c}
             all_chunks.append(c)
-            idx += 1
+            chunk_sources.append(d["source"])
 
     print("Embedding", len(all_chunks), "chunks...")
     embeddings = model.encode(all_chunks, convert_to_numpy=True, show_progress_bar=True)
     dim = embeddings.shape[1]
     index = faiss.IndexFlatIP(dim)  # inner product; we will normalize
     faiss.normalize_L2(embeddings)
+
+    if not dedup:
+        keep, clusters = list(range(len(all_chunks))), {i: [i] for i in range(len(all_chunks))}
+    else:
+        keep, clusters = dedup_chunks(all_chunks, embeddings, jaccard, cosine)
+        queries = None
+        if query_texts:
+            queries = model.encode(query_texts, convert_to_numpy=True)
+            faiss.normalize_L2(queries)
+        report = dedup_report(all_chunks, embeddings, keep, clusters, queries=queries)
+        with open(os.path.splitext(meta_out)[0] + ".dedup.json", "w", encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+        before, after = report["prompt"]["before"], report["prompt"]["after"]
+        print(f"Dedup: {report['chunks_before']} -> {report['chunks_after']} chunks "
+              f"({report['clusters_merged']} clusters merged), index {report['index_mb_before']} -> "
+              f"{report['index_mb_after']} MB; top-{report['prompt']['top_k']} context repeats "
+              f"{before['redundant_tokens']} -> {after['redundant_tokens']} tokens/query")
+
+    meta = {}
+    for idx, i in enumerate(keep):
+        # One vector per cluster; "sources" lists every file the text appeared in
+        sources = list(dict.fromkeys(chunk_sources[m] for m in clusters[i]))
+        meta[str(idx)] = {"source": chunk_sources[i], "chunk": all_chunks[i], "sources": sources}
+    embeddings = embeddings[keep]
     index.add(embeddings)
-    faiss.write_index(index, index_out)
-    with open(meta_out, "w", encoding="utf8") as f:
+    # Write beside the target and rename, so a worker reloading this shard
+    # never reads a half-written file.
+    faiss.write_index(index, index_out + ".tmp")
+    with open(meta_out + ".tmp", "w", encoding="utf8") as f:
         json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(index_out + ".tmp", index_out)
+    os.replace(meta_out + ".tmp", meta_out)
     print("Saved index and metadata")
 
+def collection_paths(collections_dir, name):
+    out_dir = os.path.join(collections_dir, name)
+    os.makedirs(out_dir, exist_ok=True)
+    return os.path.join(out_dir, "faiss.index"), os.path.join(out_dir, "docs_meta.json")
+
+def main(args):
+    model = SentenceTransformer(MODEL)
+    query_texts = None
+    if args.dedup_queries:
+        with open(args.dedup_queries, "r", encoding="utf8") as f:
+            query_texts = [line.strip() for line in f if line.strip()]
+    opts = {"dedup": not args.no_dedup, "jaccard": args.dedup_jaccard, "cosine": args.dedup_cosine,
+            "query_texts": query_texts}
+    if args.per_subdir:
+        only = set(args.only.split(",")) if args.only else None
+        for sub in sorted(Path(args.input_dir).iterdir()):
+            if not sub.is_dir() or (only and sub.name not in only):
+                continue
+            print(f"Collection {sub.name}:")
+            build(model, str(sub), *collection_paths(args.collections_dir, sub.name), **opts)
+    elif args.collection:
+        build(model, args.input_dir, *collection_paths(args.collections_dir, args.collection), **opts)
+    else:
+        build(model, args.input_dir, args.index_out, args.meta_out, **opts)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input_dir", required=True)
     parser.add_argument("--index_out", default="faiss.index")
     parser.add_argument("--meta_out", default="docs_meta.json")
+    parser.add_argument("--collection", help="write COLLECTIONS_DIR/<name>/ instead of --index_out/--meta_out")
+    parser.add_argument("--per_subdir", action="store_true", help="one collection per subdirectory of --input_dir")
+    parser.add_argument("--only", help="with --per_subdir: comma separated collections to rebuild")
+    parser.add_argument("--collections_dir", default="collections")
+    parser.add_argument("--no_dedup", action="store_true", help="keep near-duplicate chunks")
+    parser.add_argument("--dedup_jaccard", type=float, default=JACCARD_THRESHOLD, help="min estimated shingle Jaccard")
+    parser.add_argument("--dedup_cosine", type=float, default=COSINE_THRESHOLD, help="min embedding cosine")
+    parser.add_argument("--dedup_queries", help="transcripts (one per line) to measure prompt size with")
     args = parser.parse_args()
-    main(args.input_dir, args.index_out, args.meta_out)
+    main(args)
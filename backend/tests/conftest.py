@@ -0,0 +1,9 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Config reads DATABASE_URL at import: keep the tests off the real database
+os.environ.setdefault("DATABASE_URL", "sqlite://")
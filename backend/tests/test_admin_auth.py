@@ -0,0 +1,42 @@
+import pytest
+from flask import Flask, jsonify, request
+
+from app.config import Config
+from app.core.auth import admin_required
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(Config, "ADMIN_EMAILS", ["ops@acme.com"])
+    app = Flask(__name__)
+    claims = {}
+
+    @app.before_request
+    def _claims():
+        # stands in for firebase_auth_required
+        request.firebase_user = dict(claims)
+
+    @app.route("/admin/thing")
+    @admin_required
+    def thing():
+        return jsonify({"ok": True})
+
+    c = app.test_client()
+    c.claims = claims
+    return c
+
+
+@pytest.mark.parametrize("claims,status", [
+    ({"email": "ops@acme.com", "email_verified": True}, 200),
+    ({"email": "OPS@acme.com", "email_verified": True}, 200),
+    # anyone can create an account with an address they do not own
+    ({"email": "ops@acme.com", "email_verified": False}, 403),
+    ({"email": "ops@acme.com"}, 403),
+    ({"email": "dev@acme.com", "email_verified": True}, 403),
+    ({"admin": True}, 200),
+    ({"admin": "true"}, 403),
+    ({}, 403),
+])
+def test_admin_required(client, claims, status):
+    client.claims.update(claims)
+    assert client.get("/admin/thing").status_code == status
@@ -0,0 +1,165 @@
+import threading
+from contextlib import contextmanager
+import time
+
+import pytest
+
+from app.config import Config
+from app.core import admission
+from app.core.admission import Overloaded, StageGate, admit, classify_cost, shed
+
+
+@pytest.mark.parametrize("transcript,expected", [
+    ("hello there", ("cheap", "rule")),
+    ("thanks a lot", ("cheap", "rule")),
+    ("when are you open", ("cheap", "rule")),
+    ("where is my order", ("cheap", "order")),
+    ("has my parcel shipped yet", ("cheap", "order")),
+    # whole words only: "this" must not match the "hi" greeting
+    ("explain this backup plan in detail", ("standard", None)),
+    # rule keywords inside a real question stay on the RAG path
+    ("how do I return a damaged product", ("standard", None)),
+    ("is there a refund policy for devices", ("standard", None)),
+    ("call me", ("standard", None)),
+    ("how long does delivery take to canada", ("standard", None)),
+])
+def test_classify_cost(transcript, expected):
+    tier, kind, answer = classify_cost(transcript)
+    assert (tier, kind) == expected
+    assert (answer is not None) == (kind == "rule")
+
+
+def _gate(limit=1, target_ms=5.0, interval_ms=0.0, max_wait_ms=50.0):
+    return StageGate("test", limit, target_ms, interval_ms, max_wait_ms)
+
+
+def _hold(gate, release: threading.Event, tier="standard"):
+    entered = threading.Event()
+
+    def run():
+        with gate.enter(tier) as ok:
+            assert ok
+            entered.set()
+            release.wait(5)
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    assert entered.wait(5)
+    return t
+
+
+def test_free_slot_is_admitted():
+    gate = _gate()
+    with gate.enter("standard") as ok:
+        assert ok
+        assert gate.inflight == 1
+    assert gate.inflight == 0
+
+
+def test_standard_tier_times_out_when_full():
+    gate = _gate(max_wait_ms=30)
+    release = threading.Event()
+    holder = _hold(gate, release)
+    start = time.monotonic()
+    with gate.enter("standard") as ok:
+        assert not ok
+    assert time.monotonic() - start >= 0.03
+    release.set()
+    holder.join(5)
+
+
+def test_cheap_tier_queues_until_a_slot_frees():
+    gate = _gate(max_wait_ms=10)
+    release = threading.Event()
+    holder = _hold(gate, release)
+    threading.Timer(0.05, release.set).start()
+    with gate.enter("cheap") as ok:
+        assert ok
+    holder.join(5)
+
+
+def test_cheap_tier_wait_is_bounded():
+    gate = StageGate("test", 1, 5.0, 0.0, max_wait_ms=10, cheap_max_wait_ms=60)
+    release = threading.Event()
+    holder = _hold(gate, release)
+    start = time.monotonic()
+    with gate.enter("cheap") as ok:
+        assert not ok
+    assert 0.06 <= time.monotonic() - start < 2
+    release.set()
+    holder.join(5)
+
+
+def test_sustained_queue_delay_marks_overload_and_one_fast_entry_clears_it():
+    gate = _gate(target_ms=10, interval_ms=0)
+    gate._observe(50)
+    assert not gate.overloaded  # first delay above target only starts the interval
+    gate._observe(50)
+    assert gate.overloaded
+    gate._observe(1)
+    assert not gate.overloaded
+
+
+def test_overloaded_busy_stage_rejects_standard_but_not_cheap():
+    gate = _gate()
+    release = threading.Event()
+    holder = _hold(gate, release)
+    gate.overloaded = True
+    with gate.enter("standard") as ok:
+        assert not ok
+    threading.Timer(0.05, release.set).start()
+    with gate.enter("cheap") as ok:
+        assert ok
+    holder.join(5)
+
+
+def test_overloaded_idle_stage_recovers():
+    gate = _gate()
+    gate.overloaded = True
+    with gate.enter("standard") as ok:
+        assert ok
+    assert not gate.overloaded
+
+
+def test_admit_passes_through_when_disabled_or_unknown(monkeypatch):
+    with admit("no_such_stage") as ok:
+        assert ok
+    monkeypatch.setattr(admission, "_gates", {"llm": _gate(limit=1)})
+    monkeypatch.setattr(Config, "ADMISSION_ENABLED", False)
+    admission._gates["llm"].overloaded = True
+    with admit("llm") as ok:
+        assert ok
+
+
+def test_shed_raises_with_retry_after(monkeypatch):
+    gate = _gate()
+    gate.last_delay_ms = 4200
+    monkeypatch.setattr(admission, "_gates", {"llm": gate})
+    with pytest.raises(Overloaded) as e:
+        shed("llm")
+    assert e.value.stage == "llm"
+    assert e.value.retry_after == max(5, int(Config.ADMISSION_RETRY_AFTER_S))
+
+
+def test_standard_request_refused_at_nlu_is_shed(monkeypatch):
+    from app.api import routes
+
+    @contextmanager
+    def admit(stage, tier="standard"):
+        yield False
+
+    monkeypatch.setattr(routes, "admit", admit)
+    monkeypatch.setattr(routes, "classify_intent_hf", lambda t: pytest.fail("NLU ran"))
+    monkeypatch.setattr(routes, "_retrieve_and_generate", lambda *a, **kw: pytest.fail("went on to retrieval"))
+    monkeypatch.setattr(admission, "_gates", {"nlu": _gate()})
+
+    body, status, headers = routes._answer("how do I return a damaged product", None, None, None)
+    assert status == 503
+    assert body["stage"] == "nlu"
+    assert int(headers["Retry-After"]) >= 1
+
+    # a cheap request refused at the same gate still gets its canned answer
+    monkeypatch.setattr(routes, "insert_voice_query", lambda **kw: None)
+    body, status, _ = routes._answer("hello there", None, None, None)
+    assert status == 200
+    assert body["intent"] == "greet"
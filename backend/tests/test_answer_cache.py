@@ -0,0 +1,68 @@
+import pytest
+
+from app.config import Config
+from app.services import answer_cache
+from app.services.answer_cache import _key, clear, get_answer, store_answer
+
+SOURCES = [{"id": 3, "source": "faq.md", "score": 0.81, "collection": "default", "chunk": "long text"}]
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear()
+    yield
+    clear()
+
+
+def test_key_ignores_case_and_punctuation():
+    assert _key("Where's my ORDER?", None) == _key("where's my order", None) == "where's my order"
+    assert _key("  what   are your hours  ", None) == "what are your hours"
+
+
+def test_key_is_scoped_by_collections():
+    assert _key("pricing", "tenant_a") == "tenant_a|pricing"
+    assert _key("pricing", "tenant_a") != _key("pricing", "tenant_b") != _key("pricing", None)
+    assert _key("?!", "tenant_a") == ""
+
+
+def test_store_and_get_use_the_same_key():
+    store_answer("What are your hours?", "9 to 6", "model text", SOURCES)
+    hit = get_answer("what are your hours")
+    assert hit["reply"] == "9 to 6"
+    # only what a reply needs is kept, not the chunk text
+    assert hit["sources"] == [{"id": 3, "source": "faq.md", "score": 0.81, "collection": "default"}]
+
+
+def test_scoped_answers_do_not_leak_across_routes():
+    store_answer("pricing", "tenant a prices", None, [], scope="tenant_a")
+    assert get_answer("pricing") is None
+    assert get_answer("pricing", scope="tenant_b") is None
+    assert get_answer("pricing", scope="tenant_a")["reply"] == "tenant a prices"
+
+
+def test_empty_key_is_not_stored():
+    store_answer("?!", "noise", None, [])
+    assert len(answer_cache._cache) == 0
+
+
+def test_expired_entry_is_dropped():
+    store_answer("hours", "9 to 6", None, [], ttl_s=-1)
+    assert get_answer("hours") is None
+    assert len(answer_cache._cache) == 0
+
+
+def test_lru_eviction(monkeypatch):
+    monkeypatch.setattr(Config, "ANSWER_CACHE_MAX_ENTRIES", 2)
+    store_answer("one", "1", None, [])
+    store_answer("two", "2", None, [])
+    get_answer("one")  # touch: "two" is now least recently used
+    store_answer("three", "3", None, [])
+    assert get_answer("two") is None
+    assert get_answer("one")["reply"] == "1"
+    assert get_answer("three")["reply"] == "3"
+
+
+def test_disabled_cache(monkeypatch):
+    monkeypatch.setattr(Config, "ANSWER_CACHE_TTL_S", 0)
+    store_answer("hours", "9 to 6", None, [])
+    assert get_answer("hours") is None
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.config import Config
+from app.services import asr
+from app.services.asr import AudioStream, StubASR, parse_wav_header
+
+RATE = 16000
+
+
+def _pcm(seconds, amplitude, seed=0):
+    samples = np.random.RandomState(seed).randn(int(RATE * seconds)) * amplitude
+    return (np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def _utterance(speech_s=1.5):
+    # quiet lead-in sets the noise floor, then speech, then the end-of-utterance silence
+    return [_pcm(0.3, 0.001, 1), _pcm(speech_s, 0.3, 2), _pcm(1.0, 0.001, 3)]
+
+
+def _feed(stream, chunks, piece=3200):
+    for chunk in chunks:
+        for i in range(0, len(chunk), piece):
+            stream.feed(chunk[i:i + piece])
+            if stream.ended:
+                return
+
+
+class SlowASR(StubASR):
+    def __init__(self, delay_s):
+        super().__init__("where is my order")
+        self.delay_s = delay_s
+        self.lengths = []
+
+    def transcribe(self, audio, sample_rate):
+        self.lengths.append(len(audio))
+        time.sleep(self.delay_s)
+        return super().transcribe(audio, sample_rate)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    def install(model):
+        monkeypatch.setattr(asr, "ASR_BACKEND", model)
+        monkeypatch.setattr(Config, "ASR_BACKEND", "stub")
+        asr.init_asr()
+        monkeypatch.setattr(asr, "ASR_BACKEND", model)
+        return model
+    return install
+
+
+def _wav_header(rate=22050, channels=1, bits=16, audio_format=1, extra=b""):
+    block = channels * bits // 8
+    fmt = (audio_format.to_bytes(2, "little") + channels.to_bytes(2, "little") + rate.to_bytes(4, "little")
+           + (rate * block).to_bytes(4, "little") + block.to_bytes(2, "little") + bits.to_bytes(2, "little"))
+    return (b"RIFF" + (36 + len(extra)).to_bytes(4, "little") + b"WAVE" + b"fmt " + (16).to_bytes(4, "little")
+            + fmt + extra + b"data" + b"\x00" * 4)
+
+
+def test_wav_header():
+    assert parse_wav_header(_wav_header()) == (22050, 44)
+    # chunks between fmt and data are skipped
+    assert parse_wav_header(_wav_header(extra=b"LIST" + (4).to_bytes(4, "little") + b"INFO")) == (22050, 56)
+    assert parse_wav_header(b"\x00" * 44) == (None, 0)
+
+
+@pytest.mark.parametrize("kwargs", [{"channels": 2}, {"bits": 8}, {"bits": 24}, {"audio_format": 3, "bits": 32}])
+def test_wav_header_rejects_what_is_not_16_bit_mono_pcm(kwargs):
+    with pytest.raises(ValueError):
+        parse_wav_header(_wav_header(**kwargs))
+
+
+def test_utterance_ends_on_trailing_silence(backend):
+    backend(StubASR("where is my order"))
+    stream = AudioStream(RATE)
+    _feed(stream, _utterance())
+    assert stream.ended
+    assert 1800 <= stream.duration_ms <= 2800
+
+
+def test_partials_do_not_block_the_reader(backend):
+    model = backend(SlowASR(delay_s=0.3))
+    stream = AudioStream(RATE)
+    start = time.monotonic()
+    _feed(stream, _utterance(speech_s=2.0))
+    # several partial intervals came due; feeding never waited on the model
+    assert time.monotonic() - start < 0.3
+    result = stream.finish()
+    assert result["transcript"]
+    assert result["partials"] <= len(model.lengths)
+
+
+def test_partials_stop_past_the_window(backend, monkeypatch):
+    monkeypatch.setattr(Config, "ASR_PARTIAL_WINDOW_S", 1.0)
+    monkeypatch.setattr(Config, "ASR_MAX_SECONDS", 60)
+    model = backend(SlowASR(delay_s=0))
+    stream = AudioStream(RATE)
+    audio = _pcm(0.3, 0.001, 1) + _pcm(4.0, 0.3, 2)
+    for i in range(0, len(audio), 3200):  # 100 ms pieces
+        stream.feed(audio[i:i + 3200])
+        time.sleep(0.005)
+    stream.finish()
+    partial_lengths = model.lengths[:-1]
+    assert partial_lengths
+    assert max(partial_lengths) <= RATE * 1.0 + RATE * Config.ASR_PARTIAL_MS / 1000
+
+
+def test_exact_partial_reuses_prefetch(backend):
+    backend(StubASR("where is my order"))
+    prefetched = []
+    done = threading.Event()
+
+    def prefetch(text):
+        prefetched.append(text)
+        done.set()
+        return {"docs": [text], "nlu": ("track_order", 0.9)}
+
+    stream = AudioStream(RATE, prefetch_fn=prefetch)
+    for chunk in _utterance(speech_s=2.0):
+        stream.feed(chunk)
+        time.sleep(0.05)
+    done.wait(2)
+    result = stream.finish()
+    assert result["transcript"] == "where is my order"
+    assert result["prefetch"] == "exact"
+    assert result["prefetched"]["nlu"] == ("track_order", 0.9)
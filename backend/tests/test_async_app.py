@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+from app.config import Config
+from app.core import async_database
+from app.core.async_database import async_url
+
+
+@pytest.mark.parametrize("url,expected", [
+    ("postgresql://u:p@h/db?sslmode=require&channel_binding=require",
+     "postgresql+asyncpg://u:p@h/db?ssl=require"),
+    ("postgresql+psycopg2://u:p@h:5432/db?connect_timeout=5&application_name=bot&options=x",
+     "postgresql+asyncpg://u:p@h:5432/db?options=x"),
+    ("postgres://u:p@h/db", "postgresql+asyncpg://u:p@h/db"),
+    ("sqlite:////tmp/bench.sqlite3", "sqlite+aiosqlite:////tmp/bench.sqlite3"),
+    ("mysql://u:p@h/db", "mysql://u:p@h/db"),
+])
+def test_async_url(url, expected):
+    assert async_url(url) == expected
+
+
+def test_serves_requests_without_lifespan(tmp_path, monkeypatch):
+    """uvicorn --lifespan off: the first request creates the pool, LLM slots and engine itself."""
+    pytest.importorskip("aiosqlite")
+    from starlette.testclient import TestClient
+    from app.api import async_routes
+    from app.core import auth
+
+    db = tmp_path / "asgi.sqlite3"
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE users (id text PRIMARY KEY, firebase_uid text)")
+    conn.close()
+    monkeypatch.setattr(Config, "ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{db}")
+    monkeypatch.setattr(async_database, "engine", None)
+    monkeypatch.setattr(async_routes, "_cpu_pool", None)
+    monkeypatch.setattr(async_routes, "_llm_slots", None)
+    monkeypatch.setattr(auth, "_token_verifier", lambda token: {"uid": "u1"})
+
+    client = TestClient(async_routes.build_asgi_app())  # no `with`: lifespan never runs
+    try:
+        res = client.get("/history", headers={"Authorization": "Bearer t"})
+        assert res.status_code == 200
+        assert res.json() == {"history": [], "next_cursor": None}
+        assert "auth;dur=" in res.headers["Server-Timing"]
+        assert async_routes._cpu_pool is not None and async_routes._llm_slots is not None
+    finally:
+        if async_routes._cpu_pool is not None:
+            async_routes._cpu_pool.shutdown(wait=False)
@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+
+from app.config import Config
+from app.services import batch
+
+
+def _fake_pipeline(monkeypatch, calls):
+    monkeypatch.setattr(batch, "classify_intents_hf",
+                        lambda texts: [("track_order", 0.9) if "order" in t else ("other", 0.2) for t in texts])
+    monkeypatch.setattr(batch, "order_reply",
+                        lambda intent, score, email: ("track_order", "Shipped.") if intent == "track_order" else None)
+    monkeypatch.setattr(batch, "retrieve_ranked_batch",
+                        lambda texts, top_k, collections=None: [[{"id": n, "source": "faq.md"}] for n in range(len(texts))])
+
+    def rag_reply(text, docs):
+        calls.append(text)
+        return {"reply": f"answer: {text}", "model_text": text, "model_ms": 1, "success": True}
+
+    monkeypatch.setattr(batch, "rag_reply", rag_reply)
+
+
+def test_results_come_back_in_input_order(monkeypatch):
+    calls = []
+    _fake_pipeline(monkeypatch, calls)
+    items = ["where is my order", "what is premium support", "", {"transcript": "how do backups work"}]
+
+    out = list(batch.run_batch(items, persist=False, chunk_size=3))
+
+    assert [r["index"] for r in out] == [0, 1, 2, 3]
+    assert out[0]["reply"] == "Shipped."
+    assert out[1]["reply"] == "answer: what is premium support"
+    assert out[2]["error"] == "empty transcript"
+    assert out[3]["reply"] == "answer: how do backups work"
+    assert sorted(calls) == ["how do backups work", "what is premium support"]
+
+
+def test_every_stage_waits_for_admission(monkeypatch):
+    calls = []
+    _fake_pipeline(monkeypatch, calls)
+    decisions = {"nlu": [False, True], "retrieval": [False, False, True], "llm": [False, True]}
+    asked = []
+
+    @contextmanager
+    def admit(stage, tier="standard"):
+        asked.append(stage)
+        yield decisions[stage].pop(0)
+
+    monkeypatch.setattr(batch, "admit", admit)
+    monkeypatch.setattr(batch.time, "sleep", lambda s: None)
+
+    out = list(batch.run_batch(["what is premium support"], persist=False))
+
+    # turned away work is retried while the back-off budget lasts
+    assert out[0]["reply"] == "answer: what is premium support"
+    assert asked.count("nlu") == 2 and asked.count("retrieval") == 3 and asked.count("llm") == 2
+
+
+def test_llm_pool_is_shared_by_all_batches():
+    assert batch._batch_llm_pool() is batch._batch_llm_pool()
+
+
+def test_work_is_shed_once_the_backoff_budget_is_spent(monkeypatch):
+    calls = []
+    _fake_pipeline(monkeypatch, calls)
+    slept = []
+
+    @contextmanager
+    def admit(stage, tier="standard"):
+        yield stage != "llm"
+
+    monkeypatch.setattr(batch, "admit", admit)
+    monkeypatch.setattr(batch.time, "sleep", slept.append)
+    monkeypatch.setattr(Config, "BATCH_ADMISSION_MAX_WAIT_S", 5.0)
+    monkeypatch.setattr(Config, "ADMISSION_RETRY_AFTER_S", 2.0)
+
+    out = list(batch.run_batch(["what is premium support", "where is my order", "how do backups work"],
+                               persist=False, chunk_size=1))
+
+    assert sum(slept) == 5.0
+    assert out[0]["error"] == "overloaded" and out[0]["stage"] == "llm"
+    assert out[1]["reply"] == "Shipped."
+    assert out[2]["error"] == "overloaded" and out[2]["stage"] == "llm"
+    assert calls == []
+
+
+def test_empty_transcripts_skip_nlu(monkeypatch):
+    calls = []
+    _fake_pipeline(monkeypatch, calls)
+    classified = []
+    monkeypatch.setattr(batch, "classify_intents_hf",
+                        lambda texts: classified.append(list(texts)) or [("other", 0.2)] * len(texts))
+
+    out = list(batch.run_batch(["", "  ", "what is premium support"], persist=False, chunk_size=2))
+
+    assert classified == [["what is premium support"]]
+    assert [r.get("error") for r in out] == ["empty transcript", "empty transcript", None]
@@ -0,0 +1,44 @@
+import pytest
+
+from app.config import Config
+from app.services import rag
+from app.services.rag import parse_collections, resolve_collections
+
+
+@pytest.fixture(autouse=True)
+def shards(monkeypatch):
+    loaded = {"default": "default-shard", "tenant_a": "a-shard", "products": "p-shard"}
+    monkeypatch.setattr(rag, "COLLECTIONS", loaded)
+    monkeypatch.setattr(Config, "QUERY_COLLECTIONS", [])
+    return loaded
+
+
+@pytest.mark.parametrize("value", [None, "", [], " , "])
+def test_no_collections_means_default_routing(value):
+    assert parse_collections(value) == (None, None)
+
+
+@pytest.mark.parametrize("value", ["tenant_a, products", ["products", "tenant_a"], ["tenant_a", "products", "tenant_a"]])
+def test_names_are_trimmed_deduplicated_and_sorted(value):
+    assert parse_collections(value) == (["products", "tenant_a"], None)
+
+
+@pytest.mark.parametrize("value", [42, {"tenant_a": True}, ["tenant_a", 7]])
+def test_malformed_value(value):
+    names, error = parse_collections(value)
+    assert names is None
+    assert error == "collections must be a list of names"
+
+
+def test_unknown_collections_are_named():
+    names, error = parse_collections("tenant_a,nope,zzz")
+    assert names is None
+    assert error == "unknown collections: nope, zzz"
+
+
+def test_resolve_collections(monkeypatch, shards):
+    assert resolve_collections(["tenant_a"]) == ["a-shard"]
+    assert resolve_collections() == list(shards.values())
+    monkeypatch.setattr(Config, "QUERY_COLLECTIONS", ["products", "gone"])
+    # configured routing skips collections that are not loaded
+    assert resolve_collections() == ["p-shard"]
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from ingest.dedup import shingles, minhash_signatures, dedup_chunks, dedup_report
+
+BASE = ("Orders ship within two business days from our warehouse in Austin. "
+        "Tracking numbers are emailed as soon as the carrier scans the parcel, "
+        "and most domestic deliveries arrive within five days of dispatch.")
+OTHERS = [
+    "Refunds are issued to the original payment method within ten days after the returned item is inspected.",
+    "Gift cards never expire and can be combined with any promotional code at checkout on the website.",
+    "Our support team answers live chat from nine to six on weekdays and replies to email within a day.",
+]
+
+
+def _unit_rows(n, dim=16, seed=0):
+    rows = np.random.RandomState(seed).randn(n, dim).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def _near(a, noise=0.01, seed=1):
+    v = a + noise * np.random.RandomState(seed).randn(*a.shape).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_identical_texts_share_a_signature():
+    sigs = minhash_signatures([BASE, BASE.upper(), OTHERS[0]])
+    assert (sigs[0] == sigs[1]).all()
+    assert np.mean(sigs[0] == sigs[2]) < 0.2
+
+
+def test_signatures_estimate_jaccard():
+    words = BASE.split()
+    edited = " ".join(words[:-1] + ["weekdays."])
+    a, b = set(shingles(BASE).tolist()), set(shingles(edited).tolist())
+    exact = len(a & b) / len(a | b)
+    sigs = minhash_signatures([BASE, edited])
+    assert abs(np.mean(sigs[0] == sigs[1]) - exact) < 0.15
+
+
+def test_near_duplicates_collapse_and_distinct_chunks_survive():
+    texts = [OTHERS[0], BASE, OTHERS[1], BASE.replace("Austin", "Austin,"), OTHERS[2], BASE]
+    emb = _unit_rows(len(texts))
+    emb[3] = _near(emb[1], seed=3)
+    emb[5] = _near(emb[1], seed=5)
+
+    keep, clusters = dedup_chunks(texts, emb)
+
+    assert keep == [0, 1, 2, 4]
+    assert clusters[1] == [1, 3, 5]
+    assert all(clusters[i] == [i] for i in (0, 2, 4))
+
+
+def test_same_wording_different_meaning_is_kept():
+    texts = [BASE, BASE]
+    emb = _unit_rows(2)  # unrelated embeddings: the cosine check vetoes the merge
+    keep, clusters = dedup_chunks(texts, emb)
+    assert keep == [0, 1]
+
+
+def test_shingle_less_chunks_are_never_merged():
+    texts = ["", "...", BASE]
+    emb = np.tile(_unit_rows(1), (3, 1))
+    keep, _ = dedup_chunks(texts, emb)
+    assert keep == [0, 1, 2]
+
+
+def test_report_counts():
+    texts = [BASE, OTHERS[0], BASE, OTHERS[1]]
+    emb = _unit_rows(len(texts))
+    emb[2] = _near(emb[0])
+    keep, clusters = dedup_chunks(texts, emb)
+
+    report = dedup_report(texts, emb, keep, clusters, top_k=2, score_threshold=-1.0)
+
+    assert report["chunks_before"] == 4
+    assert report["chunks_after"] == 3
+    assert report["clusters_merged"] == 1
+    assert report["index_mb_after"] <= report["index_mb_before"]
+    assert report["chunk_tokens_after"] < report["chunk_tokens_before"]
+    prompt = report["prompt"]
+    assert prompt["queries"] == 4 and prompt["top_k"] == 2
+    # querying with the duplicated chunk pulls both copies before dedup
+    assert prompt["before"]["redundant_tokens"] > 0
+    assert prompt["after"]["redundant_tokens"] == 0
+
+
+@pytest.mark.parametrize("n", [0, 1])
+def test_tiny_inputs(n):
+    texts = [BASE][:n]
+    emb = _unit_rows(max(n, 1))[:n]
+    keep, clusters = dedup_chunks(texts, emb)
+    assert keep == list(range(n))
+    assert dedup_report(texts, emb, keep, clusters)["chunks_after"] == n
@@ -0,0 +1,70 @@
+import datetime
+import uuid
+
+import pytest
+import sqlalchemy as sa
+
+from app.core.database import decode_history_cursor, encode_history_cursor, history_page, history_query
+
+
+def test_cursor_round_trip():
+    ts = datetime.datetime(2025, 3, 1, 12, 30, 5, 123456, tzinfo=datetime.timezone.utc)
+    qid = uuid.uuid4()
+    cursor = encode_history_cursor(ts, qid)
+    assert "=" not in cursor
+    assert decode_history_cursor(cursor) == (ts.isoformat(), str(qid))
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", encode_history_cursor("", "x"),
+                                    encode_history_cursor("2025-01-01", "")])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_history_cursor(cursor)
+
+
+def test_query_fetches_one_extra_row():
+    _, params = history_query("u1", limit=20)
+    assert params == {"uid": "u1", "lim": 21}
+    _, params = history_query("u1", limit=5, cursor=encode_history_cursor("2025-01-01T00:00:00", "abc"))
+    assert (params["ts"], params["qid"]) == ("2025-01-01T00:00:00", "abc")
+
+
+def _row(n, ts):
+    return (f"id-{n}", "s", f"q{n}", None, None, None, None, None, ts)
+
+
+def test_page_cursor_points_at_last_row():
+    rows = [_row(n, f"2025-01-0{9 - n}T00:00:00") for n in range(4)]
+    page, cursor = history_page(rows, limit=3)
+    assert [r["id"] for r in page] == ["id-0", "id-1", "id-2"]
+    assert decode_history_cursor(cursor) == ("2025-01-07T00:00:00", "id-2")
+
+    page, cursor = history_page(rows[:2], limit=3)
+    assert len(page) == 2 and cursor is None
+
+
+def test_keyset_walk_covers_every_row_once(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'history.sqlite3'}")
+    with engine.begin() as conn:
+        conn.execute(sa.text("""
+            CREATE TABLE voice_queries (id text PRIMARY KEY, user_id text, session_id text, transcript text,
+                intent text, response text, rag_sources text, confidence real, duration_ms integer,
+                created_at text)
+        """))
+        # several rows per timestamp: the id tiebreak must not skip or repeat any
+        conn.execute(sa.text("INSERT INTO voice_queries (id, user_id, transcript, created_at) "
+                             "VALUES (:id, :uid, :t, :ts)"),
+                     [{"id": f"{n:04d}", "uid": "u1" if n % 5 else "u2", "t": f"q{n}",
+                       "ts": f"2025-01-01T00:00:{n // 3:02d}"} for n in range(40)])
+
+    seen, cursor = [], None
+    while True:
+        q, params = history_query("u1", limit=7, cursor=cursor)
+        with engine.connect() as conn:
+            page, cursor = history_page(conn.execute(q, params).fetchall(), limit=7)
+        seen.extend(r["id"] for r in page)
+        if cursor is None:
+            break
+
+    expected = sorted((f"{n:04d}" for n in range(40) if n % 5), reverse=True)
+    assert seen == expected
@@ -0,0 +1,69 @@
+import contextvars
+
+from app.core import metrics
+from app.core.metrics import (RollingHistogram, inc, record_stage, render_prometheus, server_timing_header,
+                              stage_timings, start_request_timings, timed)
+
+
+def test_histogram_quantiles_over_window():
+    h = RollingHistogram(size=100)
+    for ms in range(1, 201):
+        h.observe(float(ms))
+    snap = h.snapshot()
+    # count/sum cover every observation, quantiles only the last `size`
+    assert snap["count"] == 200
+    assert snap["sum"] == sum(range(1, 201))
+    assert snap[0.5] == 151.0
+    assert snap[0.99] == 199.0
+
+
+def test_empty_histogram_reads_zero():
+    snap = RollingHistogram(size=10).snapshot()
+    assert snap["count"] == 0
+    assert all(snap[q] == 0.0 for q in metrics.QUANTILES)
+
+
+def test_server_timing_header():
+    header = server_timing_header({"nlu": 12.345, "llm": 800.0, "total": 815.04})
+    assert header == "nlu;dur=12.3, llm;dur=800.0, total;dur=815.0"
+    assert server_timing_header({}) == ""
+
+
+def _request():
+    assert stage_timings() == {}
+    timings = start_request_timings()
+    record_stage("embed", 2.0)
+    record_stage("embed", 3.0)
+    with timed("faiss_search"):
+        pass
+    assert timings["embed"] == 5.0
+    assert "faiss_search" in timings
+    assert stage_timings() == timings
+
+
+def test_request_timings_outside_flask():
+    # each run in a fresh context, as the ASGI app does per request
+    contextvars.copy_context().run(_request)
+    contextvars.copy_context().run(_request)
+
+
+def test_prometheus_exposition():
+    inc("fallbacks_total", kind="test_only")
+    inc("fallbacks_total", 2, kind="test_only")
+    record_stage("test_stage", 4.0)
+    text = render_prometheus()
+    assert 'voicebot_fallbacks_total{kind="test_only"} 3' in text
+    assert 'voicebot_stage_latency_ms_count{stage="test_stage"}' in text
+    # declared stages and counters are listed before anything is recorded
+    for stage in metrics.STAGES:
+        assert f'voicebot_stage_latency_ms_count{{stage="{stage}"}}' in text
+    for name in metrics.COUNTER_HELP:
+        assert f"# TYPE voicebot_{name} counter" in text
+
+
+def test_gauges_are_read_at_scrape_time():
+    value = {"n": 1}
+    metrics.register_gauge("test_gauge", "Test gauge.", lambda: {(("pool", "a"),): value["n"]})
+    value["n"] = 7
+    assert 'voicebot_test_gauge{pool="a"} 7' in render_prometheus()
+    metrics._GAUGES.pop("test_gauge")
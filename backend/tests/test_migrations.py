@@ -0,0 +1,65 @@
+import sqlalchemy as sa
+
+from app.core import database
+from app.core.migrations import MIGRATIONS, run_migrations
+
+
+def test_versions_are_contiguous_and_ordered():
+    versions = [m.version for m in MIGRATIONS]
+    assert versions == list(range(1, len(MIGRATIONS) + 1))
+    assert len({m.name for m in MIGRATIONS}) == len(MIGRATIONS)
+
+
+def test_each_migration_has_work():
+    for m in MIGRATIONS:
+        if m.index:
+            assert m.definition and not m.statements
+        else:
+            assert m.statements
+
+
+def _engine(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'migrations.sqlite3'}")
+    with engine.begin() as conn:
+        conn.execute(sa.text("CREATE TABLE voice_queries (id text PRIMARY KEY, user_id text, created_at text)"))
+        conn.execute(sa.text("CREATE TABLE orders (id integer PRIMARY KEY, user_email text)"))
+        conn.execute(sa.text("CREATE TABLE chat_sessions (session_uuid text PRIMARY KEY, user_email text)"))
+    return engine
+
+
+def _applied(engine):
+    with engine.connect() as conn:
+        return [r[0] for r in conn.execute(sa.text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+def _indexes(engine):
+    with engine.connect() as conn:
+        return {r[0] for r in conn.execute(sa.text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+
+
+def test_applies_in_order_and_is_idempotent(tmp_path):
+    engine = _engine(tmp_path)
+    latest = MIGRATIONS[-1].version
+
+    assert run_migrations(engine) == latest
+    assert _applied(engine) == [m.version for m in MIGRATIONS]
+    assert {m.index for m in MIGRATIONS if m.index} <= _indexes(engine)
+
+    # every worker runs this at start: a second run is a no-op
+    assert run_migrations(engine) == latest
+    assert _applied(engine) == [m.version for m in MIGRATIONS]
+
+
+def test_target_stops_early_and_resumes(tmp_path):
+    engine = _engine(tmp_path)
+    assert run_migrations(engine, target=1) == 1
+    assert _applied(engine) == [1]
+    assert run_migrations(engine) == MIGRATIONS[-1].version
+    assert _applied(engine) == [m.version for m in MIGRATIONS]
+
+
+def test_direct_url_drops_the_neon_pooler_suffix():
+    pooled = "postgresql://u:p@ep-x-123-pooler.c-2.us-east-2.aws.neon.tech/db?sslmode=require"
+    assert database.direct_url(pooled) == "postgresql://u:p@ep-x-123.c-2.us-east-2.aws.neon.tech/db?sslmode=require"
+    assert database.direct_url("postgresql://u:p@db.internal:5432/app") == "postgresql://u:p@db.internal:5432/app"
+    assert database.direct_url(None) is None
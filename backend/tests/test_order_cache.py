@@ -0,0 +1,108 @@
+import threading
+import types
+
+import pytest
+
+from app.config import Config
+from app.core import database
+from app.services import order_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    order_cache.invalidate()
+    yield
+    order_cache.invalidate()
+
+
+@pytest.fixture
+def db_reads(monkeypatch):
+    calls = []
+
+    def fake(email):
+        calls.append(email)
+        return f"Your order for {email} is shipped."
+
+    monkeypatch.setattr(database, "get_order_status_by_email", fake)
+    return calls
+
+
+def test_read_through_and_invalidate(db_reads):
+    first = order_cache.get_order_status_cached("a@x.io")
+    assert order_cache.get_order_status_cached("a@x.io") == first
+    assert db_reads == ["a@x.io"]
+
+    order_cache.invalidate("a@x.io")
+    order_cache.get_order_status_cached("a@x.io")
+    assert db_reads == ["a@x.io", "a@x.io"]
+
+
+def test_read_racing_an_invalidation_is_not_cached(monkeypatch):
+    def racing(email):
+        # the order changes (NOTIFY arrives) while this read is in flight
+        order_cache.invalidate(email)
+        return "stale"
+
+    monkeypatch.setattr(database, "get_order_status_by_email", racing)
+    order_cache.get_order_status_cached("a@x.io")
+    assert "a@x.io" not in order_cache._cache
+
+
+def test_db_errors_are_not_cached(monkeypatch):
+    monkeypatch.setattr(database, "get_order_status_by_email", lambda email: database.ORDER_DB_ERRORS[0])
+    order_cache.get_order_status_cached("a@x.io")
+    assert "a@x.io" not in order_cache._cache
+
+
+def test_expired_entries_are_reread(db_reads, monkeypatch):
+    monkeypatch.setattr(Config, "ORDER_CACHE_TTL_S", -1)
+    order_cache.get_order_status_cached("a@x.io")
+    order_cache.get_order_status_cached("a@x.io")
+    assert len(db_reads) == 2
+
+
+@pytest.mark.parametrize("url,pooled", [
+    ("postgresql://u:p@ep-cool-1-pooler.c-2.us-east-2.aws.neon.tech/db?sslmode=require", True),
+    ("postgresql://u:p@ep-cool-1.c-2.us-east-2.aws.neon.tech/db?sslmode=require", False),
+    ("postgresql://u:p@pgbouncer.internal:6432/db", True),
+    ("postgresql://u:p@aws-0-eu.pooler.supabase.com:6543/postgres", True),
+    ("postgresql://u:p@db.internal:5432/db", False),
+    ("sqlite:///bench.sqlite3", False),
+    (None, False),
+])
+def test_is_pooled_url(url, pooled):
+    assert database.is_pooled_url(url) is pooled
+
+
+@pytest.mark.parametrize("database_url,listen_url,expected", [
+    # Neon: listens on the direct endpoint derived from the "-pooler" URL
+    ("postgresql://u:p@ep-x-pooler.aws.neon.tech/db", None, "notify"),
+    ("postgresql://u:p@ep-x-pooler.aws.neon.tech/db", "postgresql://u:p@ep-x.aws.neon.tech/db", "notify"),
+    ("postgresql://u:p@db.internal:5432/db", None, "notify"),
+    # no direct endpoint to derive behind pgbouncer
+    ("postgresql://u:p@pgbouncer.internal:6432/db", None, "poll"),
+    ("postgresql://u:p@pgbouncer.internal:6432/db", "postgresql://u:p@db.internal:5432/db", "notify"),
+])
+def test_auto_mode_avoids_listen_through_a_pooler(monkeypatch, database_url, listen_url, expected):
+    started = []
+    monkeypatch.setattr(order_cache, "_started", False)
+    monkeypatch.setattr(order_cache, "PSYCOPG2_AVAILABLE", True)
+    monkeypatch.setattr(order_cache, "_listen_loop", lambda: started.append("notify"))
+    monkeypatch.setattr(order_cache, "_poll_loop", lambda: started.append("poll"))
+    monkeypatch.setattr(database, "engine", types.SimpleNamespace(dialect=types.SimpleNamespace(name="postgresql")))
+    monkeypatch.setattr(Config, "ORDER_CACHE_INVALIDATION", "auto")
+    monkeypatch.setattr(Config, "ORDER_CACHE_WARM", False)
+    monkeypatch.setattr(Config, "DATABASE_URL", database_url)
+    monkeypatch.setattr(Config, "ORDER_CACHE_LISTEN_URL", listen_url)
+
+    order_cache.init_order_cache()
+    for t in threading.enumerate():
+        if t.name.startswith("order-cache-"):
+            t.join(timeout=1)
+    assert started == [expected]
+
+
+def test_listen_dsn_uses_the_direct_neon_endpoint(monkeypatch):
+    monkeypatch.setattr(Config, "ORDER_CACHE_LISTEN_URL", None)
+    monkeypatch.setattr(Config, "DATABASE_URL", "postgresql+psycopg2://u:p@ep-x-pooler.aws.neon.tech/db")
+    assert order_cache._listen_dsn() == "postgresql://u:p@ep-x.aws.neon.tech/db"
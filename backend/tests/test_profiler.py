@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from app.config import Config
+from app.core.profiler import Profiler
+
+
+@pytest.fixture
+def profiler(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "PROFILER_DIR", str(tmp_path))
+    p = Profiler()
+    yield p
+    p.stop()
+
+
+@pytest.mark.parametrize("kwargs,expected_s", [
+    ({}, "PROFILER_DEFAULT_SECONDS"),
+    ({"seconds": 5}, None),
+    ({"seconds": 10 ** 6}, "PROFILER_MAX_SECONDS"),
+    # counting requests on an idle worker must still end
+    ({"requests": 50}, "PROFILER_MAX_SECONDS"),
+])
+def test_every_session_has_a_bounded_deadline(profiler, kwargs, expected_s):
+    status = profiler.start(**kwargs)
+    limit = getattr(Config, expected_s) if expected_s else kwargs["seconds"]
+    assert status["deadline"] is not None
+    assert status["deadline"] - status["started"] == pytest.approx(limit, abs=1)
+
+
+def test_session_past_its_deadline_is_done(profiler):
+    profiler.start(requests=50)
+    profiler.session.deadline = time.time() - 1
+    assert profiler.session.done()
@@ -0,0 +1,96 @@
+import pytest
+
+from app.config import Config
+from app.services import rerank
+
+
+class FakeReranker:
+    """Scores a (query, text) pair by the number in the chunk text."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def predict(self, pairs, batch_size=None):
+        self.calls.append(len(pairs))
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return [float(text.split()[-1]) for _, text in pairs]
+
+
+def _docs(*scores):
+    return [{"id": n, "text": f"chunk {s}", "score": 1.0 - n / 10} for n, s in enumerate(scores)]
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    fake = FakeReranker()
+    monkeypatch.setattr(rerank, "RERANKER", fake)
+    monkeypatch.setattr(rerank, "_ms_per_pair", 0.0)
+    monkeypatch.setattr(rerank, "_inflight", 0)
+    return fake
+
+
+def test_orders_by_cross_encoder_score_and_truncates(reranker):
+    out = rerank.rerank("q", _docs(1, 9, 5, 7), top_n=2)
+    assert [d["id"] for d in out] == [1, 3]
+    assert [d["rerank_score"] for d in out] == [9.0, 7.0]
+    assert reranker.calls == [4]  # one batched pass
+
+
+def test_without_a_model_keeps_bi_encoder_order(monkeypatch):
+    monkeypatch.setattr(rerank, "RERANKER", None)
+    assert [d["id"] for d in rerank.rerank("q", _docs(1, 9, 5), top_n=2)] == [0, 1]
+
+
+def test_model_error_falls_back_to_bi_encoder_order(reranker):
+    reranker.fail = True
+    out = rerank.rerank("q", _docs(1, 9, 5), top_n=2)
+    assert [d["id"] for d in out] == [0, 1]
+    assert "rerank_score" not in out[0]
+    assert rerank._inflight == 0
+
+
+def test_over_budget_skips_then_probes_again(reranker, monkeypatch):
+    monkeypatch.setattr(Config, "RERANK_BUDGET_MS", 100.0)
+    monkeypatch.setattr(rerank, "_ms_per_pair", 10.0)  # 20 pairs -> 200ms estimated
+    docs = _docs(*range(20))
+
+    skips = 0
+    while not reranker.calls:
+        out = rerank.rerank("q", docs, top_n=3)
+        if not reranker.calls:
+            skips += 1
+            assert [d["id"] for d in out] == [0, 1, 2]
+        assert skips < 50
+    # each skip decays the estimate by 10%: 10 * 0.9^7 * 20 < 100
+    assert skips == 7
+    assert [d["id"] for d in out] == [19, 18, 17]
+
+
+def test_concurrent_reranks_count_against_the_budget(reranker, monkeypatch):
+    monkeypatch.setattr(Config, "RERANK_BUDGET_MS", 100.0)
+    monkeypatch.setattr(rerank, "_ms_per_pair", 4.0)  # 10 pairs -> 40ms alone
+    assert not rerank._over_budget(10)
+    monkeypatch.setattr(rerank, "_inflight", 2)  # 3 sharing the CPU -> 120ms
+    assert rerank._over_budget(10)
+
+
+def test_batch_over_fetches_candidates_when_reranking(reranker, monkeypatch):
+    fetched = []
+
+    def retrieve_docs_batch(queries, top_k, collections=None):
+        fetched.append(top_k)
+        return [_docs(*range(top_k)) for _ in queries]
+
+    monkeypatch.setattr(rerank, "retrieve_docs_batch", retrieve_docs_batch)
+    monkeypatch.setattr(Config, "RERANK_CANDIDATES", 12)
+
+    out = rerank.retrieve_ranked_batch(["a", "b"], top_k=3)
+    assert fetched == [12]
+    assert [[d["id"] for d in docs] for docs in out] == [[11, 10, 9], [11, 10, 9]]
+
+    monkeypatch.setattr(rerank, "RERANKER", None)
+    out = rerank.retrieve_ranked_batch(["a"], top_k=3)
+    assert fetched[-1] == 3
+    assert len(out[0]) == 3
@@ -0,0 +1,210 @@
+import json
+import time
+
+import numpy as np
+import pytest
+import sqlalchemy as sa
+
+from app.config import Config
+from app.core import database
+from app.services import session_context
+from app.services.session_context import SessionState, get_session
+
+
+def _turn(q, ts):
+    return {"q": q, "a": f"re: {q}", "intent": "open_question", "ts": ts}
+
+
+def _context(turns, intent="open_question", chunks=()):
+    return json.dumps({"v": 1, "turns": turns, "intent": intent, "chunks": [list(c) for c in chunks]})
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'sessions.sqlite3'}")
+    sa.event.listen(engine, "connect", lambda conn, _: conn.create_function("now", 0, lambda: "now"))
+    with engine.begin() as conn:
+        conn.execute(sa.text("""
+            CREATE TABLE chat_sessions (session_uuid text PRIMARY KEY, user_email text, current_context text,
+                updated_at text, version integer NOT NULL DEFAULT 0)
+        """))
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(session_context, "_sessions", type(session_context._sessions)())
+    # flushes are driven by the test, not the writer thread
+    queued = []
+    monkeypatch.setattr(session_context, "_enqueue_write", queued.append)
+    return engine, queued
+
+
+def _row(engine, sid):
+    with engine.connect() as conn:
+        return conn.execute(sa.text("SELECT user_email, current_context, version FROM chat_sessions "
+                                    "WHERE session_uuid = :sid"), {"sid": sid}).fetchone()
+
+
+def test_merge_keeps_both_sides_in_time_order():
+    state = SessionState("s1", "a@x.io")
+    state.turns.extend([_turn("one", 10), _turn("three", 30)])
+    state.intent, state.chunk_hits = "mine", [(1, 0.9, "default")]
+
+    state.merge_row(_context([_turn("one", 10), _turn("two", 20)], intent="theirs", chunks=[(7, 0.5)]), version=4)
+
+    assert [t["q"] for t in state.turns] == ["one", "two", "three"]
+    # this side has the latest turn, so its intent and chunks stand
+    assert state.intent == "mine" and state.chunk_hits == [(1, 0.9, "default")]
+    assert state.version == 4
+
+    state.merge_row(_context([_turn("four", 40)], intent="theirs", chunks=[(7, 0.5)]), version=5)
+    assert state.intent == "theirs"
+    assert state.chunk_hits == [(7, 0.5, "default")]
+
+
+def test_sessions_without_an_email_are_never_shared(db):
+    a = get_session("anon", None)
+    b = get_session("anon", None)
+    assert a is not b
+    assert not a.persist and not b.persist
+
+
+def test_other_users_session_is_not_reused(db):
+    engine, _ = db
+    owner = get_session("s1", "a@x.io")
+    session_context.record_turn(owner, "hello", "hi", "greet")
+    session_context._flush({"s1": owner})
+
+    intruder = get_session("s1", "b@x.io")
+    assert not intruder.persist
+    assert len(intruder.turns) == 0
+
+
+def test_flush_is_conditional_on_the_version_read(db):
+    engine, queued = db
+    w1 = SessionState("s1", "a@x.io")
+    w2 = SessionState("s1", "a@x.io")  # a second worker that read the session before w1 wrote
+    w1.turns.append(_turn("from w1", 10))
+    w2.turns.append(_turn("from w2", 20))
+
+    session_context._flush({"s1": w1})
+    assert w1.version == 1
+
+    session_context._flush({"s1": w2})
+    # w2 lost the race: it folded w1's turn in and queued a retry instead of overwriting
+    assert _row(engine, "s1")[2] == 1
+    assert queued == [w2]
+    assert [t["q"] for t in w2.turns] == ["from w1", "from w2"]
+
+    session_context._flush({"s1": w2})
+    email, ctx, version = _row(engine, "s1")
+    assert version == 2
+    assert [t["q"] for t in json.loads(ctx)["turns"]] == ["from w1", "from w2"]
+
+
+def test_cached_session_is_refreshed_after_another_worker_writes(db, monkeypatch):
+    engine, _ = db
+    monkeypatch.setattr(Config, "SESSION_REVALIDATE_S", 0.0)
+    mine = get_session("s1", "a@x.io")
+    mine.turns.append(_turn("first", 10))
+    session_context._flush({"s1": mine})
+
+    other = SessionState("s1", "a@x.io")
+    other.merge_row(_row(engine, "s1")[1], 1)
+    other.turns.append(_turn("second", 20))
+    session_context._flush({"s1": other})
+
+    again = get_session("s1", "a@x.io")
+    assert again is mine
+    assert [t["q"] for t in again.turns] == ["first", "second"]
+    assert again.version == 2
+
+
+def test_recent_cache_hit_does_not_query_the_database(db, monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_REVALIDATE_S", 60.0)
+    mine = get_session("s1", "a@x.io")
+    monkeypatch.setattr(session_context, "_db_version", lambda sid: pytest.fail("revalidated inside the TTL"))
+    assert get_session("s1", "a@x.io") is mine
+
+    mine.checked_at -= 61
+    monkeypatch.setattr(session_context, "_db_version", lambda sid: 0)
+    assert get_session("s1", "a@x.io") is mine
+    assert time.monotonic() - mine.checked_at < 5
+
+
+class _FakeRag:
+    """Unit vectors keyed by text; chunk ids stand in for documents."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.encoded = []
+
+    def retrieval_ready(self):
+        return True
+
+    def embed_queries(self, queries):
+        self.encoded.extend(queries)
+        return np.array([self.vectors[q] for q in queries], dtype="float32")
+
+    def docs_by_ids(self, hits):
+        return [{"id": h[0], "text": f"chunk {h[0]}", "collection": h[2]} for h in hits]
+
+
+@pytest.fixture
+def fake_rag(monkeypatch):
+    fake = _FakeRag({
+        "do you ship to canada": [1.0, 0.0],
+        "and to mexico": [0.8, 0.6],
+        "is there a refund policy": [0.0, 1.0],
+    })
+    searched = []
+    monkeypatch.setattr(session_context, "rag", fake)
+    monkeypatch.setattr(session_context, "retrieve_ranked",
+                        lambda q, top_k, q_emb, collections: searched.append(q) or [{"id": 99, "text": "fresh"}])
+    return fake, searched
+
+
+def _previous_turn(state, fake):
+    session_context.record_turn(state, "do you ship to canada", "yes", "open_question",
+                                docs=[{"id": 1, "score": 0.9, "collection": "default"}])
+    state.embedding = fake.embed_queries(["do you ship to canada"])
+
+
+def test_follow_up_on_the_same_topic_reuses_chunks(fake_rag):
+    fake, searched = fake_rag
+    state = SessionState("s1", "a@x.io", persist=False)
+    _previous_turn(state, fake)
+
+    docs = session_context.retrieve_for_turn(state, "and to mexico")
+    assert [d["id"] for d in docs] == [1]
+    assert searched == []
+
+
+def test_cue_word_alone_does_not_reuse_chunks_across_topics(fake_rag):
+    fake, searched = fake_rag
+    state = SessionState("s1", "a@x.io", persist=False)
+    _previous_turn(state, fake)
+
+    docs = session_context.retrieve_for_turn(state, "is there a refund policy")
+    assert [d["id"] for d in docs] == [99]
+    assert searched == ["is there a refund policy"]
+
+
+def test_restored_session_compares_against_the_previous_question(fake_rag):
+    fake, searched = fake_rag
+    state = SessionState("s1", "a@x.io", persist=False)
+    _previous_turn(state, fake)
+    state.embedding = None  # as after a reload from chat_sessions
+
+    docs = session_context.retrieve_for_turn(state, "and to mexico")
+    assert [d["id"] for d in docs] == [1]
+    assert "do you ship to canada" in fake.encoded[1:]
+
+
+def test_prefetched_docs_win_over_previous_chunks(fake_rag):
+    fake, searched = fake_rag
+    state = SessionState("s1", "a@x.io", persist=False)
+    _previous_turn(state, fake)
+
+    prefetched = [{"id": 5, "text": "prefetched"}]
+    docs = session_context.retrieve_for_turn(state, "and to mexico", q_emb=fake.embed_queries(["and to mexico"]),
+                                             docs=prefetched)
+    assert docs is prefetched
+    assert searched == []